@@ -0,0 +1,139 @@
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+
+
+# RFC 6298 gains and variance multiplier
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+MAX_BACKOFF = 64
+
+DEFAULT_MIN_SAMPLES = 3
+DEFAULT_MAX_KEYS = 65536
+
+
+def target_network(address):
+    """Key for per-network RTT tracking: the /24 or /48 an address is in"""
+    ip = ipaddress.ip_address(address)
+    prefix = 24 if ip.version == 4 else 48
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+
+class RTTEstimator:
+    """Smoothed RTT, RTT variance and retransmission timeout for one peer"""
+
+    __slots__ = ('srtt', 'rttvar', 'rto', 'samples', 'timeouts', 'losses',
+                 'answered')
+
+    def __init__(self, initial):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial
+        self.samples = 0
+        self.timeouts = 0
+        # Timeouts since the last answer, and when that answer came
+        self.losses = 0
+        self.answered = time.monotonic()
+
+    def observe(self, rtt, min_timeout, max_timeout):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+        self.rto = min(max_timeout,
+                       max(min_timeout, self.srtt + K * self.rttvar))
+        self.samples += 1
+        self.losses = 0
+        self.answered = time.monotonic()
+
+    def timed_out(self):
+        self.timeouts += 1
+        self.losses += 1
+
+    def as_dict(self):
+        return {
+            'srtt': None if self.srtt is None else round(self.srtt, 4),
+            'rttvar': None if self.rttvar is None else round(self.rttvar, 4),
+            'rto': round(self.rto, 4),
+            'losses': self.losses,
+            'samples': self.samples,
+            'timeouts': self.timeouts,
+        }
+
+
+class AdaptiveTimeouts:
+    """
+    Per-peer timeouts derived from observed round trips, like TCP's RTO.
+
+    Every key (a resolver address, a target network, ...) gets its own
+    estimator; keys with fewer than `min_samples` samples borrow the pooled
+    estimate of all keys, which starts at `initial`.  Each retry of one
+    request doubles its wait (exponential backoff), and a key that has
+    timed out without answering anything for `max_timeout` seconds gets
+    the full `max_timeout`, as it would without adaptation.  Timeouts
+    always stay within [min_timeout, max_timeout], and at most `max_keys`
+    keys are remembered.
+    """
+
+    def __init__(self, initial, min_timeout, max_timeout,
+                 min_samples=DEFAULT_MIN_SAMPLES, max_keys=DEFAULT_MAX_KEYS):
+        self.initial = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_samples = min_samples
+        self.max_keys = max_keys
+        self.pooled = RTTEstimator(initial)
+        self._estimators = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _estimator(self, key):
+        estimator = self._estimators.get(key)
+        if estimator is None:
+            estimator = RTTEstimator(self.pooled.rto)
+            self._estimators[key] = estimator
+            if len(self._estimators) > self.max_keys:
+                self._estimators.popitem(last=False)
+        else:
+            self._estimators.move_to_end(key)
+        return estimator
+
+    def timeout(self, key, attempt=0):
+        """Seconds to wait for `key` on the given (0-based) attempt"""
+        estimator = self._estimators.get(key)
+        rto = self.pooled.rto
+        backoff = 1 << attempt
+        if estimator is not None:
+            if estimator.samples >= self.min_samples:
+                rto = estimator.rto
+            # Timeouts with no answer at all for a while mean the key is
+            # down or congested, not that one name is blackholed
+            if estimator.losses and time.monotonic() - estimator.answered \
+                    > self.max_timeout:
+                return self.max_timeout
+        return min(self.max_timeout,
+                   max(self.min_timeout, rto * min(backoff, MAX_BACKOFF)))
+
+    def observe(self, key, rtt):
+        """Record a round trip of `rtt` seconds to `key`"""
+        with self._lock:
+            self._estimator(key).observe(rtt, self.min_timeout,
+                                         self.max_timeout)
+            self.pooled.observe(rtt, self.min_timeout, self.max_timeout)
+
+    def timed_out(self, key):
+        """Record that `key` did not answer in time"""
+        with self._lock:
+            self._estimator(key).timed_out()
+
+    def state(self):
+        """Learned estimates: {'pooled': {...}, 'keys': {key: {...}}}"""
+        with self._lock:
+            return {
+                'pooled': self.pooled.as_dict(),
+                'keys': {str(key): estimator.as_dict()
+                         for key, estimator in self._estimators.items()},
+            }
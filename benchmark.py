@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from rich.console import Console
+from rich.table import Table
+
+import stub_servers
+from dns_query import UDPQueryPool
+from dns_utils import RECORD_TYPES
+from scanner import ScanEngine, bounded_map, run_coroutine
+from sharding import ShardedScan
+
+
+DEFAULT_SIZES = (100, 10000, 100000)
+PATHS = ('scan', 'records', 'check', 'sharded')
+
+# The single-domain path runs one check at a time, so cap it by default
+SEQUENTIAL_LIMIT = 10000
+
+# Import cost of each entry module, on top of the interpreter's own start.
+# A cron job running `project.py --check` pays this on every invocation.
+STARTUP_BUDGETS_MS = {'project': 20, 'report': 20}
+STARTUP_RUNS = 5
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    rank = max(0, -(-q * len(ordered) // 100) - 1)
+    return round(ordered[rank], 2)
+
+
+class ResourceSampler:
+    """Track peak RSS and open file descriptors from a background thread"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_fds = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._page_size = os.sysconf('SC_PAGE_SIZE') \
+            if hasattr(os, 'sysconf') else 4096
+
+    def sample(self):
+        try:
+            with open('/proc/self/statm') as f:
+                rss = int(f.read().split()[1]) * self._page_size
+            fds = len(os.listdir('/proc/self/fd'))
+        except OSError:
+            # Not Linux: fall back to the lifetime peak from getrusage
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            fds = 0
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_fds = max(self.peak_fds, fds)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+def _domains(run, size):
+    # A fresh name per run keeps the shared DNS cache from answering
+    return (f"d{i}.r{run}.bench.test" for i in range(size))
+
+
+def bench_scan(engine, domains, concurrency):
+    """Bulk path used by check_blocked_websites and --input scans"""
+    async def timed(domain):
+        start = time.perf_counter()
+        result = await engine.check(domain)
+        return result["status"], (time.perf_counter() - start) * 1000
+
+    async def collect():
+        return [r async for r in bounded_map(timed, domains, concurrency)]
+
+    return run_coroutine(collect())
+
+
+def bench_check(engine, domains, concurrency):
+    """One synchronous call per domain, as check_website_status does"""
+    results = []
+    for domain in domains:
+        start = time.perf_counter()
+        result = run_coroutine(engine.check(domain))
+        results.append((result["status"],
+                        (time.perf_counter() - start) * 1000))
+    return results
+
+
+def bench_records(pool, domains, concurrency):
+    """The record lookups get_dns_info fans out for every domain"""
+    async def lookup(domain, record_type):
+        try:
+            await pool.resolve(domain, record_type)
+            return "Answer"
+        except Exception as e:
+            return type(e).__name__
+
+    async def timed(domain):
+        start = time.perf_counter()
+        statuses = await asyncio.gather(
+            *(lookup(domain, record_type) for record_type in RECORD_TYPES))
+        status = "Answer" if "Answer" in statuses else statuses[0]
+        return status, (time.perf_counter() - start) * 1000
+
+    async def collect():
+        return [r async for r in bounded_map(timed, domains, concurrency)]
+
+    return run_coroutine(collect())
+
+
+def bench_sharded(args, domains):
+    """The bulk path spread over --processes workers (RSS/FDs are the parent's)"""
+    results = []
+    scan = ShardedScan(args.processes,
+                       concurrency=max(1, args.concurrency // args.processes),
+                       nameservers=[stub_servers.STUB_ADDRESS],
+                       dns_port=args.dns_port, http_port=args.http_port,
+                       dns_timeout=args.dns_timeout,
+                       http_timeout=args.http_timeout)
+    scan.run(domains, lambda result: results.append(
+        (result["status"], result["timings"]["total_ms"])))
+    return results
+
+
+async def _close_pool(pool):
+    # The pool's transports belong to the scan loop, so close it there
+    pool.close()
+
+
+def run_benchmark(path, size, run, args):
+    """Run one path at one size and return its report row"""
+    engine = ScanEngine(concurrency=args.concurrency,
+                        nameservers=[stub_servers.STUB_ADDRESS],
+                        dns_port=args.dns_port, http_port=args.http_port,
+                        dns_timeout=args.dns_timeout,
+                        http_timeout=args.http_timeout)
+    pool = UDPQueryPool([stub_servers.STUB_ADDRESS], port=args.dns_port,
+                        timeout=args.dns_timeout)
+    runner = {'scan': bench_scan, 'check': bench_check,
+              'records': bench_records}.get(path)
+    target = pool if path == 'records' else engine
+
+    with ResourceSampler() as sampler:
+        start = time.perf_counter()
+        if path == 'sharded':
+            results = bench_sharded(args, _domains(run, size))
+        else:
+            results = runner(target, _domains(run, size), args.concurrency)
+        elapsed = time.perf_counter() - start
+
+    run_coroutine(engine.aclose())
+    run_coroutine(_close_pool(pool))
+
+    latencies = sorted(ms for _, ms in results)
+    return {
+        'path': path,
+        'domains': size,
+        'seconds': round(elapsed, 3),
+        'domains_per_sec': round(size / elapsed, 1) if elapsed else None,
+        'p50_ms': _percentile(latencies, 50),
+        'p99_ms': _percentile(latencies, 99),
+        'peak_rss_mb': round(sampler.peak_rss / 2 ** 20, 1),
+        'peak_fds': sampler.peak_fds,
+        'statuses': dict(Counter(status for status, _ in results)),
+    }
+
+
+def start_stub_process(args):
+    """Run the stubs in their own process so they don't share our CPU time"""
+    command = [sys.executable, stub_servers.__file__,
+               '--dns-port', str(args.dns_port),
+               '--http-port', str(args.http_port)]
+    for name, value in stub_servers.stub_options(args).items():
+        command += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    if not process.stdout.readline():
+        raise RuntimeError("stub servers failed to start")
+    return process
+
+
+def measure_startup(module, runs=STARTUP_RUNS):
+    """
+    Best-of-`runs` cumulative import time of `module` in ms, measured with
+    -X importtime in a fresh interpreter so nothing is cached in-process.
+    """
+    best = None
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stderr
+        for line in reversed(output.splitlines()):
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                ms = int(fields[1]) / 1000
+                best = ms if best is None else min(best, ms)
+                break
+    return round(best, 1)
+
+
+def check_startup(console, budgets=STARTUP_BUDGETS_MS):
+    """Print the import time of each module; False if any is over budget"""
+    table = Table(title="Import Time")
+    table.add_column("Module")
+    table.add_column("ms", justify="right")
+    table.add_column("Budget ms", justify="right")
+    ok = True
+    for module, budget in budgets.items():
+        ms = measure_startup(module)
+        over = ms > budget
+        ok = ok and not over
+        table.add_row(module, f"[red]{ms}[/red]" if over else str(ms),
+                      str(budget))
+    console.print(table)
+    return ok
+
+
+def print_report(rows, console):
+    table = Table(title="Scan Benchmark")
+    for column in ("Path", "Domains", "Secs", "Dom/s", "p50 ms", "p99 ms",
+                   "RSS MB", "FDs", "Statuses"):
+        table.add_column(column, justify="left" if column in (
+            "Path", "Statuses") else "right")
+    for row in rows:
+        table.add_row(row['path'], str(row['domains']), str(row['seconds']),
+                      str(row['domains_per_sec']), str(row['p50_ms']),
+                      str(row['p99_ms']), str(row['peak_rss_mb']),
+                      str(row['peak_fds']),
+                      " ".join(f"{k[:3]}={v}" for k, v in
+                               sorted(row['statuses'].items())))
+    console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the scan paths against local DNS/HTTP stubs')
+    parser.add_argument('--sizes', default=",".join(map(str, DEFAULT_SIZES)),
+                        help='comma separated domain counts')
+    parser.add_argument('--paths', default=",".join(PATHS),
+                        help=f"comma separated subset of {', '.join(PATHS)}")
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='workers for the "sharded" path')
+    parser.add_argument('--dns-timeout', type=float, default=2)
+    parser.add_argument('--http-timeout', type=float, default=3)
+    parser.add_argument('--sequential-limit', type=int,
+                        default=SEQUENTIAL_LIMIT,
+                        help='largest size run through the one-at-a-time '
+                             '"check" path')
+    parser.add_argument('--json', metavar='PATH',
+                        help='also write one JSON line per result here')
+    parser.add_argument('--startup', action='store_true',
+                        help='only check module import times against their '
+                             'budgets; exits non-zero if one is over')
+    stub_servers.add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    console = Console()
+    if args.startup:
+        sys.exit(0 if check_startup(console) else 1)
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    paths = [path for path in args.paths.split(',') if path]
+    for path in paths:
+        if path not in PATHS:
+            parser.error(f"unknown path: {path}")
+
+    stub = start_stub_process(args)
+    rows = []
+    try:
+        run = 0
+        for path in paths:
+            for size in sizes:
+                if path == 'check' and size > args.sequential_limit:
+                    console.print(f"[yellow]Skipping check at {size} domains "
+                                  f"(--sequential-limit {args.sequential_limit})"
+                                  "[/yellow]")
+                    continue
+                run += 1
+                console.print(f"[cyan]{path}: {size} domains...[/cyan]")
+                rows.append(run_benchmark(path, size, run, args))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print_report(rows, console)
+    if args.json:
+        with open(args.json, 'w') as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
-import socket
-import dns.resolver
 from rich.console import Console
-from rich.table import Table
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
+from checkpoint import ScanCheckpoint
+from report import LiveReport, ResultWriter, results_table
+from scanner import get_default_engine, run_coroutine, scan_domains
+
+
+DOMAINS_TO_CHECK = [
+    "facebook.com", "twitter.com", "instagram.com", "tiktok.com",
+    "youtube.com", "netflix.com", "spotify.com",
+    "telegram.org", "whatsapp.com", "discord.com",
+    "twitch.tv", "roblox.com",
+    "pornhub.com", "xvideos.com",
+    "nordvpn.com", "expressvpn.com",
+    "bbc.com", "cnn.com", "wikipedia.org",
+    "mega.nz", "mediafire.com"
+]
 
 
 def check_website_status(domain):
@@ -12,104 +21,62 @@ def check_website_status(domain):
     Check if a website is accessible and return its status and IP addresses.
     Returns only 'Accessible', 'Blocked', or 'Error' as status.
     """
-    resolver = dns.resolver.Resolver()
-    resolver.timeout = 2
-    resolver.lifetime = 2
-
-    try:
-        answers = resolver.resolve(domain, "A")
-        ip_addresses = [str(rdata) for rdata in answers]
-
-        try:
-            response = requests.get(f"http://{domain}", timeout=3)
-            if response.status_code == 200:
-                return {
-                    "domain": domain,
-                    "status": "Accessible",
-                    "details": f"HTTP {response.status_code}, IPs: {', '.join(ip_addresses)}"
-                }
-            else:
-                return {
-                    "domain": domain,
-                    "status": "Blocked",
-                    "details": f"HTTP {response.status_code}, IPs: {', '.join(ip_addresses)}"
-                }
-        except requests.exceptions.RequestException:
-            return {
-                "domain": domain,
-                "status": "Blocked",
-                "details": f"Connection failed, IPs: {', '.join(ip_addresses)}"
-            }
+    return run_coroutine(get_default_engine().check(domain))
 
-    except dns.resolver.NXDOMAIN:
-        return {
-            "domain": domain,
-            "status": "Blocked",
-            "details": "DNS resolution failed - Domain does not exist"
-        }
-    except dns.resolver.NoAnswer:
-        return {
-            "domain": domain,
-            "status": "Blocked",
-            "details": "DNS resolution failed - No A records"
-        }
-    except dns.exception.Timeout:
-        return {
-            "domain": domain,
-            "status": "Blocked",
-            "details": "DNS resolution timeout"
-        }
-    except Exception as e:
-        return {
-            "domain": domain,
-            "status": "Error",
-            "details": str(e)
-        }
 
-
-def check_blocked_websites():
+def check_blocked_websites(checkpoint_path=None, show_table=True,
+                           output_path=None, output_format='jsonl'):
     """
     Check a comprehensive list of websites for blocking status.
     Returns a list of results with each site's domain and status.
+    With `checkpoint_path`, finished domains are journalled there and a
+    restarted sweep only probes the ones still pending or errored.
+    Progress is shown live; the full table is printed at the end only with
+    `show_table`, and `output_path` gets every result as JSON lines or CSV.
     """
-    domains_to_check = [
-        "facebook.com", "twitter.com", "instagram.com", "tiktok.com",
-        "youtube.com", "netflix.com", "spotify.com",
-        "telegram.org", "whatsapp.com", "discord.com",
-        "twitch.tv", "roblox.com",
-        "pornhub.com", "xvideos.com",
-        "nordvpn.com", "expressvpn.com",
-        "bbc.com", "cnn.com", "wikipedia.org",
-        "mega.nz", "mediafire.com"
-    ]
-
-    results = []
     console = Console()
     console.print(
         "\n[yellow]Checking website accessibility status...[/yellow]")
 
-    table = Table(title="Website Accessibility Report")
-    table.add_column("Domain", style="cyan", no_wrap=True)
-    table.add_column("Status", style="green", no_wrap=True)
-    table.add_column("Details", style="white")
+    output = open(output_path, 'w', encoding='utf-8', newline='') \
+        if output_path else None
+    writer = ResultWriter(output, output_format) if output else None
+    live = LiveReport(console, total=len(DOMAINS_TO_CHECK))
+
+    def add_row(result):
+        live.add(result)
+        if writer is not None:
+            writer.write(result)
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_domain = {executor.submit(
-            check_website_status, domain): domain for domain in domains_to_check}
+    try:
+        with live:
+            if checkpoint_path is None:
+                results = scan_domains(DOMAINS_TO_CHECK, callback=add_row)
+            else:
+                with ScanCheckpoint(checkpoint_path) as checkpoint:
+                    wanted = set(DOMAINS_TO_CHECK)
+                    results = {}
+                    for result in checkpoint.results():
+                        if result["status"] != "Error" \
+                                and result["domain"] in wanted:
+                            results[result["domain"]] = result
+                    for result in results.values():
+                        add_row(result)
 
-        for future in as_completed(future_to_domain):
-            result = future.result()
-            status_style = {
-                "Accessible": "green",
-                "Blocked": "red",
-                "Error": "red"
-            }.get(result["status"], "white")
+                    def record(result):
+                        checkpoint.record(result)
+                        add_row(result)
 
-            table.add_row(result["domain"], f"[{status_style}]{
-                          result['status']}[/{status_style}]", result["details"])
-            results.append(result)
+                    results = list(results.values()) + scan_domains(
+                        checkpoint.pending(DOMAINS_TO_CHECK), callback=record)
+    finally:
+        if output is not None:
+            output.close()
 
-    console.print(table)
+    if show_table:
+        console.print(results_table(results))
+    if output_path:
+        console.print(f"[cyan]Results written to {output_path}[/cyan]")
     console.print("\n[cyan]Scan completed[/cyan]")
 
     return results
@@ -0,0 +1,284 @@
+import asyncio
+import ipaddress
+import random
+import time
+
+import dns.asyncquery
+import dns.exception
+import dns.flags
+import dns.message
+import dns.rcode
+import dns.rdatatype
+
+from adaptive import target_network
+from dns_cache import make_resolver
+from metrics import RESOLVER_SECONDS, RESULTS, TIMEOUTS, record_timings
+from scanner import bounded_map, run_coroutine
+
+
+# Resolvers compared by default.  "udp" without an address means the
+# system resolver, which is the one an ISP is able to tamper with.
+DEFAULT_RESOLVERS = [
+    {'name': 'system', 'kind': 'udp'},
+    {'name': 'cloudflare-doh', 'kind': 'doh',
+     'address': 'https://cloudflare-dns.com/dns-query'},
+    {'name': 'google-dot', 'kind': 'dot', 'address': '8.8.8.8',
+     'server_hostname': 'dns.google'},
+    {'name': 'quad9', 'kind': 'udp', 'address': '9.9.9.9'},
+    {'name': 'authoritative', 'kind': 'trace'},
+]
+
+ROOT_SERVERS = [
+    '198.41.0.4', '170.247.170.2', '192.33.4.12', '199.7.91.13',
+    '192.203.230.10', '192.5.5.241', '192.112.36.4', '198.97.190.53',
+]
+
+# Answers from encrypted or authoritative paths are hard for an on-path
+# censor to forge, so they form the reference the others are checked against
+TRUSTED_KINDS = ('doh', 'dot', 'trace')
+
+MAX_TRACE_DEPTH = 8
+
+
+def _addresses(response):
+    return sorted({rdata.address for rrset in response.answer
+                   if rrset.rdtype in (dns.rdatatype.A, dns.rdatatype.AAAA)
+                   for rdata in rrset})
+
+
+def _is_bogon(address):
+    return not ipaddress.ip_address(address).is_global
+
+
+class DifferentialDetector:
+    """
+    Ask several resolvers for the same name at once and compare answers.
+
+    Each resolver spec is a dict with a `name`, a `kind` ("udp", "dot",
+    "doh" or "trace"), an optional `address` and `port`, and an optional
+    `trusted` flag.  DoT specs may also set `server_hostname` and `verify`
+    (False, or a CA bundle for a private resolver).  A domain is flagged
+    when an untrusted resolver returns bogon addresses, addresses outside
+    every trusted answer, NXDOMAIN for a name the trusted resolvers can
+    resolve, or times out while they answer.
+
+    Answers match when they share a /24 (or /48), so CDN answers still
+    agree; with an `enricher` holding ASN data they match by ASN instead.
+    """
+
+    def __init__(self, resolvers=None, timeout=3, concurrency=200,
+                 enricher=None):
+        self.resolvers = [dict(spec) for spec in (resolvers or DEFAULT_RESOLVERS)]
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.enricher = enricher
+        self._doh_client = None
+        for spec in self.resolvers:
+            spec.setdefault('trusted', spec['kind'] in TRUSTED_KINDS)
+            if spec['kind'] == 'udp' and not spec.get('address'):
+                spec['address'] = make_resolver(timeout).nameservers[0]
+
+    async def _query(self, spec, domain, rdtype):
+        query = dns.message.make_query(domain, rdtype)
+        kind = spec['kind']
+        if kind == 'udp':
+            response, _ = await dns.asyncquery.udp_with_fallback(
+                query, spec['address'], timeout=self.timeout,
+                port=spec.get('port', 53))
+        elif kind == 'dot':
+            response = await dns.asyncquery.tls(
+                query, spec['address'], timeout=self.timeout,
+                port=spec.get('port', 853),
+                server_hostname=spec.get('server_hostname'),
+                verify=spec.get('verify', True))
+        elif kind == 'doh':
+            response = await dns.asyncquery.https(
+                query, spec['address'], timeout=self.timeout,
+                client=self._http_client())
+        elif kind == 'trace':
+            response = await self._trace(
+                domain, rdtype, spec.get('address'), spec.get('port', 53))
+        else:
+            raise ValueError(f"Unknown resolver kind: {kind}")
+        return response
+
+    def _http_client(self):
+        """One pooled client for every DoH query, closed by aclose()"""
+        if self._doh_client is None:
+            # dnspython's DoH support needs httpx anyway (httpx2 from
+            # dnspython 2.9 on), and only accepts a client of its own kind
+            try:
+                import httpx2 as httpx
+            except ImportError:
+                import httpx
+            self._doh_client = httpx.AsyncClient()
+        return self._doh_client
+
+    async def _trace(self, domain, rdtype, root=None, port=53, depth=0):
+        """
+        Resolve iteratively from the root, following referrals.  `root`
+        replaces the real root servers, e.g. with a local stub, for the
+        whole trace including CNAME chases and glueless referrals.
+        """
+        if depth > MAX_TRACE_DEPTH:
+            raise dns.exception.DNSException("referral chain too long")
+        servers = [root] if root else random.sample(ROOT_SERVERS, 3)
+
+        for _ in range(MAX_TRACE_DEPTH * 2):
+            query = dns.message.make_query(domain, rdtype)
+            query.flags &= ~dns.flags.RD
+            response = None
+            for server in servers:
+                try:
+                    response, _ = await dns.asyncquery.udp_with_fallback(
+                        query, server, timeout=self.timeout, port=port)
+                    break
+                except (dns.exception.Timeout, OSError):
+                    continue
+            if response is None:
+                raise dns.exception.Timeout()
+
+            if response.answer or response.rcode() != dns.rcode.NOERROR:
+                if response.answer and not _addresses(response):
+                    # Only a CNAME came back; chase the target from the root
+                    for rrset in response.answer:
+                        if rrset.rdtype == dns.rdatatype.CNAME:
+                            target = rrset[0].target.to_text()
+                            return await self._trace(
+                                target, rdtype, root, port, depth + 1)
+                return response
+
+            referral = [rdata.target for rrset in response.authority
+                        if rrset.rdtype == dns.rdatatype.NS for rdata in rrset]
+            if not referral:
+                return response
+            glue = [rdata.address for rrset in response.additional
+                    if rrset.rdtype == dns.rdatatype.A for rdata in rrset]
+            if not glue:
+                ns = await self._trace(referral[0].to_text(), 'A',
+                                       root, port, depth + 1)
+                glue = _addresses(ns)
+                if not glue:
+                    return response
+            servers = glue
+
+        raise dns.exception.DNSException("referral loop")
+
+    async def _ask(self, spec, domain, rdtype):
+        """Query one resolver and summarise its answer"""
+        start = time.perf_counter()
+        outcome = {'resolver': spec['name'], 'trusted': spec['trusted'],
+                   'rcode': None, 'addresses': [], 'error': None}
+        try:
+            response = await asyncio.wait_for(
+                self._query(spec, domain, rdtype),
+                self.timeout * (MAX_TRACE_DEPTH if spec['kind'] == 'trace' else 1))
+            outcome['rcode'] = dns.rcode.to_text(response.rcode())
+            outcome['addresses'] = _addresses(response)
+        except (dns.exception.Timeout, asyncio.TimeoutError):
+            outcome['error'] = 'timeout'
+            TIMEOUTS.labels('dns').inc()
+        except Exception as e:
+            outcome['error'] = str(e) or type(e).__name__
+        elapsed = time.perf_counter() - start
+        outcome['elapsed_ms'] = round(elapsed * 1000, 2)
+        RESOLVER_SECONDS.labels(spec['name']).observe(elapsed)
+        return outcome
+
+    def _match_keys(self, addresses):
+        """What answers are matched on: the ASN when known, else the /24"""
+        asn = self.enricher.asn if self.enricher is not None else None
+        if asn is None:
+            return [target_network(a) for a in addresses]
+        return [record[0] if record else target_network(address)
+                for address, record in zip(addresses,
+                                           asn.lookup_many(addresses))]
+
+    def compare(self, domain, outcomes):
+        """Turn the per-resolver outcomes into a verdict"""
+        trusted = [o for o in outcomes if o['trusted'] and not o['error']]
+        reference = {a for o in trusted for a in o['addresses']
+                     if not _is_bogon(a)}
+        reference_keys = set(self._match_keys(sorted(reference)))
+        findings = []
+
+        for o in outcomes:
+            # Trusted answers are the reference; their bogons are just
+            # left out of it
+            if o['trusted']:
+                continue
+            name = o['resolver']
+            bogons = [a for a in o['addresses'] if _is_bogon(a)]
+            if bogons:
+                findings.append(f"{name}: bogon answer {', '.join(bogons)}")
+            if o['error'] == 'timeout' and trusted:
+                findings.append(f"{name}: timeout while trusted resolvers answered")
+            elif o['rcode'] == 'NXDOMAIN' and reference:
+                findings.append(f"{name}: NXDOMAIN for a resolvable name")
+            elif reference and o['addresses'] and not bogons and not any(
+                    key in reference_keys
+                    for key in self._match_keys(o['addresses'])):
+                findings.append(
+                    f"{name}: answer {', '.join(o['addresses'])} "
+                    "outside trusted answers")
+
+        if findings:
+            status = "Blocked"
+            reason = "dns_tampering"
+            details = "; ".join(findings)
+        elif all(o['error'] for o in outcomes):
+            status = "Error"
+            reason = "error"
+            details = "No resolver answered"
+        elif not any(o['addresses'] for o in outcomes):
+            status = "Blocked"
+            reason = "nxdomain" if any(o['rcode'] == 'NXDOMAIN'
+                                       for o in outcomes) else "no_answer"
+            details = "DNS resolution failed on every resolver"
+        else:
+            status = "Accessible"
+            reason = "ok"
+            details = f"Consistent across {len(outcomes)} resolvers, IPs: " \
+                      f"{', '.join(sorted(reference)) or 'none'}"
+
+        return {"domain": domain, "status": status, "details": details,
+                "reason": reason, "ips": sorted(reference),
+                "findings": findings, "resolvers": outcomes}
+
+    async def check(self, domain, rdtype='A'):
+        """Fan the query out to every resolver in one round trip and compare"""
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(self._ask(spec, domain, rdtype) for spec in self.resolvers))
+        result = self.compare(domain, list(outcomes))
+        result["timings"] = {
+            'dns_ms': max(o['elapsed_ms'] for o in outcomes),
+            'total_ms': round((time.perf_counter() - start) * 1000, 2),
+        }
+        record_timings(result["timings"])
+        RESULTS.labels(result["status"]).inc()
+        return result
+
+    async def scan(self, domains):
+        """Yield a verdict per domain as it completes"""
+        async for result in bounded_map(self.check, domains, self.concurrency):
+            yield result
+
+    async def aclose(self):
+        """Close the pooled DoH connections"""
+        if self._doh_client is not None:
+            client, self._doh_client = self._doh_client, None
+            await client.aclose()
+
+
+def detect_censorship(domain, resolvers=None):
+    """Synchronous helper that runs one differential check"""
+    detector = DifferentialDetector(resolvers)
+
+    async def check():
+        try:
+            return await detector.check(domain)
+        finally:
+            await detector.aclose()
+
+    return run_coroutine(check())
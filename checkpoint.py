@@ -0,0 +1,133 @@
+import os
+import time
+
+
+STATUS_CODES = {'Accessible': 'A', 'Blocked': 'B', 'Error': 'E'}
+CODE_STATUSES = {code: status for status, code in STATUS_CODES.items()}
+
+
+class ScanCheckpoint:
+    """
+    Append-only journal of finished domains for resumable scans.
+
+    Every result is one tab-separated line in `path`: a one-letter status
+    code, the domain and the details string.  Alongside it, `path`.idx
+    lists one finished domain per line, which is all a restarted run needs
+    to read to build its set of finished domains.  Errored domains are
+    journalled but left out of the index so they are probed again, and a
+    partial last line left behind by a crash is ignored, and cut off when
+    the next run starts writing.
+    """
+
+    def __init__(self, path, fsync_interval=5.0):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.fsync_interval = fsync_interval
+        self.done = set()
+        self._file = None
+        self._index = None
+        self._last_sync = time.monotonic()
+        self.load()
+
+    def load(self):
+        """Read the index and return the set of finished domains"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.done = set()
+            return self.done
+
+        text = data[:data.rfind(b'\n') + 1].decode('utf-8', 'replace')
+        self.done = set(text.split('\n'))
+        self.done.discard('')
+        return self.done
+
+    def __contains__(self, domain):
+        return domain in self.done
+
+    def pending(self, domains):
+        """Yield only the domains that still need probing"""
+        done = self.done
+        for domain in domains:
+            if domain not in done:
+                yield domain
+
+    def results(self):
+        """Yield every journalled result as a result dict, oldest first"""
+        try:
+            f = open(self.path, encoding='utf-8', errors='replace')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                parts = line.rstrip('\n').split('\t', 2)
+                if len(parts) < 3:
+                    continue
+                yield {
+                    "domain": parts[1],
+                    "status": CODE_STATUSES.get(parts[0], "Error"),
+                    "details": parts[2]
+                }
+
+    def _open(self, path):
+        f = open(path, 'a+b')
+        # Cut a torn last line back to the previous newline, so the next
+        # record does not start by completing someone else's
+        end = f.tell()
+        pos = end
+        while pos > 0:
+            start = max(0, pos - 4096)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b'\n')
+            if newline >= 0:
+                pos = start + newline + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+        f.seek(0, os.SEEK_END)
+        return f
+
+    def record(self, result):
+        """Append one finished result to the journal"""
+        if self._file is None:
+            self._file = self._open(self.path)
+            self._index = self._open(self.index_path)
+        code = STATUS_CODES.get(result["status"], 'E')
+        domain = result["domain"]
+        details = " ".join(str(result["details"]).split())
+        self._file.write(f"{code}\t{domain}\t{details}\n".encode('utf-8'))
+        self._file.flush()
+
+        # The index is written second, so a crash in between only means
+        # the domain is probed again on restart
+        if code != 'E':
+            self._index.write(f"{domain}\n".encode('utf-8'))
+            self._index.flush()
+            self.done.add(domain)
+
+        now = time.monotonic()
+        if now - self._last_sync >= self.fsync_interval:
+            self._sync()
+            self._last_sync = now
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        os.fsync(self._index.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._index.close()
+            self._file = None
+            self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,40 @@
+import ast
+import itertools
+import json
+import os
+import re
+from collections import defaultdict
+
+import pytest
+
+
+NOTEBOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'DAV_project.ipynb')
+NOTEBOOK_FUNCTIONS = ('generate_triplet_columns', 'process_sequence',
+                      'parse_text_file')
+
+
+@pytest.fixture(scope='session')
+def notebook():
+    """
+    The notebook's own parsing and counting functions, as the reference
+    the numpy pipeline is checked against.  Only the pure-Python
+    functions are taken, so pandas does not have to be installed.
+    """
+    with open(NOTEBOOK, encoding='utf-8') as f:
+        cells = json.load(f)['cells']
+    namespace = {'itertools': itertools, 'defaultdict': defaultdict,
+                 're': re}
+    for cell in cells:
+        if cell['cell_type'] != 'code':
+            continue
+        source = ''.join(cell['source'])
+        if 'def process_sequence' not in source:
+            continue
+        tree = ast.parse(source)
+        tree.body = [node for node in tree.body
+                     if isinstance(node, ast.FunctionDef)
+                     and node.name in NOTEBOOK_FUNCTIONS]
+        exec(compile(tree, NOTEBOOK, 'exec'), namespace)
+        break
+    return namespace
@@ -0,0 +1,7 @@
+# Defaults shared by the command line and the modules behind it.  This
+# module imports nothing, so project.py can show them in --help without
+# loading asyncio or dnspython.
+
+DEFAULT_CONCURRENCY = 1000
+DEFAULT_INTERVAL = 300
+SHARD_MODES = ('chunk', 'hash')
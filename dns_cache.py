@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import OrderedDict
+
+import dns.rcode
+import dns.resolver
+
+from metrics import (DNS_CACHE_BYTES, DNS_CACHE_ENTRIES, DNS_CACHE_EVICTIONS,
+                     DNS_CACHE_LOOKUPS, metrics)
+
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_HITS = DNS_CACHE_LOOKUPS.labels('hit')
+_MISSES = DNS_CACHE_LOOKUPS.labels('miss')
+
+
+def answer_rcode(answer):
+    """
+    Return the rcode of a cached answer.  Answers parsed straight from the
+    wire carry it as an attribute so their full message is never built.
+    """
+    rcode = getattr(answer, 'rcode', None)
+    if rcode is None:
+        rcode = answer.response.rcode()
+    return rcode
+
+
+def _estimate_size(answer):
+    """Rough in-memory footprint of a cached answer, in bytes"""
+    wire = getattr(answer, 'wire', None)
+    if wire is not None:
+        return 256 + 2 * len(wire)
+    records = 0
+    for section in answer.response.sections:
+        for rrset in section:
+            records += len(rrset)
+    return 256 + 96 * records
+
+
+def _is_negative(answer):
+    return (answer.rrset is None
+            or answer_rcode(answer) == dns.rcode.NXDOMAIN)
+
+
+class DNSCache(dns.resolver.CacheBase):
+    """
+    Process-wide DNS answer cache shared by every resolver in the tool.
+
+    Entries expire with the TTL dnspython computes for each answer, which
+    for NXDOMAIN and NoAnswer responses is the SOA minimum, so negative
+    answers are cached as well.  The least recently used entries are
+    evicted once the estimated size goes over `max_bytes`.  Hits, misses
+    and evictions are counted in the metrics registry, and the shared
+    instance's occupancy is exported there too.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.data = OrderedDict()
+        self.size = 0
+        self.negative = 0
+        self.evictions = 0
+
+    def _remove(self, key):
+        _, size, negative = self.data.pop(key)
+        self.size -= size
+        self.negative -= negative
+
+    def get(self, key):
+        """Return the cached answer for `key`, or None if absent or expired"""
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.statistics.misses += 1
+                _MISSES.inc()
+                return None
+            answer = entry[0]
+            if answer.expiration <= time.time():
+                self._remove(key)
+                self.statistics.misses += 1
+                _MISSES.inc()
+                return None
+            self.data.move_to_end(key)
+            self.statistics.hits += 1
+            _HITS.inc()
+            return answer
+
+    def put(self, key, value):
+        """Cache `value` under `key`, evicting old entries if needed"""
+        size = _estimate_size(value)
+        negative = _is_negative(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.data:
+                self._remove(key)
+            self.data[key] = (value, size, negative)
+            self.size += size
+            self.negative += negative
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.data))
+                self._remove(oldest)
+                self.evictions += 1
+                DNS_CACHE_EVICTIONS.inc()
+
+    def flush(self, key=None):
+        """Flush one entry, or the whole cache if `key` is None"""
+        with self.lock:
+            if key is not None:
+                if key in self.data:
+                    self._remove(key)
+            else:
+                self.data.clear()
+                self.size = 0
+                self.negative = 0
+
+    def stats(self):
+        """Return hit/miss counters and current occupancy"""
+        with self.lock:
+            hits = self.statistics.hits
+            misses = self.statistics.misses
+            return {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                'entries': len(self.data),
+                'negative_entries': self.negative,
+                'bytes': self.size,
+                'evictions': self.evictions,
+            }
+
+    def _collect_metrics(self):
+        with self.lock:
+            entries, negative, size = len(self.data), self.negative, self.size
+        DNS_CACHE_ENTRIES.labels('positive').set(entries - negative)
+        DNS_CACHE_ENTRIES.labels('negative').set(negative)
+        DNS_CACHE_BYTES.set(size)
+
+
+# Create a global instance
+dns_cache = DNSCache()
+metrics.add_collector(dns_cache._collect_metrics)
+
+_system_config = None
+_config_lock = threading.Lock()
+
+
+def _configure(resolver, timeout, nameservers):
+    """Apply the system or explicit nameserver list and shared cache"""
+    global _system_config
+    if nameservers is None:
+        with _config_lock:
+            if _system_config is None:
+                _system_config = dns.resolver.Resolver()
+        resolver.nameservers = list(_system_config.nameservers)
+        resolver.search = list(_system_config.search)
+        resolver.domain = _system_config.domain
+    else:
+        resolver.nameservers = list(nameservers)
+    resolver.timeout = timeout
+    resolver.lifetime = timeout
+    resolver.cache = dns_cache
+    return resolver
+
+
+def make_resolver(timeout, nameservers=None):
+    """Return a resolver wired to the shared cache without re-reading resolv.conf"""
+    return _configure(dns.resolver.Resolver(configure=False), timeout,
+                      nameservers)
@@ -0,0 +1,470 @@
+import asyncio
+import secrets
+import socket
+import struct
+import threading
+import time
+
+import dns.asyncquery
+import dns.exception
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+
+from adaptive import AdaptiveTimeouts
+from dns_cache import answer_rcode, dns_cache, make_resolver
+
+
+DEFAULT_SOCKETS = 4
+DEFAULT_RETRIES = 2
+# Each socket is swapped for one on a fresh source port after this many
+# queries, so the port stays as hard to guess as the message ID
+DEFAULT_ROTATE_AFTER = 1000
+EDNS_PAYLOAD = 1232
+MIN_ATTEMPT_TIMEOUT = 0.1
+
+# Recursion desired; the single additional record is an EDNS0 OPT
+# advertising EDNS_PAYLOAD so fewer answers come back truncated
+QUERY_FLAGS = 0x0100
+EDNS_OPT = b'\x00' + struct.pack('>HHIH', 41, EDNS_PAYLOAD, 0, 0)
+
+
+ADDRESS_FAMILIES = {
+    dns.rdatatype.A: socket.AF_INET,
+    dns.rdatatype.AAAA: socket.AF_INET6,
+}
+
+
+def _make_name(name):
+    if isinstance(name, dns.name.Name):
+        return name
+    return dns.name.from_text(name)
+
+
+def _question(qname, rdtype):
+    # Building the wire format by hand is several times cheaper than
+    # dns.message.make_query() + to_wire(), and only the ID varies per send
+    return qname.to_wire() + struct.pack('>HH', rdtype, dns.rdataclass.IN)
+
+
+def _skip_name(data, offset):
+    while True:
+        length = data[offset]
+        if length >= 0xC0:
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+
+def _parse_addresses(data, question_length, rdtype):
+    """
+    Pull (rcode, addresses, ttl) out of an A/AAAA response without building
+    a dnspython message.  For negative answers the TTL is the SOA minimum,
+    as dnspython computes it.  Returns None if the response looks unusual,
+    in which case the caller falls back to dnspython.
+    """
+    family = ADDRESS_FAMILIES[rdtype]
+    rcode = data[3] & 0x0F
+    ancount, nscount = struct.unpack_from('>HH', data, 6)
+    offset = 12 + question_length
+    addresses = []
+    ttl = None
+    try:
+        for _ in range(ancount):
+            offset = _skip_name(data, offset)
+            rr_type, _, rr_ttl, rdlength = struct.unpack_from(
+                '>HHIH', data, offset)
+            offset += 10
+            if rr_type == rdtype:
+                addresses.append(socket.inet_ntop(
+                    family, data[offset:offset + rdlength]))
+            if rr_type in (rdtype, dns.rdatatype.CNAME):
+                ttl = rr_ttl if ttl is None else min(ttl, rr_ttl)
+            offset += rdlength
+        if addresses:
+            return rcode, addresses, ttl
+
+        for _ in range(nscount):
+            offset = _skip_name(data, offset)
+            rr_type, _, rr_ttl, rdlength = struct.unpack_from(
+                '>HHIH', data, offset)
+            offset += 10
+            if rr_type == dns.rdatatype.SOA:
+                minimum, = struct.unpack_from(
+                    '>I', data, offset + rdlength - 4)
+                # A CNAME on the way there can expire first
+                return rcode, [], min(rr_ttl, minimum,
+                                      rr_ttl if ttl is None else ttl)
+            offset += rdlength
+        return rcode, [], 0
+    except (IndexError, ValueError, OSError, struct.error):
+        return None
+
+
+class AddressAnswer:
+    """
+    A/AAAA answer parsed straight from the wire.  It iterates over address
+    strings the way a dns.resolver.Answer iterates over rdata, and only
+    builds the full dnspython message if `response` is read.
+    """
+
+    def __init__(self, qname, rdtype, rcode, addresses, ttl, wire,
+                 nameserver=None, port=None):
+        self.qname = qname
+        self.rdtype = rdtype
+        self.rdclass = dns.rdataclass.IN
+        self.rcode = rcode
+        self.addresses = addresses
+        self.rrset = addresses or None
+        self.wire = wire
+        self.nameserver = nameserver
+        self.port = port
+        self.expiration = time.time() + ttl
+        self._response = None
+
+    @property
+    def response(self):
+        if self._response is None:
+            self._response = dns.message.from_wire(self.wire)
+        return self._response
+
+    def __iter__(self):
+        return iter(self.addresses)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __getitem__(self, i):
+        return self.addresses[i]
+
+
+class _DNSProtocol(asyncio.DatagramProtocol):
+    """One UDP socket; responses are routed to waiters by message ID"""
+
+    def __init__(self):
+        self.transport = None
+        self.pending = {}
+        self.sent = 0
+        self.replacing = False
+        self.retired = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 12:
+            return
+        entry = self.pending.get(int.from_bytes(data[:2], 'big'))
+        if entry is None:
+            return
+        future, server = entry
+        if addr[0] == server and not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        # ICMP errors carry no message ID; the waiter's timer handles them
+        pass
+
+    def release(self, msg_id):
+        """Stop waiting for `msg_id`; a retired socket closes when idle"""
+        self.pending.pop(msg_id, None)
+        if self.retired and not self.pending:
+            self.transport.close()
+
+    def retire(self):
+        """Take no new queries, and close once the pending ones are done"""
+        self.retired = True
+        if not self.pending:
+            self.transport.close()
+
+
+class UDPQueryPool:
+    """
+    Low-level DNS client that multiplexes many outstanding queries over a
+    small fixed set of UDP sockets, matching responses by message ID.
+
+    Lost queries are retransmitted to the next nameserver, truncated
+    answers are retried over TCP, and results go through the shared
+    dns_cache.  A and AAAA responses are parsed directly from the wire;
+    everything else goes through dnspython.  resolve() raises the same
+    NXDOMAIN, NoAnswer and Timeout exceptions as dns.resolver, so it is a
+    drop-in for Resolver.resolve.
+
+    With `adaptive` (the default), each retransmission waits for the
+    nameserver's learned RTO, doubled per retry, instead of a fixed share
+    of the timeout, and earlier attempts stay live, so a slow answer still
+    counts.  `timeout` remains the overall limit.  The learned state is in
+    `self.timeouts`.
+
+    Message IDs come from the system CSPRNG, and every socket is replaced
+    by one on a new source port after `rotate_after` queries (0 keeps the
+    sockets for good).
+    """
+
+    def __init__(self, nameservers=None, port=53, sockets=DEFAULT_SOCKETS,
+                 timeout=2, retries=DEFAULT_RETRIES, cache=dns_cache,
+                 adaptive=True, rotate_after=DEFAULT_ROTATE_AFTER):
+        self.nameservers = list(nameservers or make_resolver(timeout).nameservers)
+        self.port = port
+        self.sockets = sockets
+        self.timeout = timeout
+        self.retries = retries
+        self.cache = cache
+        self.rotate_after = rotate_after
+        self.timeouts = AdaptiveTimeouts(
+            initial=timeout / (retries + 1),
+            min_timeout=min(MIN_ATTEMPT_TIMEOUT, timeout),
+            max_timeout=timeout) if adaptive else None
+        self._protocols = {}
+        self._next_protocol = {}
+        self._retired = set()
+        self._start_lock = None
+
+    async def _start(self):
+        """Open the sockets on the running loop the first time they are needed"""
+        if self._protocols:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._protocols:
+                return
+            loop = asyncio.get_running_loop()
+            families = {socket.AF_INET6 if ':' in ns else socket.AF_INET
+                        for ns in self.nameservers}
+            protocols = {}
+            for family in families:
+                protocols[family] = []
+                for _ in range(self.sockets):
+                    _, protocol = await loop.create_datagram_endpoint(
+                        _DNSProtocol, family=family)
+                    protocols[family].append(protocol)
+                self._next_protocol[family] = 0
+            self._protocols = protocols
+
+    async def _protocol(self, family):
+        """The next socket in turn, replaced first if it is due to rotate"""
+        protocols = self._protocols[family]
+        index = self._next_protocol[family]
+        self._next_protocol[family] = (index + 1) % len(protocols)
+        protocol = protocols[index]
+        if not self.rotate_after or protocol.sent < self.rotate_after \
+                or protocol.replacing:
+            return protocol
+
+        protocol.replacing = True
+        try:
+            _, fresh = await asyncio.get_running_loop() \
+                .create_datagram_endpoint(_DNSProtocol, family=family)
+        finally:
+            protocol.replacing = False
+        if self._protocols.get(family) is not protocols:
+            # The pool was closed meanwhile
+            fresh.transport.close()
+            return protocol
+        protocols[index] = fresh
+        protocol.retire()
+        self._retired = {retired for retired in self._retired
+                         if not retired.transport.is_closing()}
+        if not protocol.transport.is_closing():
+            self._retired.add(protocol)
+        return fresh
+
+    def _attempt_timeout(self, server, timeout, attempt):
+        if self.timeouts is None:
+            return timeout / (self.retries + 1)
+        return self.timeouts.timeout(server, attempt)
+
+    def _send(self, loop, protocol, server, question, inflight):
+        msg_id = secrets.randbits(16)
+        while msg_id in protocol.pending:
+            msg_id = secrets.randbits(16)
+        future = loop.create_future()
+        protocol.pending[msg_id] = (future, server)
+        protocol.sent += 1
+        inflight[future] = (protocol, msg_id, server, loop.time())
+        protocol.transport.sendto(
+            struct.pack('>HHHHHH', msg_id, QUERY_FLAGS, 1, 0, 0, 1)
+            + question + EDNS_OPT, (server, self.port))
+
+    async def _exchange(self, qname, rdtype, question, timeout):
+        """
+        Send one query, retransmitting to the next nameserver on loss while
+        earlier attempts stay live (a hedged request).  After the last
+        retransmission every attempt is waited for until the deadline.
+        Every attempt has its own message ID, so each answer yields an
+        unambiguous RTT sample.  Returns (wire, nameserver), or a parsed
+        message in place of the wire when the answer had to be fetched
+        over TCP.
+        """
+        await self._start()
+        loop = asyncio.get_running_loop()
+        timeout = timeout or self.timeout
+        deadline = loop.time() + timeout
+        question_key = question.lower()
+        errors = []
+        inflight = {}
+        attempts = 0
+        server = None
+
+        try:
+            while True:
+                if attempts <= self.retries:
+                    server = self.nameservers[attempts % len(self.nameservers)]
+                    protocol = await self._protocol(
+                        socket.AF_INET6 if ':' in server else socket.AF_INET)
+                    self._send(loop, protocol, server, question, inflight)
+                    attempts += 1
+                    wait = min(self._attempt_timeout(server, timeout,
+                                                     attempts - 1),
+                               deadline - loop.time())
+                    expired = server
+                elif inflight:
+                    # Nothing left to send: earlier attempts may still be
+                    # answered, so wait for them until the deadline
+                    wait = deadline - loop.time()
+                    expired = None
+                else:
+                    break
+                if wait <= 0:
+                    break
+
+                done, _ = await asyncio.wait(
+                    inflight, timeout=wait,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if self.timeouts is not None and expired is not None:
+                        self.timeouts.timed_out(expired)
+                    continue
+
+                for future in done:
+                    protocol, msg_id, answered_by, sent = inflight.pop(future)
+                    protocol.release(msg_id)
+                    data = future.result()
+                    if not data[2] & 0x80 \
+                            or data[12:12 + len(question)].lower() != question_key:
+                        continue
+                    if self.timeouts is not None:
+                        self.timeouts.observe(answered_by, loop.time() - sent)
+
+                    if data[2] & 0x02:
+                        # Truncated: repeat the query over TCP
+                        request = dns.message.make_query(
+                            qname, rdtype, use_edns=0, payload=EDNS_PAYLOAD)
+                        try:
+                            data = await dns.asyncquery.tcp(
+                                request, answered_by,
+                                timeout=max(deadline - loop.time(), 0.1),
+                                port=self.port)
+                        except (dns.exception.DNSException, OSError) as e:
+                            errors.append((answered_by, True, self.port, e,
+                                           None))
+                            continue
+                        rcode = data.rcode()
+                    else:
+                        rcode = data[3] & 0x0F
+
+                    if rcode in (dns.rcode.NOERROR, dns.rcode.NXDOMAIN):
+                        return data, answered_by
+                    errors.append((answered_by, False, self.port,
+                                   dns.rcode.to_text(rcode), None))
+        finally:
+            for future, (protocol, msg_id, _, _) in inflight.items():
+                protocol.release(msg_id)
+                future.cancel()
+
+        if errors:
+            request = dns.message.make_query(qname, rdtype)
+            raise dns.resolver.NoNameservers(request=request, errors=errors)
+        raise dns.exception.Timeout(timeout=timeout)
+
+    async def query(self, qname, rdtype, timeout=None):
+        """Send one query and return (response, nameserver)"""
+        qname = _make_name(qname)
+        rdtype = dns.rdatatype.RdataType.make(rdtype)
+        data, server = await self._exchange(
+            qname, rdtype, _question(qname, rdtype), timeout)
+        if isinstance(data, bytes):
+            data = dns.message.from_wire(data)
+        return data, server
+
+    async def resolve(self, name, rdtype='A', timeout=None):
+        """Resolve `name`, answering from the shared cache when possible"""
+        qname = _make_name(name)
+        rdtype = dns.rdatatype.RdataType.make(rdtype)
+        rdclass = dns.rdataclass.IN
+
+        if self.cache is not None:
+            answer = self.cache.get((qname, rdtype, rdclass))
+            if answer is not None:
+                if answer.rrset is None:
+                    raise dns.resolver.NoAnswer(response=answer.response)
+                return answer
+            answer = self.cache.get((qname, dns.rdatatype.ANY, rdclass))
+            if answer is not None \
+                    and answer_rcode(answer) == dns.rcode.NXDOMAIN:
+                raise dns.resolver.NXDOMAIN(qnames=[qname])
+
+        question = _question(qname, rdtype)
+        data, server = await self._exchange(qname, rdtype, question, timeout)
+
+        answer = None
+        if isinstance(data, bytes) and rdtype in ADDRESS_FAMILIES:
+            parsed = _parse_addresses(data, len(question), rdtype)
+            if parsed is not None:
+                rcode, addresses, ttl = parsed
+                answer = AddressAnswer(
+                    qname, rdtype if rcode == dns.rcode.NOERROR
+                    else dns.rdatatype.ANY, rcode, addresses, ttl, data,
+                    server, self.port)
+        if answer is None:
+            response = data if not isinstance(data, bytes) \
+                else dns.message.from_wire(data)
+            if response.rcode() == dns.rcode.NXDOMAIN:
+                answer = dns.resolver.Answer(qname, dns.rdatatype.ANY,
+                                             rdclass, response)
+            else:
+                answer = dns.resolver.Answer(qname, rdtype, rdclass,
+                                             response, server, self.port)
+
+        if answer_rcode(answer) == dns.rcode.NXDOMAIN:
+            if self.cache is not None:
+                self.cache.put((qname, dns.rdatatype.ANY, rdclass), answer)
+            raise dns.resolver.NXDOMAIN(qnames=[qname])
+
+        if self.cache is not None:
+            self.cache.put((qname, rdtype, rdclass), answer)
+        if answer.rrset is None:
+            raise dns.resolver.NoAnswer(response=answer.response)
+        return answer
+
+    def close(self):
+        """Close every socket in the pool"""
+        for protocols in self._protocols.values():
+            for protocol in protocols:
+                protocol.transport.close()
+        for protocol in self._retired:
+            protocol.transport.close()
+        self._protocols = {}
+        self._next_protocol = {}
+        self._retired = set()
+
+
+_default_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """
+    Return the process-wide pool for the system nameservers.  It must only
+    be used from the shared scan loop (see scanner.run_coroutine).
+    """
+    global _default_pool
+    with _pool_lock:
+        if _default_pool is None:
+            _default_pool = UDPQueryPool()
+    return _default_pool
@@ -1,109 +1,239 @@
+import asyncio
 import socket
-import webbrowser
+import threading
+import time
 import dns.resolver
-import whois
-from datetime import datetime
-import subprocess
-import platform
-from rich.console import Console
-from rich.table import Table
-import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeout
+from dns_query import get_default_pool
+from domains import normalize_domain
+from latency import DEFAULT_TIMEOUT, LatencyProber, measure_latency
+from metrics import TIMEOUTS, record_timings
+from scanner import run_coroutine, submit_coroutine
+from whois_cache import get_whois_cache
+
+
+RECORD_TYPES = ('A', 'MX', 'NS', 'TXT', 'CNAME')
+DEFAULT_DEADLINE = 10
+
+# WHOIS is the one blocking call left; everything else runs on the scan
+# loop, so a stuck WHOIS server cannot hold up other lookups' DNS or ping
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="dns-info")
+
+
+def _format_ping(latency):
+    return 'N/A' if latency['avg'] is None else f"{latency['avg']:.2f}"
+
+
+def _stage_timings(finished, start):
+    """
+    Turn {source: ms since start} into per-stage timings.  All sources start
+    together, so the time each one finished is how long its stage took.
+    Stages missing from `finished` ran past the deadline.
+    """
+    records = [finished[t] for t in RECORD_TYPES if t in finished]
+    timings = {
+        'resolve_ms': finished.get('ip_address'),
+        'dns_ms': max(records) if records else None,
+        'whois_ms': finished.get('whois'),
+        'ping_ms': finished.get('latency'),
+        'total_ms': round((time.perf_counter() - start) * 1000, 2),
+    }
+    for stage, value in timings.items():
+        if value is None:
+            TIMEOUTS.labels(stage[:-3]).inc()
+    record_timings(timings)
+    return timings
 
 
 class DNSAnalyzer:
     def __init__(self):
-        self.console = Console()
+        self._console = None
+
+    @property
+    def console(self):
+        """rich Console, created the first time something is printed"""
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return self._console
 
     def validate_domain(self, domain):
-        """Validate domain name format"""
-        pattern = re.compile(
-            r'^(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}$'
-        )
-        return bool(pattern.match(domain))
+        """Validate domain name format, accepting IDNs and xn-- labels"""
+        return normalize_domain(domain) is not None
+
+    def get_latency(self, hostname):
+        """Get round-trip time statistics (ms) for the host"""
+        return measure_latency(hostname)
 
     def get_ping_time(self, hostname):
         """Get ping time to the host"""
-        param = '-n' if platform.system().lower() == 'windows' else '-c'
-        command = ['ping', param, '1', hostname]
+        return _format_ping(self.get_latency(hostname))
+
+    def lookup_records(self, domain, record_type, timeout=DEFAULT_DEADLINE):
+        """Fetch one record type, raising only if the domain does not exist"""
+        return run_coroutine(
+            self._lookup_records(domain, record_type, timeout))
+
+    async def _lookup_records(self, domain, record_type, timeout):
+        records = []
+        try:
+            answers = await get_default_pool().resolve(
+                domain, record_type, timeout)
+            for rdata in answers:
+                records.append(str(rdata))
+        except dns.resolver.NoAnswer:
+            records.append('No record found')
+        except dns.resolver.NXDOMAIN:
+            raise
+        except dns.exception.Timeout:
+            records.append('Timeout while fetching record')
+        except Exception as e:
+            records.append(f'Error: {str(e)}')
+        return records
+
+    async def _resolve_address(self, domain, timeout):
+        """
+        What socket.gethostbyname() would return, or None if the lookup
+        takes longer than `timeout` seconds
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(domain, None, family=socket.AF_INET,
+                                 type=socket.SOCK_STREAM), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return infos[0][4][0]
+
+    def get_whois_dates(self, domain):
+        """Return the (creation_date, expiration_date) of the domain"""
         try:
-            output = subprocess.check_output(command).decode().strip()
-            if platform.system().lower() == 'windows':
-                if 'Average' in output:
-                    return output.split('Average = ')[-1].split('ms')[0]
-            else:
-                if 'time=' in output:
-                    return output.split('time=')[-1].split(' ms')[0]
+            return get_whois_cache().get_dates(domain)
         except:
-            return 'N/A'
-        return 'N/A'
+            return None, None
+
+    def stream_dns_info(self, domain, deadline=DEFAULT_DEADLINE):
+        """
+        Query every record type, WHOIS and latency concurrently and yield
+        (source, value) pairs as each one finishes.  Sources still running
+        when the deadline expires are cancelled: everything but WHOIS runs
+        on the scan loop with its own timeout, and a WHOIS lookup that has
+        not started yet is dropped.  NXDOMAIN and socket.gaierror are
+        raised to the caller.
+        """
+        address = self._resolve_address(domain, deadline)
+        prober = LatencyProber(timeout=min(DEFAULT_TIMEOUT, deadline))
+        futures = {
+            submit_coroutine(address): 'ip_address',
+            _executor.submit(self.get_whois_dates, domain): 'whois',
+            submit_coroutine(prober.measure(domain)): 'latency',
+        }
+        for record_type in RECORD_TYPES:
+            future = submit_coroutine(
+                self._lookup_records(domain, record_type, deadline))
+            futures[future] = record_type
 
-    def get_dns_info(self, domain):
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                yield futures[future], future.result()
+        except FuturesTimeout:
+            return
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def get_dns_info(self, domain, deadline=DEFAULT_DEADLINE):
         """Get DNS records for the domain"""
-        if not self.validate_domain(domain):
+        normalized = normalize_domain(domain)
+        if normalized is None:
             self.console.print("[red]Invalid domain format[/red]")
             return False, None
+        domain = normalized
 
         try:
             self.console.print(f"\n[yellow]Resolving {domain}...[/yellow]")
-            ip_address = socket.gethostbyname(domain)
-
-            resolver = dns.resolver.Resolver()
-            resolver.timeout = 5
-            resolver.lifetime = 5
+            start = time.perf_counter()
+            results = {}
+            finished = {}
+            for source, value in self.stream_dns_info(domain, deadline):
+                results[source] = value
+                finished[source] = round(
+                    (time.perf_counter() - start) * 1000, 2)
+            timings = _stage_timings(finished, start)
 
             records = {
-                'A': [],
-                'MX': [],
-                'NS': [],
-                'TXT': [],
-                'CNAME': []
+                record_type: results.get(
+                    record_type, ['Timeout while fetching record'])
+                for record_type in RECORD_TYPES
             }
 
-            for record_type in records.keys():
-                try:
-                    answers = resolver.resolve(domain, record_type)
-                    for rdata in answers:
-                        records[record_type].append(str(rdata))
-                except dns.resolver.NoAnswer:
-                    records[record_type].append('No record found')
-                except dns.resolver.NXDOMAIN:
-                    self.console.print(
-                        f"[red]Domain {domain} does not exist[/red]")
-                    return False, None
-                except dns.exception.Timeout:
-                    records[record_type].append(
-                        'Timeout while fetching record')
-                except Exception as e:
-                    records[record_type].append(f'Error: {str(e)}')
-
+            ip_address = results.get('ip_address')
+            if ip_address is None:
+                ip_address = next(
+                    (ip for ip in records['A'] if ip[:1].isdigit()), None)
+            if ip_address is None:
+                raise socket.gaierror(f"no address for {domain}")
+
+            creation_date, expiration_date = results.get(
+                'whois', (None, None))
+
+            # ASN, block-page and PTR data for every A record at once; PTR
+            # lookups get only what is left of the deadline
+            addresses = [ip for ip in records['A'] if ip[:1].isdigit()] \
+                or [ip_address]
+            remaining = deadline - (time.perf_counter() - start)
             try:
-                w = whois.whois(domain)
-                creation_date = w.creation_date[0] if isinstance(
-                    w.creation_date, list) else w.creation_date
-                expiration_date = w.expiration_date[0] if isinstance(
-                    w.expiration_date, list) else w.expiration_date
-            except:
-                creation_date = expiration_date = None
-
-            ping_time = self.get_ping_time(domain)
-
+                # numpy comes in with the enricher, so load it on demand
+                from enrichment import get_enricher
+                enricher = get_enricher()
+                if remaining > 0:
+                    future = submit_coroutine(enricher.enrich(addresses))
+                    try:
+                        enrichment = future.result(timeout=remaining)
+                    except FuturesTimeout:
+                        future.cancel()
+                        enrichment = enricher.lookup_many(addresses)
+                else:
+                    enrichment = enricher.lookup_many(addresses)
+            except Exception:
+                enrichment = []
+
+            latency = results.get('latency')
             dns_info = {
                 'ip_address': ip_address,
-                'ping_time': ping_time,
+                'ping_time': _format_ping(latency) if latency else 'N/A',
+                'latency': latency,
                 'records': records,
                 'creation_date': creation_date,
-                'expiration_date': expiration_date
+                'expiration_date': expiration_date,
+                'enrichment': enrichment,
+                'timings': timings
             }
 
             return True, dns_info
 
+        except dns.resolver.NXDOMAIN:
+            self.console.print(f"[red]Domain {domain} does not exist[/red]")
         except socket.gaierror:
-            self.console.print(f"[red]Could not resolve domain {
-                               domain}. Please check if the domain exists.[/red]")
+            self.console.print(
+                f"[red]Could not resolve domain {domain}. "
+                "Please check if the domain exists.[/red]")
         except Exception as e:
             self.console.print(f"[red]Error: {str(e)}[/red]")
         return False, None
 
 
-# Create a global instance
-dns_analyzer = DNSAnalyzer()
+_dns_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # The global instance is created on first access rather than on import
+    global _dns_analyzer
+    if name != 'dns_analyzer':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _analyzer_lock:
+        if _dns_analyzer is None:
+            _dns_analyzer = DNSAnalyzer()
+    return _dns_analyzer
@@ -0,0 +1,198 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+
+# Lower-case ASCII names only: input is case-folded and IDNA-encoded first
+DOMAIN_RE = re.compile(
+    r'^(?=.{1,253}$)(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+'
+    r'(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})$'
+)
+
+PUBLIC_SUFFIX_PATHS = (
+    '/usr/share/publicsuffix/public_suffix_list.dat',
+    '/usr/share/publicsuffix/effective_tld_names.dat',
+)
+
+# Used when no public suffix list is installed: the common multi-label
+# suffixes, so www.example.co.uk still groups under example.co.uk
+BUILTIN_SUFFIXES = (
+    'ac.uk', 'co.uk', 'gov.uk', 'org.uk', 'net.uk', 'ltd.uk', 'plc.uk',
+    'com.au', 'net.au', 'org.au', 'edu.au', 'gov.au',
+    'co.nz', 'org.nz', 'co.za', 'co.jp', 'ne.jp', 'or.jp', 'ac.jp',
+    'co.in', 'net.in', 'org.in', 'com.br', 'com.cn', 'net.cn', 'org.cn',
+    'com.mx', 'com.pk', 'edu.pk', 'gov.pk', 'net.pk', 'org.pk',
+    'com.sg', 'com.tr', 'co.kr', 'com.tw', 'com.hk', 'com.ar',
+    'blogspot.com', 'github.io', 'herokuapp.com', 'appspot.com',
+    'cloudfront.net', 'azurewebsites.net',
+)
+
+# Recent names remembered for dedupe; older repeats are scanned again so
+# memory stays flat however long the input is
+DEFAULT_DEDUPE_WINDOW = 100000
+
+_END = '.'
+_EXCEPTION = '!'
+
+
+def _to_ascii(domain):
+    """Case-fold and IDNA-encode a name containing non-ASCII characters"""
+    # Imported here: only internationalized names need it
+    try:
+        import idna
+    except ImportError:
+        return domain.casefold().encode('idna').decode('ascii')
+    return idna.encode(domain, uts46=True).decode('ascii')
+
+
+def normalize_domain(text):
+    """
+    Return the canonical form of a domain name, or None if it is not one.
+    URLs are reduced to their host, the name is case-folded, IDNs are
+    converted to punycode and a trailing dot is dropped.
+    """
+    domain = text.strip()
+    if '/' in domain:
+        domain = urlsplit(domain if '//' in domain else '//' + domain).hostname \
+            or ''
+    domain = domain.rstrip('.')
+    if not domain.isascii():
+        try:
+            domain = _to_ascii(domain)
+        except (UnicodeError, ValueError):
+            return None
+    domain = domain.lower()
+    return domain if DOMAIN_RE.match(domain) else None
+
+
+class DomainNormalizer:
+    """
+    Normalize and deduplicate a stream of names, counting what was dropped.
+    Only the last `window` distinct names are remembered, so a repeat
+    further back than that is yielded again; window=0 turns dedupe off.
+    """
+
+    def __init__(self, window=DEFAULT_DEDUPE_WINDOW):
+        self.window = window
+        self.seen = OrderedDict()
+        self.invalid = 0
+        self.duplicates = 0
+
+    def normalize_many(self, names):
+        """Yield each valid name once, in canonical form and input order"""
+        seen = self.seen
+        for name in names:
+            domain = normalize_domain(name)
+            if domain is None:
+                self.invalid += 1
+                continue
+            if self.window:
+                if domain in seen:
+                    seen.move_to_end(domain)
+                    self.duplicates += 1
+                    continue
+                seen[domain] = None
+                if len(seen) > self.window:
+                    seen.popitem(last=False)
+            yield domain
+
+
+class PublicSuffixTrie:
+    """
+    Public suffix rules in a trie keyed by labels from the right, with
+    wildcard ("*.ck") and exception ("!www.ck") rules.  Like the PSL
+    algorithm, any unlisted TLD counts as a public suffix.
+    """
+
+    def __init__(self, rules=()):
+        self.root = {}
+        for rule in rules:
+            self.add(rule)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a public_suffix_list.dat file"""
+        trie = cls()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                rule = line.split(None, 1)[0] if line.strip() else ''
+                if rule and not rule.startswith('//'):
+                    trie.add(rule)
+        return trie
+
+    def add(self, rule):
+        exception = rule.startswith('!')
+        rule = rule.lstrip('!')
+        if not rule.isascii():
+            try:
+                rule = '.'.join(label if label == '*' else _to_ascii(label)
+                                for label in rule.split('.'))
+            except (UnicodeError, ValueError):
+                return
+        node = self.root
+        for label in reversed(rule.lower().split('.')):
+            node = node.setdefault(label, {})
+        node[_EXCEPTION if exception else _END] = True
+
+    def suffix_length(self, labels):
+        """Number of trailing labels in `labels` that form the public suffix"""
+        best = 1
+        node = self.root
+        for depth, label in enumerate(reversed(labels)):
+            child = node.get(label)
+            if child is not None:
+                if _EXCEPTION in child:
+                    return depth
+                if _END in child:
+                    best = depth + 1
+                node = child
+                continue
+            child = node.get('*')
+            if child is None:
+                break
+            best = depth + 1
+            node = child
+        return best
+
+    def public_suffix(self, domain):
+        labels = domain.split('.')
+        return '.'.join(labels[-self.suffix_length(labels):])
+
+    def registrable_domain(self, domain):
+        """The public suffix plus one label, or None for a bare suffix"""
+        labels = domain.split('.')
+        length = self.suffix_length(labels) + 1
+        if len(labels) < length:
+            return None
+        return '.'.join(labels[-length:])
+
+
+_public_suffixes = None
+_suffix_lock = threading.Lock()
+
+
+def get_public_suffixes():
+    """
+    Return the process-wide trie, loaded on first use from $PUBLIC_SUFFIX_LIST
+    or the system list, falling back to BUILTIN_SUFFIXES.
+    """
+    global _public_suffixes
+    with _suffix_lock:
+        if _public_suffixes is None:
+            paths = [os.environ.get('PUBLIC_SUFFIX_LIST')] \
+                + list(PUBLIC_SUFFIX_PATHS)
+            for path in paths:
+                if path and os.path.exists(path):
+                    _public_suffixes = PublicSuffixTrie.from_file(path)
+                    break
+            else:
+                _public_suffixes = PublicSuffixTrie(BUILTIN_SUFFIXES)
+    return _public_suffixes
+
+
+def registrable_domain(domain):
+    """Registrable domain (e.g. example.co.uk) of a normalized name"""
+    return get_public_suffixes().registrable_domain(domain)
+
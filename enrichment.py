@@ -0,0 +1,331 @@
+import gzip
+import ipaddress
+import os
+import socket
+import threading
+from bisect import bisect_right
+
+import dns.exception
+import dns.reversename
+import numpy as np
+
+from dns_query import get_default_pool
+from scanner import bounded_map
+
+
+DEFAULT_PTR_CONCURRENCY = 100
+DEFAULT_PTR_TIMEOUT = 2
+
+# Answers in these networks are never a public web server; resolvers that
+# censor by DNS commonly hand them out in place of the real address
+BOGON_NETWORKS = (
+    '0.0.0.0/8', '10.0.0.0/8', '100.64.0.0/10', '127.0.0.0/8',
+    '169.254.0.0/16', '172.16.0.0/12', '192.0.0.0/24', '192.168.0.0/16',
+    '198.18.0.0/15', '224.0.0.0/4', '240.0.0.0/4',
+    '::/128', '::1/128', 'fc00::/7', 'fe80::/10', 'ff00::/8',
+)
+
+
+def _address_int(address):
+    """(version, integer) of an address string"""
+    if ':' in address:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, address),
+                                 'big')
+    return 4, int.from_bytes(socket.inet_aton(address), 'big')
+
+
+def _flatten(ranges):
+    """
+    Turn nested (first, last, value) ranges into disjoint ones where the
+    innermost range wins.  Ranges must nest or be disjoint, which holds
+    for CIDR prefixes.
+    """
+    ranges.sort(key=lambda r: (r[0], -r[1]))
+    flat = []
+    stack = []
+    cursor = 0
+
+    def close_until(limit):
+        # Emit the part of each open range that ends before `limit`
+        nonlocal cursor
+        while stack and stack[-1][0] < limit:
+            last, value = stack.pop()
+            if cursor <= last:
+                flat.append((cursor, last, value))
+                cursor = last + 1
+
+    for first, last, value in ranges:
+        close_until(first)
+        if stack and cursor < first:
+            flat.append((cursor, first - 1, stack[-1][1]))
+        stack.append((last, value))
+        cursor = first
+    close_until(float('inf'))
+    return flat
+
+
+class PrefixIndex:
+    """
+    IP ranges mapped to values, looked up by binary search over sorted
+    range starts.  IPv4 ranges are kept as uint32 numpy arrays, so
+    lookup_many() resolves a whole batch in one searchsorted call; IPv6
+    uses the same layout over Python ints.  Values are interned, so a
+    million ranges sharing a few thousand ASNs stay small.
+    """
+
+    def __init__(self):
+        self.values = []
+        self._value_ids = {}
+        self._pending = {4: [], 6: []}
+        self._starts = {4: np.empty(0, np.uint32), 6: []}
+        self._ends = {4: np.empty(0, np.uint32), 6: []}
+        self._ids = {4: np.empty(0, np.int32), 6: []}
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._starts[4]) + len(self._starts[6])
+
+    def _value_id(self, value):
+        value_id = self._value_ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.values.append(value)
+            self._value_ids[value] = value_id
+        return value_id
+
+    def add_range(self, first, last, value):
+        """Map the addresses from `first` to `last` (strings) to `value`"""
+        version, start = _address_int(first)
+        _, end = _address_int(last)
+        self._pending[version].append((start, end, self._value_id(value)))
+        self._dirty = True
+
+    def add_network(self, cidr, value):
+        network = ipaddress.ip_network(cidr, strict=False)
+        self._pending[network.version].append(
+            (int(network.network_address), int(network.broadcast_address),
+             self._value_id(value)))
+        self._dirty = True
+
+    def build(self):
+        """Merge ranges added since the last build into the search arrays"""
+        if not self._dirty:
+            return self
+        for version in (4, 6):
+            pending = self._pending[version]
+            if not pending:
+                continue
+            current = list(zip(self._starts[version], self._ends[version],
+                               self._ids[version]))
+            flat = _flatten([(int(s), int(e), int(i)) for s, e, i in current]
+                            + pending)
+            starts = [first for first, _, _ in flat]
+            ends = [last for _, last, _ in flat]
+            ids = [value_id for _, _, value_id in flat]
+            if version == 4:
+                self._starts[4] = np.array(starts, dtype=np.uint32)
+                self._ends[4] = np.array(ends, dtype=np.uint32)
+                self._ids[4] = np.array(ids, dtype=np.int32)
+            else:
+                self._starts[6], self._ends[6], self._ids[6] = \
+                    starts, ends, ids
+            self._pending[version] = []
+        self._dirty = False
+        return self
+
+    def lookup(self, address):
+        """Value of the most specific range holding `address`, or None"""
+        if self._dirty:
+            self.build()
+        try:
+            version, number = _address_int(address)
+        except OSError:
+            return None
+        starts = self._starts[version]
+        if version == 4:
+            # A uint32 needle keeps numpy from converting the whole array
+            i = int(np.searchsorted(starts, np.uint32(number),
+                                    side='right')) - 1
+        else:
+            i = bisect_right(starts, number) - 1
+        if i < 0 or number > self._ends[version][i]:
+            return None
+        return self.values[self._ids[version][i]]
+
+    def lookup_many(self, addresses):
+        """lookup() for a list of addresses, IPv4 ones in a single search"""
+        if self._dirty:
+            self.build()
+        found = [None] * len(addresses)
+        v4_slots = []
+        v4_numbers = []
+        for slot, address in enumerate(addresses):
+            if ':' in address:
+                found[slot] = self.lookup(address)
+                continue
+            try:
+                v4_numbers.append(
+                    int.from_bytes(socket.inet_aton(address), 'big'))
+            except OSError:
+                continue
+            v4_slots.append(slot)
+        if v4_numbers and len(self._starts[4]):
+            numbers = np.array(v4_numbers, dtype=np.uint32)
+            index = np.searchsorted(self._starts[4], numbers, side='right') - 1
+            clipped = np.maximum(index, 0)
+            hit = (index >= 0) & (numbers <= self._ends[4][clipped])
+            ids = self._ids[4][clipped]
+            for slot, matched, value_id in zip(v4_slots, hit, ids):
+                if matched:
+                    found[slot] = self.values[value_id]
+        return found
+
+
+def load_ip2asn(path, index=None):
+    """
+    Load an ip2asn TSV (range_start, range_end, AS number, country,
+    AS description; optionally gzipped) into a PrefixIndex of
+    (asn, country, as_name) tuples.  Unrouted ranges (AS 0) are skipped.
+    """
+    if index is None:
+        index = PrefixIndex()
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 5 or fields[2] == '0':
+                continue
+            try:
+                index.add_range(fields[0], fields[1],
+                                (int(fields[2]), fields[3], fields[4]))
+            except (OSError, ValueError):
+                continue
+    return index.build()
+
+
+def load_cidr_list(path, index=None, label='blockpage'):
+    """
+    Load a block-page/sinkhole list: one CIDR per line, optionally followed
+    by a label (e.g. "Some ISP block page").  '#' starts a comment.
+    """
+    if index is None:
+        index = PrefixIndex()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            cidr, _, name = line.partition(' ')
+            try:
+                index.add_network(cidr, name.strip() or label)
+            except ValueError:
+                continue
+    return index.build()
+
+
+class IPEnricher:
+    """
+    Annotate resolved addresses with their ASN, country and reverse DNS
+    name, and flag addresses in known block-page or sinkhole networks.
+
+    `asn_path` is an offline ip2asn database and `blockpage_path` a CIDR
+    list (see load_cidr_list); with `bogons`, private and reserved
+    networks count as sinkholes too.  PTR lookups go through the shared
+    UDP query pool, so they must run on the shared scan loop.
+    """
+
+    def __init__(self, asn_path=None, blockpage_path=None, bogons=False,
+                 pool=None, ptr_concurrency=DEFAULT_PTR_CONCURRENCY,
+                 ptr_timeout=DEFAULT_PTR_TIMEOUT):
+        self.asn = load_ip2asn(asn_path) if asn_path else None
+        self.blockpages = None
+        if blockpage_path or bogons:
+            self.blockpages = PrefixIndex()
+            if bogons:
+                for cidr in BOGON_NETWORKS:
+                    self.blockpages.add_network(cidr, 'bogon')
+            if blockpage_path:
+                load_cidr_list(blockpage_path, self.blockpages)
+            self.blockpages.build()
+        self.pool = pool
+        self.ptr_concurrency = ptr_concurrency
+        self.ptr_timeout = ptr_timeout
+
+    def blockpage(self, address):
+        """Label of the block-page network `address` is in, or None"""
+        if self.blockpages is None:
+            return None
+        return self.blockpages.lookup(address)
+
+    def lookup_many(self, addresses):
+        """Offline data for each address: ASN, AS name, country, block page"""
+        asns = self.asn.lookup_many(addresses) if self.asn else \
+            [None] * len(addresses)
+        blockpages = self.blockpages.lookup_many(addresses) \
+            if self.blockpages else [None] * len(addresses)
+        records = []
+        for address, asn, blockpage in zip(addresses, asns, blockpages):
+            number, country, name = asn or (None, None, None)
+            records.append({'ip': address, 'asn': number, 'as_name': name,
+                            'country': country, 'blockpage': blockpage})
+        return records
+
+    def lookup(self, address):
+        return self.lookup_many([address])[0]
+
+    async def reverse(self, address):
+        """PTR name of `address`, or None if it has none or times out"""
+        pool = self.pool or get_default_pool()
+        try:
+            answer = await pool.resolve(dns.reversename.from_address(address),
+                                        'PTR', self.ptr_timeout)
+        except (dns.exception.DNSException, OSError, ValueError):
+            return None
+        return str(answer[0]).rstrip('.') if len(answer) else None
+
+    async def reverse_many(self, addresses):
+        """{address: PTR name or None}, querying up to ptr_concurrency at once"""
+        unique = list(dict.fromkeys(addresses))
+
+        async def reverse(address):
+            return address, await self.reverse(address)
+
+        return {address: name async for address, name
+                in bounded_map(reverse, unique, self.ptr_concurrency)}
+
+    async def enrich(self, addresses, ptr=True):
+        """lookup_many() plus a 'ptr' field from batched reverse lookups"""
+        records = self.lookup_many(addresses)
+        if ptr and addresses:
+            names = await self.reverse_many(addresses)
+            for record in records:
+                record['ptr'] = names.get(record['ip'])
+        return records
+
+    def enrich_result(self, result):
+        """Add the first answer's ASN and country to a scan result"""
+        ips = result.get('ips')
+        if not ips or self.asn is None:
+            return result
+        asn = self.asn.lookup(ips[0])
+        if asn is not None:
+            result['asn'], result['country'], result['as_name'] = asn
+        return result
+
+
+_enricher = None
+_enricher_lock = threading.Lock()
+
+
+def get_enricher():
+    """
+    Return the process-wide enricher, loading $IP2ASN_DB and
+    $BLOCKPAGE_CIDRS on first use when they are set.
+    """
+    global _enricher
+    with _enricher_lock:
+        if _enricher is None:
+            _enricher = IPEnricher(
+                asn_path=os.environ.get('IP2ASN_DB'),
+                blockpage_path=os.environ.get('BLOCKPAGE_CIDRS'))
+    return _enricher
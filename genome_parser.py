@@ -0,0 +1,217 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from rich.console import Console
+
+from kmers import kmer_columns, triplet_rows
+
+
+# "page, item, name, 453 linear" starts a new entry, as in the notebook
+HEADER_RE = re.compile(rb'^\d+,\s*\d+')
+COUNT_RE = re.compile(rb'(\d+)')
+
+OUTPUT_FORMATS = ('csv', 'parquet')
+BASE_COLUMNS = [
+    'Page Number', 'Item Number', 'Genome Name',
+    'Expected Character Count', 'Counted Character Count',
+    'Difference', 'N Count', 'N Percentage'
+]
+
+# Entries are sent to workers in batches of about this many bases
+DEFAULT_BATCH_BYTES = 8 << 20
+
+
+def output_columns(k=3):
+    """The notebook's output columns: entry fields, then every k-mer"""
+    return BASE_COLUMNS + kmer_columns(k)
+
+
+def iter_entries(path, warn=None):
+    """
+    Yield the genome entries of a scraped NCBI text export one at a time,
+    like the notebook's parse_text_file but without holding the file: each
+    sequence is collected in a bytearray, so appending lines stays linear.
+    Lines after a malformed header are skipped; `warn` is called with
+    each such header.
+    """
+    entry = None
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if HEADER_RE.match(line):
+                if entry is not None:
+                    yield entry
+                    entry = None
+                parts = [part.strip() for part in line.split(b',', 3)]
+                if len(parts) < 4:
+                    if warn is not None:
+                        warn(line.decode('utf-8', 'replace'))
+                    continue
+                page_number, item_number, genome_name, expected_info = parts
+                expected = COUNT_RE.search(expected_info)
+                entry = {
+                    'Page Number': page_number.decode('utf-8', 'replace'),
+                    'Item Number': item_number.decode('utf-8', 'replace'),
+                    'Genome Name': genome_name.decode('utf-8', 'replace'),
+                    'Expected Character Count':
+                        int(expected.group(1)) if expected else 0,
+                    'Sequence': bytearray(),
+                }
+            elif entry is not None:
+                entry['Sequence'] += line
+    if entry is not None:
+        yield entry
+
+
+def _batches(entries, batch_bytes):
+    batch = []
+    size = 0
+    for entry in entries:
+        batch.append(entry)
+        size += len(entry['Sequence'])
+        if size >= batch_bytes:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+def count_entries(entries, processes=None, k=3,
+                  batch_bytes=DEFAULT_BATCH_BYTES):
+    """
+    Yield triplet_rows() for every entry, in input order, counting batches
+    of about `batch_bytes` bases across a pool of processes.  At most two
+    batches per process are in flight, so memory stays bounded however
+    large the input is.  With processes=1 everything runs in-process.
+    """
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        for batch in _batches(entries, batch_bytes):
+            yield from triplet_rows(batch, k)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        pending = deque()
+        for batch in _batches(entries, batch_bytes):
+            pending.append(pool.submit(triplet_rows, batch, k))
+            if len(pending) >= processes * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class RowWriter:
+    """Write rows incrementally as CSV, or as Parquet row groups"""
+
+    def __init__(self, path, columns, output_format='csv',
+                 rows_per_group=1024):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.path = path
+        self.columns = columns
+        self.output_format = output_format
+        self.rows_per_group = rows_per_group
+        self.count = 0
+        self._pending = []
+        self._parquet = None
+        if output_format == 'csv':
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(columns)
+        else:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError as e:
+                raise RuntimeError(
+                    "Parquet output needs pyarrow (pip install pyarrow)") from e
+            self._pyarrow = pyarrow
+            self._file = None
+
+    def write(self, row):
+        self.count += 1
+        if self._file is not None:
+            self._csv.writerow([row[column] for column in self.columns])
+            return
+        self._pending.append(row)
+        if len(self._pending) >= self.rows_per_group:
+            self._flush_parquet()
+
+    def _flush_parquet(self):
+        if not self._pending:
+            return
+        table = self._pyarrow.Table.from_pylist(
+            self._pending, schema=self._parquet.schema
+            if self._parquet is not None else None)
+        if self._parquet is None:
+            self._parquet = self._pyarrow.parquet.ParquetWriter(
+                self.path, table.schema)
+        self._parquet.write_table(table)
+        self._pending = []
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            return
+        self._flush_parquet()
+        if self._parquet is not None:
+            self._parquet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def process_genome_file(input_path, output_path, output_format='csv',
+                        processes=None, k=3, warn=None):
+    """
+    Streaming replacement for the notebook's process_genome_sequences:
+    parse, count and write one entry at a time.  Returns the row count.
+    """
+    columns = output_columns(k)
+    with RowWriter(output_path, columns, output_format) as writer:
+        for row in count_entries(iter_entries(input_path, warn),
+                                 processes, k):
+            writer.write(row)
+    return writer.count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Count k-mers in a scraped genome text export')
+    parser.add_argument('input', help='text export to parse')
+    parser.add_argument('output', help='CSV or Parquet file to write')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv')
+    parser.add_argument('--processes', type=int,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('-k', type=int, default=3,
+                        help='k-mer length (default: 3, the triplets)')
+    args = parser.parse_args()
+
+    console = Console(stderr=True)
+
+    def warn(line):
+        console.print(f"[yellow]Warning: Skipping malformed line: "
+                      f"{line}[/yellow]")
+
+    count = process_genome_file(args.input, args.output, args.format,
+                                args.processes, args.k, warn)
+    console.print(f"[cyan]Wrote {count} rows × {len(output_columns(args.k))} "
+                  f"columns to {args.output}[/cyan]")
+    return 0 if count else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,486 @@
+import argparse
+import csv
+import sys
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from genome_parser import BASE_COLUMNS, OUTPUT_FORMATS, RowWriter
+from kmers import kmer_columns
+
+
+# The notebook's thresholds: genomes with more than 20% N are dropped, and
+# 100,000 counted bases separate partial from complete genomes
+DEFAULT_MAX_N_PERCENTAGE = 20.0
+DEFAULT_COMPLETE_LENGTH = 100000
+DEFAULT_IQR_FACTOR = 1.5
+DEFAULT_Z_SCORE = 3.0
+
+STATISTICS = ('Mean', 'Median', 'Mode', 'Q1', 'Q3', 'IQR', 'Variance')
+OUTLIER_METHODS = ('iqr', 'zscore', 'none')
+
+
+def _parse_numbers(path, lines, line_numbers, columns):
+    """
+    Parse comma-separated numeric text lines into a (lines, columns)
+    float64 array.  The whole batch goes through one numpy parse; only if
+    that fails are the cells parsed one by one to say which is wrong.
+    """
+    if not lines:
+        return np.empty((0, len(columns)))
+    try:
+        values = np.fromstring(','.join(lines), dtype=np.float64, sep=',')
+    except ValueError:
+        values = None
+    if values is not None and values.size == len(lines) * len(columns):
+        return values.reshape(-1, len(columns))
+    for line, line_number in zip(lines, line_numbers):
+        cells = line.split(',')
+        for column, cell in zip(columns, cells):
+            try:
+                float(cell)
+            except ValueError:
+                raise ValueError(f"{path}, line {line_number}, column "
+                                 f"'{column}': not a number: {cell!r}") \
+                    from None
+    raise ValueError(f"{path}: could not parse the numeric columns")
+
+
+def _as_counts(path, values, line_numbers, columns):
+    """int32 copy of parsed counts, which may be written as e.g. 12.0"""
+    whole = np.isfinite(values) & (values == np.floor(values))
+    if not whole.all():
+        row, column = np.argwhere(~whole)[0]
+        raise ValueError(f"{path}, line {line_numbers[row]}, column "
+                         f"'{columns[column]}': not a whole count: "
+                         f"{values[row, column]}")
+    return values.astype(np.int32)
+
+
+class GenomeMatrix:
+    """
+    The triplet table held column-wise: names and ids as lists, the
+    numeric fields as typed arrays and the k-mer counts as one
+    (genomes, 4**k) int32 matrix, so every statistic is a single
+    vectorized call instead of a pass per column.
+    """
+
+    def __init__(self, k=3):
+        self.k = k
+        self.kmers = kmer_columns(k)
+        self.page_numbers = []
+        self.item_numbers = []
+        self.names = []
+        self.expected = np.empty(0, np.int32)
+        self.counted = np.empty(0, np.int32)
+        self.n_counts = np.empty(0, np.int32)
+        self.n_percentages = np.empty(0, np.float32)
+        self.counts = np.empty((0, len(self.kmers)), np.int32)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_rows(cls, rows, k=3):
+        """Build from row dicts, e.g. straight from genome_parser.count_entries"""
+        matrix = cls(k)
+        expected, counted, n_counts, n_percentages, counts = [], [], [], [], []
+        for row in rows:
+            matrix.page_numbers.append(str(row['Page Number']))
+            matrix.item_numbers.append(str(row['Item Number']))
+            matrix.names.append(row['Genome Name'])
+            expected.append(row['Expected Character Count'])
+            counted.append(row['Counted Character Count'])
+            n_counts.append(row['N Count'])
+            n_percentages.append(row['N Percentage'])
+            counts.append([row[kmer] for kmer in matrix.kmers])
+        matrix._set_numbers(expected, counted, n_counts, n_percentages, counts)
+        return matrix
+
+    @classmethod
+    def from_csv(cls, path, k=3):
+        """Load a genome_parser/notebook CSV in one read"""
+        matrix = cls(k)
+        with open(path, encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return matrix
+            missing = [column for column in BASE_COLUMNS + matrix.kmers
+                       if column not in header]
+            if missing:
+                raise ValueError(f"{path} is missing columns: "
+                                 f"{', '.join(missing)}")
+            page, item, name = (header.index(column)
+                                for column in BASE_COLUMNS[:3])
+            numeric_columns = ['Expected Character Count',
+                               'Counted Character Count', 'N Count',
+                               'N Percentage']
+            numeric = [header.index(column) for column in numeric_columns]
+            kmer_indexes = [header.index(kmer) for kmer in matrix.kmers]
+            fields, counts, line_numbers = [], [], []
+            for row in reader:
+                if not row:
+                    continue
+                if len(row) != len(header):
+                    raise ValueError(
+                        f"{path}, line {reader.line_num}: {len(row)} fields "
+                        f"where the header has {len(header)}")
+                line_numbers.append(reader.line_num)
+                matrix.page_numbers.append(row[page])
+                matrix.item_numbers.append(row[item])
+                matrix.names.append(row[name])
+                fields.append(','.join([row[i] for i in numeric]))
+                counts.append(','.join([row[i] for i in kmer_indexes]))
+        # One numpy parse of the joined text is far cheaper than an int()
+        # per cell or converting an array of strings
+        fields = _parse_numbers(path, fields, line_numbers, numeric_columns)
+        counts = _parse_numbers(path, counts, line_numbers, matrix.kmers)
+        whole = _as_counts(path, fields[:, :3], line_numbers, numeric_columns)
+        matrix._set_numbers(whole[:, 0], whole[:, 1], whole[:, 2],
+                            fields[:, 3],
+                            _as_counts(path, counts, line_numbers,
+                                       matrix.kmers))
+        return matrix
+
+    @classmethod
+    def from_parquet(cls, path, k=3):
+        try:
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError(
+                "Parquet input needs pyarrow (pip install pyarrow)") from e
+        matrix = cls(k)
+        table = pyarrow.parquet.read_table(path)
+
+        def column(name):
+            return table.column(name).to_numpy()
+
+        matrix.page_numbers = [str(v) for v in column('Page Number')]
+        matrix.item_numbers = [str(v) for v in column('Item Number')]
+        matrix.names = [str(v) for v in column('Genome Name')]
+        matrix._set_numbers(column('Expected Character Count'),
+                            column('Counted Character Count'),
+                            column('N Count'), column('N Percentage'),
+                            np.column_stack([column(kmer)
+                                             for kmer in matrix.kmers])
+                            if len(table) else [])
+        return matrix
+
+    @classmethod
+    def load(cls, path, k=3):
+        if path.endswith('.parquet'):
+            return cls.from_parquet(path, k)
+        return cls.from_csv(path, k)
+
+    def _set_numbers(self, expected, counted, n_counts, n_percentages, counts):
+        self.expected = np.asarray(expected).astype(np.int32)
+        self.counted = np.asarray(counted).astype(np.int32)
+        self.n_counts = np.asarray(n_counts).astype(np.int32)
+        self.n_percentages = np.asarray(n_percentages).astype(np.float32)
+        self.counts = np.asarray(counts).astype(np.int32).reshape(
+            -1, len(self.kmers))
+
+    def rows(self, mask=None):
+        """Row dicts in output_columns() order, optionally only where `mask`"""
+        indexes = range(len(self)) if mask is None else np.flatnonzero(mask)
+        for i in indexes:
+            row = {
+                'Page Number': self.page_numbers[i],
+                'Item Number': self.item_numbers[i],
+                'Genome Name': self.names[i],
+                'Expected Character Count': int(self.expected[i]),
+                'Counted Character Count': int(self.counted[i]),
+                'Difference': int(self.expected[i]) - int(self.counted[i]),
+                'N Count': int(self.n_counts[i]),
+                'N Percentage': round(float(self.n_percentages[i]), 2),
+            }
+            row.update(zip(self.kmers, self.counts[i].tolist()))
+            yield row
+
+
+def _quantile(ordered, q):
+    """Column quantiles of a column-sorted matrix, interpolated like pandas"""
+    position = q * (len(ordered) - 1)
+    low = int(np.floor(position))
+    high = min(low + 1, len(ordered) - 1)
+    fraction = position - low
+    return ordered[low] + (ordered[high] - ordered[low]) * fraction
+
+
+def _mode(ordered):
+    """Most common value of each column, the smallest on ties (like scipy)"""
+    rows = len(ordered)
+    # Run starts in the column-major flattening; every column starts a run
+    flat = ordered.T.ravel()
+    starts = np.flatnonzero(np.concatenate(
+        ([True], flat[1:] != flat[:-1]))
+        | (np.arange(len(flat)) % rows == 0))
+    lengths = np.diff(np.append(starts, len(flat)))
+    run_columns = starts // rows
+    # Longest run per column, earliest (smallest value) first
+    order = np.lexsort((starts, -lengths, run_columns))
+    first = np.concatenate(([True], run_columns[order][1:]
+                            != run_columns[order][:-1]))
+    return flat[starts[order][first]]
+
+
+def triplet_statistics(counts):
+    """
+    calculate_genome_stats() for a count matrix: {statistic: array over
+    the columns} for STATISTICS, from a single column sort.  Quantiles
+    interpolate linearly and the variance is the sample variance, as in
+    pandas.  Empty input gives NaN throughout.
+    """
+    width = counts.shape[1]
+    if not len(counts):
+        return {name: np.full(width, np.nan) for name in STATISTICS}
+    ordered = np.sort(counts, axis=0).astype(np.float64)
+    q1 = _quantile(ordered, 0.25)
+    q3 = _quantile(ordered, 0.75)
+    return {
+        'Mean': ordered.mean(axis=0),
+        'Median': _quantile(ordered, 0.5),
+        'Mode': _mode(ordered),
+        'Q1': q1,
+        'Q3': q3,
+        'IQR': q3 - q1,
+        'Variance': ordered.var(axis=0, ddof=1) if len(ordered) > 1
+        else np.full(width, np.nan),
+    }
+
+
+class GenomeSummary:
+    """
+    Everything the notebook's split/stats/outlier cells produce, computed
+    from one GenomeMatrix: boolean masks over its rows (excluded, partial,
+    complete, outliers, cleaned), the statistics of the complete genomes
+    and per-triplet outlier bounds.
+    """
+
+    def __init__(self, matrix, max_n_percentage=DEFAULT_MAX_N_PERCENTAGE,
+                 complete_length=DEFAULT_COMPLETE_LENGTH, method='iqr',
+                 iqr_factor=DEFAULT_IQR_FACTOR, z_score=DEFAULT_Z_SCORE):
+        if method not in OUTLIER_METHODS:
+            raise ValueError(f"Unknown outlier method: {method}")
+        self.matrix = matrix
+        self.method = method
+        self.excluded = matrix.n_percentages > max_n_percentage
+        kept = ~self.excluded
+        long_enough = matrix.counted >= complete_length
+        self.partial = kept & ~long_enough
+        self.complete = kept & long_enough
+
+        complete_counts = matrix.counts[self.complete]
+        self.statistics = triplet_statistics(complete_counts)
+        if method == 'zscore':
+            spread = z_score * np.sqrt(self.statistics['Variance'])
+            self.lower = self.statistics['Mean'] - spread
+            self.upper = self.statistics['Mean'] + spread
+        else:
+            spread = iqr_factor * self.statistics['IQR']
+            self.lower = self.statistics['Q1'] - spread
+            self.upper = self.statistics['Q3'] + spread
+
+        # A complete genome is an outlier if any triplet is out of bounds;
+        # the notebook's column-by-column filter keeps the same rows
+        self.outliers = np.zeros(len(matrix), dtype=bool)
+        if method != 'none':
+            self.outliers[self.complete] = (
+                (complete_counts < self.lower)
+                | (complete_counts > self.upper)).any(axis=1)
+        self.cleaned = self.complete & ~self.outliers
+
+    def counts(self):
+        return {'genomes': len(self.matrix),
+                'excluded': int(self.excluded.sum()),
+                'partial': int(self.partial.sum()),
+                'complete': int(self.complete.sum()),
+                'outliers': int(self.outliers.sum()),
+                'cleaned': int(self.cleaned.sum())}
+
+    def write_statistics(self, path):
+        """The notebook's complete_genomes_stats.csv"""
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Statistic'] + self.matrix.kmers)
+            for name in STATISTICS:
+                writer.writerow([name] + self.statistics[name].tolist())
+
+    def write_rows(self, path, mask, output_format='csv'):
+        """Write the rows selected by `mask` (e.g. self.cleaned)"""
+        columns = BASE_COLUMNS + self.matrix.kmers
+        with RowWriter(path, columns, output_format) as writer:
+            for row in self.matrix.rows(mask):
+                writer.write(row)
+        return writer.count
+
+    def box_stats(self, mask=None):
+        """
+        Per-triplet box plot statistics (matplotlib's bxp() format) for the
+        rows in `mask`, the cleaned genomes by default.  Whiskers reach the
+        furthest values within 1.5 IQR, as in a regular box plot.
+        """
+        counts = self.matrix.counts[self.cleaned if mask is None else mask]
+        if not len(counts):
+            return []
+        stats = triplet_statistics(counts)
+        low = stats['Q1'] - DEFAULT_IQR_FACTOR * stats['IQR']
+        high = stats['Q3'] + DEFAULT_IQR_FACTOR * stats['IQR']
+        inside = (counts >= low) & (counts <= high)
+        whislo = np.where(inside, counts, np.iinfo(np.int32).max).min(axis=0)
+        whishi = np.where(inside, counts, np.iinfo(np.int32).min).max(axis=0)
+        boxes = []
+        for i, kmer in enumerate(self.matrix.kmers):
+            column = counts[:, i]
+            boxes.append({
+                'label': kmer, 'mean': stats['Mean'][i],
+                'med': stats['Median'][i], 'q1': stats['Q1'][i],
+                'q3': stats['Q3'][i], 'whislo': whislo[i],
+                'whishi': whishi[i], 'fliers': column[~inside[:, i]],
+            })
+        return boxes
+
+    def plot(self, path=None, mask=None, per_plot=4):
+        """
+        The notebook's 4x4 grid of triplet box plots, drawn from box_stats()
+        with matplotlib, so the plot never re-reads or re-sorts the data.
+        Saved to `path`, or shown when it is None.
+        """
+        try:
+            import matplotlib
+            if path is not None:
+                matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+        except ImportError as e:
+            raise RuntimeError(
+                "Plotting needs matplotlib (pip install matplotlib)") from e
+        boxes = self.box_stats(mask)
+        if not boxes:
+            raise ValueError("No genomes left to plot")
+        groups = [boxes[i:i + per_plot] for i in range(0, len(boxes), per_plot)]
+        side = int(np.ceil(np.sqrt(len(groups))))
+        fig, axes = plt.subplots(side, side, figsize=(5 * side, 5 * side),
+                                 sharey=True, squeeze=False)
+        axes = axes.flatten()
+        for i, ax in enumerate(axes):
+            if i >= len(groups):
+                ax.set_visible(False)
+                continue
+            start = i * per_plot
+            ax.bxp(groups[i], showmeans=True, meanline=True,
+                   meanprops={'linestyle': '--', 'color': 'red'})
+            ax.set_title(f'Triplets {start + 1} to {start + len(groups[i])}')
+            ax.set_xlabel('Triplet Sequence')
+            ax.set_ylabel('Count')
+            ax.grid(True, axis='y', linestyle='--', alpha=0.7)
+        fig.tight_layout()
+        if path is None:
+            plt.show()
+        else:
+            fig.savefig(path)
+            plt.close(fig)
+
+
+def print_summary(summary, console):
+    counts = summary.counts()
+    console.print(f"[cyan]{counts['genomes']} genomes: "
+                  f"{counts['excluded']} excluded (N > limit), "
+                  f"{counts['partial']} partial, {counts['complete']} complete, "
+                  f"{counts['outliers']} outliers ({summary.method}), "
+                  f"{counts['cleaned']} cleaned[/cyan]")
+    if not counts['complete']:
+        return
+    table = Table(title="Complete genome statistics (first 6 triplets)")
+    table.add_column("Statistic", style="cyan", no_wrap=True)
+    kmers = summary.matrix.kmers[:6]
+    for kmer in kmers:
+        table.add_column(kmer, justify="right")
+    for name in STATISTICS:
+        table.add_row(name, *(f"{value:.1f}" for value
+                              in summary.statistics[name][:len(kmers)]))
+    console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Split, summarize and clean a genome triplet table')
+    parser.add_argument('input', help='triplet CSV/Parquet from genome_parser, '
+                        'or a raw text export with --export')
+    parser.add_argument('--export', action='store_true',
+                        help='input is a raw text export: count it in memory '
+                        'instead of reading an intermediate file')
+    parser.add_argument('--processes', type=int,
+                        help='worker processes for --export')
+    parser.add_argument('-k', type=int, default=3,
+                        help='k-mer length (default: 3, the triplets)')
+    parser.add_argument('--max-n', type=float,
+                        default=DEFAULT_MAX_N_PERCENTAGE,
+                        help='drop genomes with a higher N percentage')
+    parser.add_argument('--complete-length', type=int,
+                        default=DEFAULT_COMPLETE_LENGTH,
+                        help='counted bases that make a genome complete')
+    parser.add_argument('--outliers', choices=OUTLIER_METHODS, default='iqr')
+    parser.add_argument('--iqr-factor', type=float, default=DEFAULT_IQR_FACTOR)
+    parser.add_argument('--z', type=float, default=DEFAULT_Z_SCORE,
+                        help='z-score limit for --outliers zscore')
+    parser.add_argument('--stats', help='write complete-genome statistics CSV')
+    parser.add_argument('--partial', help='write partial genomes')
+    parser.add_argument('--complete', help='write complete genomes')
+    parser.add_argument('--cleaned', help='write complete genomes '
+                        'without outliers')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv',
+                        help='format of --partial/--complete/--cleaned')
+    parser.add_argument('--plot', metavar='PATH',
+                        help='save box plots of the cleaned genomes')
+    args = parser.parse_args()
+
+    console = Console(stderr=True)
+    try:
+        if args.export:
+            from genome_parser import count_entries, iter_entries
+
+            def warn(line):
+                console.print(f"[yellow]Warning: Skipping malformed line: "
+                              f"{line}[/yellow]")
+
+            matrix = GenomeMatrix.from_rows(
+                count_entries(iter_entries(args.input, warn),
+                              args.processes, args.k), args.k)
+        else:
+            matrix = GenomeMatrix.load(args.input, args.k)
+    except FileNotFoundError as e:
+        console.print(f"[red]Error: No such file: '{e.filename}'[/red]",
+                      soft_wrap=True)
+        return 1
+    except (ValueError, RuntimeError) as e:
+        # Bad cells are reported as "path, line N, column 'X': ..."
+        console.print(f"[red]Error: {e}[/red]", soft_wrap=True)
+        return 1
+    if not len(matrix):
+        console.print(f"[red]Error: No genomes in '{args.input}'[/red]")
+        return 1
+
+    summary = GenomeSummary(matrix, args.max_n, args.complete_length,
+                            args.outliers, args.iqr_factor, args.z)
+    print_summary(summary, console)
+    if args.stats:
+        summary.write_statistics(args.stats)
+    for path, mask in ((args.partial, summary.partial),
+                       (args.complete, summary.complete),
+                       (args.cleaned, summary.cleaned)):
+        if path:
+            count = summary.write_rows(path, mask, args.format)
+            console.print(f"[cyan]Wrote {count} rows to {path}[/cyan]")
+    if args.plot:
+        try:
+            summary.plot(args.plot)
+        except (RuntimeError, ValueError) as e:
+            console.print(f"[red]Error: {e}[/red]", soft_wrap=True)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
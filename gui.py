@@ -1,9 +1,18 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import threading
+import queue
 import webbrowser
-from blocked import check_blocked_websites
+from concurrent.futures import ThreadPoolExecutor
+from blocked import DOMAINS_TO_CHECK
 from dns_utils import dns_analyzer
+from scanner import get_default_engine, submit_coroutine
+
+
+POLL_INTERVAL_MS = 50
+MAX_ROWS_PER_TICK = 500
+
+# Put on a job's queue after its last result
+_DONE = object()
 
 
 class WebsiteAnalysisTool:
@@ -17,9 +26,53 @@ class WebsiteAnalysisTool:
         style.configure('TButton', padding=5, font=('Arial', 10))
         style.configure('Header.TLabel', font=('Arial', 14, 'bold'))
 
+        # Slow work runs off the Tk thread; results come back via a queue
+        self.executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="gui-worker")
+        self.job = None
+        self.poll_id = None
+
         self.create_main_screen()
 
+    def cancel_job(self):
+        """Stop the running job, if any, and forget its pending results"""
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+        if self.poll_id is not None:
+            self.root.after_cancel(self.poll_id)
+            self.poll_id = None
+
+    def drain(self, results, handle_batch, finished):
+        """
+        Pull up to MAX_ROWS_PER_TICK results off the queue and hand them to
+        `handle_batch` in one go, then reschedule until the job is done.
+        """
+        batch = []
+        done = False
+        while len(batch) < MAX_ROWS_PER_TICK:
+            try:
+                item = results.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                done = True
+                break
+            batch.append(item)
+
+        if batch:
+            handle_batch(batch)
+        if done:
+            self.job = None
+            self.poll_id = None
+            finished()
+        else:
+            self.poll_id = self.root.after(
+                POLL_INTERVAL_MS, self.drain, results, handle_batch, finished)
+
     def create_main_screen(self):
+        self.cancel_job()
+
         # Clear existing widgets
         for widget in self.root.winfo_children():
             widget.destroy()
@@ -69,7 +122,12 @@ class WebsiteAnalysisTool:
         text += "=" * 50 + "\n\n"
 
         text += f"IP Address: {dns_info['ip_address']}\n"
-        text += f"Ping Time: {dns_info['ping_time']} ms\n\n"
+        text += f"Ping Time: {dns_info['ping_time']} ms\n"
+        latency = dns_info.get('latency')
+        if latency and latency['avg'] is not None:
+            text += (f"Latency: min {latency['min']} / avg {latency['avg']} / "
+                     f"p95 {latency['p95']} ms, jitter {latency['jitter']} ms\n")
+        text += "\n"
 
         for record_type, records in dns_info['records'].items():
             text += f"{record_type} Records:\n"
@@ -85,6 +143,8 @@ class WebsiteAnalysisTool:
         return text
 
     def show_domain_screen(self):
+        self.cancel_job()
+
         # Clear main screen
         for widget in self.root.winfo_children():
             widget.destroy()
@@ -117,40 +177,54 @@ class WebsiteAnalysisTool:
         )
         result_text.pack(pady=20, padx=20)
 
-        def fetch_dns_info():
-            domain = domain_entry.get().strip()
-            if not domain:
-                messagebox.showerror("Error", "Please enter a domain name")
-                return
-
+        def show_dns_info(batch):
+            domain, (success, dns_info) = batch[-1]
+            check_btn.config(state=tk.NORMAL)
             result_text.delete(1.0, tk.END)
-            result_text.insert(
-                tk.END, f"Fetching information for {domain}...\n\n")
-            result_text.update()
-
-            # Get DNS information
-            success, dns_info = dns_analyzer.get_dns_info(domain)
             if success:
-                result_text.delete(1.0, tk.END)
                 result_text.insert(
                     tk.END, self.format_dns_info(domain, dns_info))
                 if messagebox.askyesno("Open Website",
                                        f"Would you like to open {domain} in browser?"):
                     webbrowser.open(f"http://{domain}")
             else:
-                result_text.delete(1.0, tk.END)
                 result_text.insert(
                     tk.END, f"Failed to fetch DNS information for {domain}")
 
+        def fetch_dns_info():
+            domain = domain_entry.get().strip()
+            if not domain:
+                messagebox.showerror("Error", "Please enter a domain name")
+                return
+
+            self.cancel_job()
+            result_text.delete(1.0, tk.END)
+            result_text.insert(
+                tk.END, f"Fetching information for {domain}...\n\n")
+            check_btn.config(state=tk.DISABLED)
+
+            # Get DNS information on a worker thread
+            results = queue.Queue()
+
+            def work():
+                try:
+                    results.put((domain, dns_analyzer.get_dns_info(domain)))
+                finally:
+                    results.put(_DONE)
+
+            self.job = self.executor.submit(work)
+            self.drain(results, show_dns_info, lambda: None)
+
         # Buttons frame
         button_frame = ttk.Frame(self.root)
         button_frame.pack(pady=10)
 
-        ttk.Button(
+        check_btn = ttk.Button(
             button_frame,
             text="Check Domain",
             command=fetch_dns_info
-        ).pack(side=tk.LEFT, padx=5)
+        )
+        check_btn.pack(side=tk.LEFT, padx=5)
 
         ttk.Button(
             button_frame,
@@ -159,49 +233,86 @@ class WebsiteAnalysisTool:
         ).pack(side=tk.LEFT, padx=5)
 
     def show_blocked_sites(self):
+        self.cancel_job()
+
         for widget in self.root.winfo_children():
             widget.destroy()
 
         ttk.Label(self.root, text="Blocked Websites",
                   style='Header.TLabel').pack(pady=20)
 
+        domains = list(DOMAINS_TO_CHECK)
+        progress_label = ttk.Label(
+            self.root, text=f"Checked 0 of {len(domains)} websites...")
+        progress_label.pack()
+        progress = ttk.Progressbar(
+            self.root, length=400, maximum=len(domains), mode='determinate')
+        progress.pack(pady=5)
+
         result_text = scrolledtext.ScrolledText(
             self.root, height=20, width=70, font=('Courier', 10))
         result_text.pack(pady=20, padx=20)
-
-        blocked_sites = check_blocked_websites()
-        result_text.delete(1.0, tk.END)
-        if blocked_sites:
-            for site_info in blocked_sites:
-                result_text.insert(tk.END, f"{site_info['domain']}: {
-                                   site_info['status']}\nDetails: {site_info['details']}\n\n")
-        else:
-            result_text.insert(tk.END, "No blocked websites found.")
+        result_text.tag_config("Accessible", foreground="green")
+        result_text.tag_config("Blocked", foreground="red")
+        result_text.tag_config("Error", foreground="red")
+
+        counts = {"checked": 0, "blocked": 0}
+
+        def add_rows(batch):
+            # One insert call per batch keeps thousands of rows smooth
+            chunks = []
+            for site_info in batch:
+                status = site_info['status']
+                chunks += [f"{site_info['domain']}: ", (),
+                           status, (status,),
+                           f"\nDetails: {site_info['details']}\n\n", ()]
+                if status != "Accessible":
+                    counts["blocked"] += 1
+            result_text.insert(tk.END, *chunks)
+            result_text.see(tk.END)
+            counts["checked"] += len(batch)
+            progress['value'] = counts["checked"]
+            progress_label.config(
+                text=f"Checked {counts['checked']} of {len(domains)} websites...")
+
+        def finished():
+            cancel_btn.config(state=tk.DISABLED)
+            progress_label.config(
+                text=f"Scan completed: {counts['checked']} checked, "
+                     f"{counts['blocked']} blocked or unreachable")
+            if not counts["blocked"]:
+                result_text.insert(tk.END, "No blocked websites found.")
+
+        def cancel():
+            self.cancel_job()
+            cancel_btn.config(state=tk.DISABLED)
+            progress_label.config(
+                text=f"Scan cancelled after {counts['checked']} of "
+                     f"{len(domains)} websites")
 
         button_frame = ttk.Frame(self.root)
         button_frame.pack(pady=10)
 
+        cancel_btn = ttk.Button(button_frame, text="Cancel", command=cancel)
+        cancel_btn.pack(side=tk.LEFT, padx=5)
+
         ttk.Button(button_frame, text="Back to Main Menu",
                    command=self.create_main_screen).pack(side=tk.LEFT, padx=5)
 
-        # Check for blocked websites
-        blocked_sites = check_blocked_websites()
-        result_text.delete(1.0, tk.END)
-        if blocked_sites:
-            for site in blocked_sites:
-                result_text.insert(tk.END, f"- {site}\n")
-        else:
-            result_text.insert(tk.END, "No blocked websites found.")
+        # Check for blocked websites on the scan loop; each result is queued
+        # as soon as it finishes and drained by the Tk loop
+        results = queue.Queue()
+        engine = get_default_engine()
 
-        # Buttons frame
-        button_frame = ttk.Frame(self.root)
-        button_frame.pack(pady=10)
+        async def scan():
+            try:
+                async for result in engine.scan(domains):
+                    results.put(result)
+            finally:
+                results.put(_DONE)
 
-        ttk.Button(
-            button_frame,
-            text="Back to Main Menu",
-            command=self.create_main_screen
-        ).pack(side=tk.LEFT, padx=5)
+        self.job = submit_coroutine(scan())
+        self.drain(results, add_rows, finished)
 
 
 # Only create root window if running directly
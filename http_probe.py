@@ -0,0 +1,295 @@
+import asyncio
+import ssl
+import time
+from urllib.parse import urljoin, urlsplit
+
+from adaptive import AdaptiveTimeouts, target_network
+
+
+DEFAULT_MAX_BODY = 16 * 1024
+DEFAULT_MAX_IDLE = 4
+DEFAULT_MAX_IDLE_TOTAL = 256
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MIN_PROBE_TIMEOUT = 0.5
+MAX_HEADER_BYTES = 64 * 1024
+
+
+class ProbeError(Exception):
+    """Raised when a host cannot be reached or answers with garbage"""
+
+
+class ProbeTimeout(ProbeError):
+    """Raised when a probe does not finish within the prober's timeout"""
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class _Connection:
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def close(self):
+        self.writer.close()
+
+
+class HTTPProber:
+    """
+    Reachability prober with a pool of keep-alive connections.
+
+    Each probe sends HEAD first and falls back to GET when the server
+    rejects HEAD.  GET bodies are read up to `max_body` bytes, and the
+    connection is dropped rather than drained past that.  Connect, TLS and
+    time-to-first-byte are timed separately for every probe.  At most
+    `max_idle_total` idle connections are kept across all hosts; the
+    oldest host's connections are closed first, so a sweep over many
+    distinct hosts does not pile up open sockets.
+
+    With `adaptive` (the default), a probe waits for the learned timeout of
+    the target's /24 (or /48) network rather than a fixed `timeout`, and a
+    probe that times out is retried up to `retries` times with a doubled
+    timeout.  Earlier attempts stay live, so a slow answer still counts,
+    and the last attempt waits until `timeout` is used up.  The learned
+    state is in `self.timeouts`.
+    """
+
+    def __init__(self, timeout=3, max_body=DEFAULT_MAX_BODY,
+                 max_idle_per_host=DEFAULT_MAX_IDLE,
+                 max_idle_total=DEFAULT_MAX_IDLE_TOTAL, max_redirects=5,
+                 verify_tls=True, adaptive=True, retries=1):
+        self.timeout = timeout
+        self.retries = retries
+        self.timeouts = AdaptiveTimeouts(
+            initial=timeout, min_timeout=min(MIN_PROBE_TIMEOUT, timeout),
+            max_timeout=timeout) if adaptive else None
+        self.max_body = max_body
+        self.max_idle_per_host = max_idle_per_host
+        self.max_idle_total = max_idle_total
+        self.max_redirects = max_redirects
+        self.ssl_context = ssl.create_default_context()
+        if not verify_tls:
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        self._idle = {}
+        self._idle_count = 0
+
+    def _take_idle(self, key):
+        idle = self._idle.get(key)
+        if not idle:
+            return None
+        conn = idle.pop()
+        self._idle_count -= 1
+        if not idle:
+            del self._idle[key]
+        return conn
+
+    async def _connect(self, scheme, host, port, ip, timings):
+        key = (scheme, host, port)
+        conn = self._take_idle(key)
+        while conn is not None:
+            if not conn.reader.at_eof() and not conn.writer.is_closing():
+                conn.reused = True
+                return conn
+            conn.close()
+            conn = self._take_idle(key)
+
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection(
+                ip or host, port, limit=MAX_HEADER_BYTES)
+        except OSError as e:
+            raise ProbeError(f"connect failed: {e}") from e
+        timings['connect_ms'] += _ms(time.perf_counter() - start)
+
+        if scheme == 'https':
+            start = time.perf_counter()
+            try:
+                await writer.start_tls(self.ssl_context, server_hostname=host)
+            except (OSError, ssl.SSLError) as e:
+                writer.close()
+                raise ProbeError(f"TLS handshake failed: {e}") from e
+            except BaseException:
+                writer.close()
+                raise
+            timings['tls_ms'] += _ms(time.perf_counter() - start)
+
+        return _Connection(key, reader, writer)
+
+    def _release(self, conn):
+        idle = self._idle.get(conn.key, ())
+        if len(idle) >= self.max_idle_per_host or self.max_idle_total <= 0:
+            conn.close()
+            return
+        while self._idle_count >= self.max_idle_total:
+            # Hosts are kept in insertion order; evict the oldest one's
+            oldest = next(iter(self._idle))
+            self._take_idle(oldest).close()
+        self._idle.setdefault(conn.key, []).append(conn)
+        self._idle_count += 1
+
+    async def _request(self, conn, method, host, path, timings):
+        """Send one request and return (status, headers, body_bytes, reusable)"""
+        conn.writer.write(
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            "User-Agent: Mozilla/5.0 (compatible; WebsiteAnalysisTool)\r\n"
+            "Accept: */*\r\n"
+            "Connection: keep-alive\r\n\r\n".encode('latin-1'))
+        start = time.perf_counter()
+        try:
+            await conn.writer.drain()
+            first = await conn.reader.readexactly(1)
+            timings['ttfb_ms'] += _ms(time.perf_counter() - start)
+            head = first + await conn.reader.readuntil(b"\r\n\r\n")
+        except (OSError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError) as e:
+            raise ProbeError(f"no response: {e}") from e
+
+        lines = head.decode('latin-1').split("\r\n")
+        try:
+            version, status = lines[0].split(" ", 2)[:2]
+            status = int(status)
+        except ValueError:
+            raise ProbeError(f"bad status line: {lines[0][:80]!r}")
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+
+        reusable = (version == "HTTP/1.1"
+                    and headers.get('connection', '').lower() != 'close')
+        body = 0
+        if method == 'GET' and status not in (204, 304) and status >= 200:
+            length = headers.get('content-length', '')
+            if length.isdigit() and int(length) <= self.max_body:
+                body = int(length)
+                try:
+                    await conn.reader.readexactly(body)
+                except (OSError, asyncio.IncompleteReadError):
+                    reusable = False
+            else:
+                # Unknown or oversized body: the status is all we need,
+                # so hang up instead of downloading it
+                reusable = False
+        return status, headers, body, reusable
+
+    async def _fetch(self, method, url, ip, timings):
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        host = parts.hostname
+        port = parts.port or (443 if scheme == 'https' else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        conn = await self._connect(scheme, host, port, ip, timings)
+        try:
+            result = await self._request(conn, method, host, path, timings)
+        except ProbeError:
+            conn.close()
+            if not conn.reused:
+                raise
+            # The server dropped an idle connection; retry on a fresh one
+            conn = await self._connect(scheme, host, port, ip, timings)
+            try:
+                result = await self._request(conn, method, host, path, timings)
+            except BaseException:
+                conn.close()
+                raise
+        except BaseException:
+            conn.close()
+            raise
+
+        status, headers, body, reusable = result
+        if reusable:
+            self._release(conn)
+        else:
+            conn.close()
+        return status, headers, body
+
+    async def _probe(self, url, ip):
+        timings = {'connect_ms': 0.0, 'tls_ms': 0.0, 'ttfb_ms': 0.0}
+        method = 'HEAD'
+        total = 0
+        for _ in range(self.max_redirects + 1):
+            status, headers, body = await self._fetch(method, url, ip, timings)
+            if method == 'HEAD' and status >= 400:
+                method = 'GET'
+                status, headers, body = await self._fetch(
+                    method, url, ip, timings)
+            total += body
+            location = headers.get('location')
+            if status not in REDIRECT_CODES or not location:
+                break
+            next_url = urljoin(url, location)
+            if urlsplit(next_url).hostname != urlsplit(url).hostname:
+                ip = None
+            url = next_url
+
+        return {
+            'status_code': status,
+            'url': url,
+            'method': method,
+            'bytes': total,
+            **timings,
+        }
+
+    async def probe(self, url, ip=None):
+        """
+        Probe `url`, following redirects, and return its final status code
+        with timings.  `ip` skips a second name lookup for the first host.
+        Raises ProbeError if the host cannot be reached in time.
+        """
+        if self.timeouts is None:
+            try:
+                return await asyncio.wait_for(self._probe(url, ip),
+                                              self.timeout)
+            except asyncio.TimeoutError as e:
+                raise ProbeTimeout("timed out") from e
+
+        key = target_network(ip) if ip else urlsplit(url).hostname
+        deadline = time.monotonic() + self.timeouts.max_timeout
+        attempts = {}
+        try:
+            for attempt in range(self.retries + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                task = asyncio.ensure_future(self._probe(url, ip))
+                attempts[task] = time.monotonic()
+                # Earlier attempts keep running, and the last one waits for
+                # whatever is left of the overall timeout
+                wait = remaining if attempt == self.retries else min(
+                    self.timeouts.timeout(key, attempt), remaining)
+                done, _ = await asyncio.wait(
+                    attempts, timeout=wait,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.timeouts.timed_out(key)
+                    continue
+                # Prefer an answer over an error when both are in
+                task = min(done, key=lambda task: task.exception() is not None)
+                result = task.result()
+                self.timeouts.observe(key, time.monotonic() - attempts[task])
+                return result
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Mark errors of losing attempts as retrieved
+                    task.exception()
+        raise ProbeTimeout("timed out")
+
+    def close(self):
+        """Close every idle pooled connection"""
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
+        self._idle_count = 0
@@ -0,0 +1,145 @@
+import itertools
+
+import numpy as np
+
+
+NUCLEOTIDES = 'ATGC'
+N_CODE = 4
+INVALID = 5
+
+# Byte -> base code.  A, C, G, T are coded 0-3 in alphabetical order so a
+# k-mer's base-4 value is its index in the sorted column list; N is N_CODE
+# and any other byte INVALID.  Lower case counts like upper case, as the
+# notebook upper-cases sequences before counting.
+_CODES = np.full(256, INVALID, dtype=np.uint8)
+for _code, _base in enumerate('ACGTN'):
+    _CODES[ord(_base)] = _CODES[ord(_base.lower())] = _code
+
+
+def kmer_columns(k=3):
+    """
+    Every k-mer over A, T, G, C in sorted order; for k=3 this is the
+    notebook's generate_triplet_columns().
+    """
+    return sorted(''.join(combo)
+                  for combo in itertools.product(NUCLEOTIDES, repeat=k))
+
+
+def encode(sequence):
+    """uint8 base codes of a str or bytes sequence (see _CODES)"""
+    if isinstance(sequence, str):
+        # Non-ASCII characters become '?', which is invalid, one per char
+        sequence = sequence.encode('ascii', 'replace')
+    return _CODES[np.frombuffer(sequence, dtype=np.uint8)]
+
+
+def _window_codes(codes, k):
+    """
+    Base-4 value of every length-k window (len(codes) - k + 1 of them),
+    with windows holding N or an invalid base set to 4**k, so one
+    bincount can count and discard them together.
+    """
+    size = 4 ** k
+    dtype = np.uint16 if size < 1 << 16 else \
+        np.uint32 if size < 1 << 32 else np.uint64
+    valid = codes < N_CODE
+    clean = np.where(valid, codes, 0).astype(dtype)
+    windows = len(codes) - k + 1
+    values = clean[:windows].copy()
+    whole = valid[:windows].copy()
+    for offset in range(1, k):
+        values <<= 2
+        values |= clean[offset:offset + windows]
+        whole &= valid[offset:offset + windows]
+    values[~whole] = size
+    return values
+
+
+def _bincount(values, size):
+    return np.bincount(values, minlength=size + 1)[:size]
+
+
+def count_kmers(sequence, k=3):
+    """
+    Count the k-mers of one sequence like the notebook's process_sequence:
+    returns (counts, n_count, counted_chars), where counts[i] belongs to
+    kmer_columns(k)[i] and windows holding N or any other non-ATGC
+    character are skipped.
+    """
+    codes = encode(sequence)
+    n_count = int(np.count_nonzero(codes == N_CODE))
+    counted_chars = int(np.count_nonzero(codes < N_CODE))
+    if len(codes) < k:
+        return np.zeros(4 ** k, dtype=np.int64), n_count, counted_chars
+    counts = _bincount(_window_codes(codes, k), 4 ** k)
+    return counts, n_count, counted_chars
+
+
+def count_kmers_many(sequences, k=3):
+    """
+    count_kmers() for a batch: the sequences are joined with an invalid
+    separator so no window spans two of them, encoded and windowed in one
+    pass, and each sequence's slice of the windows is bincounted.
+
+    Returns (counts, n_counts, counted_chars, lengths): a (len, 4**k)
+    matrix in kmer_columns(k) order and three per-sequence arrays.
+    """
+    encoded = [sequence.encode('ascii', 'replace')
+               if isinstance(sequence, str) else bytes(sequence)
+               for sequence in sequences]
+    total = len(encoded)
+    size = 4 ** k
+    lengths = np.array([len(data) for data in encoded], dtype=np.int64)
+    counts = np.zeros((total, size), dtype=np.int64)
+    if not total:
+        empty = np.zeros(0, dtype=np.int64)
+        return counts, empty, empty, lengths
+
+    # Every sequence, the last one included, is followed by a separator,
+    # so no segment is empty (which reduceat would get wrong) and every
+    # start index lies inside `codes`
+    codes = encode(b'\0'.join(encoded) + b'\0')
+    starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+    n_counts = np.add.reduceat((codes == N_CODE).astype(np.int64), starts)
+    counted_chars = np.add.reduceat((codes < N_CODE).astype(np.int64),
+                                    starts)
+
+    if len(codes) >= k:
+        values = _window_codes(codes, k)
+        for i, (start, length) in enumerate(zip(starts.tolist(),
+                                                lengths.tolist())):
+            end = start + length - k + 1
+            if end > start:
+                counts[i] = _bincount(values[start:end], size)
+    return counts, n_counts, counted_chars, lengths
+
+
+def triplet_rows(entries, k=3):
+    """
+    Turn parsed genome entries (dicts with 'Page Number', 'Item Number',
+    'Genome Name', 'Expected Character Count' and 'Sequence', as returned
+    by the notebook's parse_text_file) into the rows process_genome_sequences
+    writes, counting the whole batch at once.
+    """
+    columns = kmer_columns(k)
+    counts, n_counts, counted_chars, lengths = count_kmers_many(
+        [entry['Sequence'] for entry in entries], k)
+    rows = []
+    for i, entry in enumerate(entries):
+        length = int(lengths[i])
+        n_count = int(n_counts[i])
+        row = {
+            'Page Number': entry['Page Number'],
+            'Item Number': entry['Item Number'],
+            'Genome Name': entry['Genome Name'],
+            'Expected Character Count': entry['Expected Character Count'],
+            'Counted Character Count': int(counted_chars[i]),
+            'Difference': entry['Expected Character Count']
+            - int(counted_chars[i]),
+            'N Count': n_count,
+            'N Percentage': round(n_count / length * 100, 2)
+            if length else 0.0,
+        }
+        row.update(zip(columns, counts[i].tolist()))
+        rows.append(row)
+    return rows
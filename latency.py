@@ -0,0 +1,198 @@
+import asyncio
+import ipaddress
+import itertools
+import os
+import socket
+import struct
+import time
+
+from dns_query import get_default_pool
+from scanner import bounded_map, run_coroutine
+
+
+DEFAULT_PORTS = (443, 80)
+DEFAULT_SAMPLES = 4
+DEFAULT_TIMEOUT = 2
+
+# Echo identifiers for raw sockets, which see every reply on the host: one
+# per sample, so concurrent probes in this process never match each other's
+_idents = itertools.count(os.getpid())
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def summarize(samples, sent, method, port=None):
+    """Reduce RTT samples (ms) to min/avg/p95/jitter/loss numbers"""
+    stats = {'method': method, 'port': port, 'sent': sent,
+             'received': len(samples),
+             'loss': round(1 - len(samples) / sent, 3) if sent else 1.0,
+             'min': None, 'avg': None, 'p95': None, 'jitter': None}
+    if not samples:
+        return stats
+    ordered = sorted(samples)
+    rank = max(0, -(-95 * len(ordered) // 100) - 1)
+    stats['min'] = round(ordered[0], 2)
+    stats['avg'] = round(sum(samples) / len(samples), 2)
+    stats['p95'] = round(ordered[rank], 2)
+    # Mean difference between consecutive samples, as in RFC 3550
+    diffs = [abs(b - a) for a, b in zip(samples, samples[1:])]
+    stats['jitter'] = round(sum(diffs) / len(diffs), 2) if diffs else 0.0
+    return stats
+
+
+class LatencyProber:
+    """
+    In-process latency prober.
+
+    By default every sample is one TCP handshake to port 443, falling back
+    to 80; a refused connection still counts, since the RST took a full
+    round trip.  With method="icmp" echo requests are used instead when an
+    ICMP socket can be opened (unprivileged ping sockets or root), falling
+    back to TCP otherwise.  Samples run concurrently, and probe_many()
+    measures many hosts without spawning a process per host.
+    """
+
+    def __init__(self, samples=DEFAULT_SAMPLES, timeout=DEFAULT_TIMEOUT,
+                 ports=DEFAULT_PORTS, method='tcp', concurrency=200):
+        self.samples = samples
+        self.timeout = timeout
+        self.ports = ports
+        self.method = method
+        self.concurrency = concurrency
+
+    async def _address(self, host):
+        try:
+            ipaddress.ip_address(host)
+            return host
+        except ValueError:
+            pass
+        answer = await get_default_pool().resolve(host, 'A', self.timeout)
+        return str(answer[0])
+
+    async def _tcp_sample(self, address, port):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET6 if ':' in address
+                             else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                loop.sock_connect(sock, (address, port)), self.timeout)
+        except ConnectionRefusedError:
+            pass
+        except (OSError, asyncio.TimeoutError):
+            return None
+        finally:
+            sock.close()
+        return (time.perf_counter() - start) * 1000
+
+    def _icmp_socket(self):
+        for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+            try:
+                sock = socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+            except (PermissionError, OSError):
+                continue
+            sock.setblocking(False)
+            return sock
+        return None
+
+    async def _icmp_sample(self, address, sequence):
+        sock = self._icmp_socket()
+        if sock is None:
+            raise PermissionError("ICMP sockets are not available")
+        loop = asyncio.get_running_loop()
+        raw = sock.type == socket.SOCK_RAW
+        ident = next(_idents) & 0xFFFF
+        header = struct.pack('!BBHHH', 8, 0, 0, ident, sequence)
+        payload = struct.pack('!d', time.time())
+        packet = struct.pack('!BBHHH', 8, 0, _checksum(header + payload),
+                             ident, sequence) + payload
+
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        try:
+            await loop.sock_sendto(sock, packet, (address, 0))
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                data, source = await asyncio.wait_for(
+                    loop.sock_recvfrom(sock, 1024), remaining)
+                if source[0] != address:
+                    continue
+                if raw:
+                    data = data[(data[0] & 0x0F) * 4:]
+                if len(data) < 8 or data[0] != 0:
+                    continue
+                reply_ident, reply_sequence = struct.unpack('!HH', data[4:8])
+                # Ping sockets rewrite the identifier and only see their own
+                # replies, so there the sequence is enough
+                if reply_sequence == sequence and (
+                        not raw or reply_ident == ident):
+                    return (time.perf_counter() - start) * 1000
+        except (OSError, asyncio.TimeoutError):
+            return None
+        finally:
+            sock.close()
+
+    async def measure(self, host):
+        """Return RTT statistics for one host"""
+        try:
+            address = await self._address(host)
+        except Exception:
+            return summarize([], self.samples, self.method)
+
+        if self.method == 'icmp' and self._icmp_available():
+            results = await asyncio.gather(
+                *(self._icmp_sample(address, seq)
+                  for seq in range(1, self.samples + 1)))
+            return summarize([r for r in results if r is not None],
+                             self.samples, 'icmp')
+
+        stats = None
+        for port in self.ports:
+            results = await asyncio.gather(
+                *(self._tcp_sample(address, port)
+                  for _ in range(self.samples)))
+            stats = summarize([r for r in results if r is not None],
+                              self.samples, 'tcp', port)
+            if stats['received']:
+                break
+        return stats
+
+    def _icmp_available(self):
+        sock = self._icmp_socket()
+        if sock is None:
+            return False
+        sock.close()
+        return True
+
+    async def measure_many(self, hosts):
+        """Yield (host, stats) for many hosts with bounded concurrency"""
+        async def one(host):
+            return host, await self.measure(host)
+
+        async for result in bounded_map(one, hosts, self.concurrency):
+            yield result
+
+
+def measure_latency(host, **options):
+    """Synchronous helper returning RTT statistics for one host"""
+    return run_coroutine(LatencyProber(**options).measure(host))
+
+
+def measure_latency_many(hosts, **options):
+    """Synchronous helper returning {host: stats} for many hosts"""
+    prober = LatencyProber(**options)
+
+    async def collect():
+        return {host: stats async for host, stats in prober.measure_many(hosts)}
+
+    return run_coroutine(collect())
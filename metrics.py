@@ -0,0 +1,322 @@
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# Bucket upper bounds in seconds, from a local cache hit to a slow WHOIS
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value
+                          in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """A metric family; children are created per distinct label values"""
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Return the child for these label values, creating it on first use"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self, values, child):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# TYPE {self.name} {self.kind}",
+                 f"# HELP {self.name} {self.help}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self, values, child):
+        return [f"{self.name}_total"
+                f"{_format_labels(self.labelnames, values)} {child.value}"]
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+    @contextmanager
+    def track(self):
+        """Count the body of a with-block as in progress"""
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def track(self):
+        return self.labels().track()
+
+    def _samples(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} "
+                f"{child.value}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        """Observe how long the body of a with-block takes"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """
+    Fixed-bucket histogram.  Observing is one bisect and three additions
+    under a lock, so it is cheap enough to call for every probe.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self, values, child):
+        with child._lock:
+            counts = list(child.counts)
+            total, count = child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{self.name}_bucket"
+                         f"{_format_labels(self.labelnames, values, [('le', le)])}"
+                         f" {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the OpenMetrics text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def add_collector(self, method):
+        """
+        Call the bound `method` before every render so it can refresh
+        gauges.  Only a weak reference is kept, so the owner can go away.
+        """
+        with self._lock:
+            self._collectors.append(weakref.WeakMethod(method))
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            self._collectors = [ref for ref in self._collectors
+                                if ref() is not None]
+            collectors = [ref() for ref in self._collectors]
+        for collect in collectors:
+            if collect is not None:
+                collect()
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Write the current values to `path`, replacing it atomically"""
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(temporary, path)
+
+    def export_textfile(self, path, interval=15):
+        """Rewrite the textfile every `interval` seconds from a daemon thread"""
+        def run():
+            while True:
+                self.write_textfile(path)
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="metrics-textfile",
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serve /metrics over HTTP from a daemon thread and return the server.
+        Only local clients can connect unless another `host` is given.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http",
+                         daemon=True).start()
+        return server
+
+
+# Create a global instance
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    'scan_stage_seconds', 'Time spent in each stage of a check', ['stage'])
+RESOLVER_SECONDS = metrics.histogram(
+    'dns_resolver_seconds', 'DNS lookup time per nameserver', ['resolver'])
+RESULTS = metrics.counter(
+    'scan_results', 'Finished checks by status', ['status'])
+TIMEOUTS = metrics.counter(
+    'scan_timeouts', 'Stages that ran out of time', ['stage'])
+IN_FLIGHT = metrics.gauge(
+    'scan_in_flight', 'Checks currently in progress')
+ADAPTIVE_TIMEOUT = metrics.gauge(
+    'adaptive_timeout_seconds', 'Learned timeout per resolver or probe pool',
+    ['kind', 'key'])
+DNS_CACHE_LOOKUPS = metrics.counter(
+    'dns_cache_lookups', 'Shared DNS cache lookups by result', ['result'])
+DNS_CACHE_EVICTIONS = metrics.counter(
+    'dns_cache_evictions', 'Answers evicted to keep the DNS cache in size')
+DNS_CACHE_ENTRIES = metrics.gauge(
+    'dns_cache_entries', 'Answers in the shared DNS cache', ['kind'])
+DNS_CACHE_BYTES = metrics.gauge(
+    'dns_cache_bytes', 'Estimated size of the shared DNS cache')
+
+
+def record_timings(timings):
+    """Feed a result's `timings` dict (stage_ms: value) into STAGE_SECONDS"""
+    for key, value in timings.items():
+        if value is not None and key.endswith('_ms'):
+            STAGE_SECONDS.labels(key[:-3]).observe(value / 1000)
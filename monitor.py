@@ -0,0 +1,207 @@
+import asyncio
+import heapq
+import random
+import time
+from datetime import datetime, timezone
+
+from defaults import DEFAULT_INTERVAL
+from scanner import ScanEngine
+
+
+DEFAULT_MIN_INTERVAL = 30
+DEFAULT_MAX_INTERVAL = 3600
+DEFAULT_JITTER = 0.1
+# Identical failing results after which a failure counts as settled
+STABLE_CHECKS = 3
+
+# Probe budget relative to the checks the current schedule asks for, so
+# jitter and bursts of due domains do not build up a backlog
+RATE_HEADROOM = 1.25
+
+
+class TokenBucket:
+    """
+    Token bucket for a single consumer.  Waits are stretched or shortened
+    by up to `jitter` so probes do not line up on exact ticks.
+    """
+
+    def __init__(self, rate, burst=1, jitter=DEFAULT_JITTER):
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def take(self):
+        """Wait until a token is available and consume it"""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(
+                wait * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+class _DomainState:
+    __slots__ = ('status', 'details', 'interval', 'checks', 'streak',
+                 'changed_at')
+
+    def __init__(self, interval):
+        self.status = None
+        self.details = None
+        self.interval = interval
+        self.checks = 0
+        self.streak = 0
+        self.changed_at = None
+
+
+class Monitor:
+    """
+    Re-check a set of domains forever and report only status transitions.
+
+    Every domain starts at `interval` seconds between checks.  A domain
+    whose status just changed drops to `min_interval`.  A fresh failure
+    has its interval halved to confirm it, but after STABLE_CHECKS
+    identical failures it backs off again by half per check, up to
+    `interval`.  One that stays accessible has it grown by half, up to
+    `max_interval`.  Probes are released by a jittered token bucket whose
+    rate follows the schedule: the sum of every domain's checks per
+    second, so failing domains re-checked every `min_interval` raise it
+    rather than fall behind, and a large set never bursts.  A fixed `rate`
+    overrides this.  `on_transition` is called with a dict holding the
+    domain, its previous and new status, details and a timestamp.
+    `on_result`, if given, sees every result, e.g. to keep a full history
+    in a ResultStore.
+    """
+
+    def __init__(self, domains, on_transition, engine=None,
+                 interval=DEFAULT_INTERVAL, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL, jitter=DEFAULT_JITTER,
+                 concurrency=None, rate=None, on_result=None):
+        self.domains = list(dict.fromkeys(domains))
+        self.on_transition = on_transition
+        self.on_result = on_result
+        self.engine = engine or ScanEngine()
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.concurrency = concurrency or self.engine.concurrency
+        self.fixed_rate = rate
+        self.state = {domain: _DomainState(interval)
+                      for domain in self.domains}
+        # Checks per second the schedule asks for: sum(1 / interval)
+        self._demand = len(self.domains) / interval
+        self._bucket = None
+        self._due = []
+
+    @property
+    def rate(self):
+        """Probes per second the token bucket currently releases"""
+        if self.fixed_rate:
+            return self.fixed_rate
+        return max(1.0, self._demand * RATE_HEADROOM)
+
+    def _jittered(self, seconds):
+        return seconds * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _schedule(self, domain, delay):
+        heapq.heappush(self._due, (time.monotonic() + delay, domain))
+
+    def _next_interval(self, state, changed):
+        if changed:
+            return self.min_interval
+        if state.status == "Accessible":
+            return min(self.max_interval, state.interval * 1.5)
+        if state.streak < STABLE_CHECKS:
+            return max(self.min_interval, state.interval / 2)
+        # A settled failure: only a fresh transition earns min_interval
+        return max(state.interval,
+                   min(self.interval, state.interval * 1.5))
+
+    def update(self, result):
+        """Fold one result into the domain's state; return a transition or None"""
+        state = self.state[result["domain"]]
+        previous = state.status
+        changed = previous is not None and previous != result["status"]
+        state.status = result["status"]
+        state.details = result["details"]
+        state.checks += 1
+        state.streak = 1 if previous != result["status"] else state.streak + 1
+        interval = self._next_interval(state, changed)
+        if interval != state.interval:
+            self._demand += 1 / interval - 1 / state.interval
+            state.interval = interval
+            if self._bucket is not None:
+                self._bucket.rate = self.rate
+        if not changed:
+            return None
+        state.changed_at = time.time()
+        return {
+            "time": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "domain": result["domain"],
+            "previous": previous,
+            "status": result["status"],
+            "details": result["details"],
+        }
+
+    async def _check(self, domain, limit):
+        try:
+            result = await self.engine.check(domain)
+            if self.on_result is not None:
+                self.on_result(result)
+            transition = self.update(result)
+            if transition is not None:
+                self.on_transition(transition)
+        finally:
+            limit.release()
+            self._schedule(domain,
+                           self._jittered(self.state[domain].interval))
+
+    async def run(self, duration=None):
+        """Check domains until cancelled, or for `duration` seconds"""
+        # Spread the first pass evenly over one interval
+        step = self.interval / max(1, len(self.domains))
+        for i, domain in enumerate(self.domains):
+            self._schedule(domain, self._jittered(i * step) if i else 0)
+
+        bucket = self._bucket = TokenBucket(self.rate, jitter=self.jitter)
+        limit = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        stop_at = time.monotonic() + duration if duration else None
+        try:
+            while stop_at is None or time.monotonic() < stop_at:
+                if not self._due:
+                    # Everything is in flight; wait for a check to reschedule
+                    if not tasks:
+                        break
+                    await asyncio.wait(tasks,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                due, domain = self._due[0]
+                now = time.monotonic()
+                if due > now:
+                    await asyncio.sleep(min(due - now, 1.0))
+                    continue
+                heapq.heappop(self._due)
+                await bucket.take()
+                await limit.acquire()
+                task = asyncio.ensure_future(self._check(domain, limit))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def summary(self):
+        """Return {status: count} over every domain checked at least once"""
+        counts = {}
+        for state in self.state.values():
+            if state.status is not None:
+                counts[state.status] = counts.get(state.status, 0) + 1
+        return counts
@@ -1,25 +1,67 @@
-from rich.console import Console
-from rich.table import Table
-import tkinter as tk
-import webbrowser
 import argparse
-from blocked import check_blocked_websites
-from dns_utils import dns_analyzer
+import sys
+
+# Everything else is imported where it is used, so a single lookup or a
+# cron job does not pay for tkinter, rich, numpy or dnspython it never uses
+from defaults import DEFAULT_CONCURRENCY, DEFAULT_INTERVAL, SHARD_MODES
+from report import OUTPUT_FORMATS
+
+
+def _enricher(enrichment):
+    """IPEnricher built from the `enrichment` options, or None"""
+    if not enrichment:
+        return None
+    from enrichment import IPEnricher
+    return IPEnricher(**enrichment)
+
+
+def _scan_engine(concurrency, enrichment=None):
+    """ScanEngine with an IPEnricher built from `enrichment`, if given"""
+    from scanner import ScanEngine
+    return ScanEngine(concurrency=concurrency, enricher=_enricher(enrichment))
 
 
 class WebsiteAnalyzer:
     def __init__(self):
-        self.console = Console()
+        self._console = None
+
+    @property
+    def console(self):
+        """rich Console, created the first time something is printed"""
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return self._console
 
     def display_dns_info(self, domain, dns_info):
         """Display DNS information in console"""
+        from rich.table import Table
+
         table = Table(title=f"DNS Information for {domain}")
         table.add_column("Property", style="cyan")
         table.add_column("Value", style="green")
 
         table.add_row("IP Address", dns_info['ip_address'])
         table.add_row("Ping Time", f"{dns_info['ping_time']} ms")
+        latency = dns_info.get('latency')
+        if latency and latency['avg'] is not None:
+            table.add_row(
+                "Latency",
+                f"min {latency['min']} / avg {latency['avg']} / "
+                f"p95 {latency['p95']} ms, jitter {latency['jitter']} ms "
+                f"({latency['method']}, loss {latency['loss']:.0%})")
         table.add_row("A Records", "\n".join(dns_info['records']['A']))
+        networks = []
+        for record in dns_info.get('enrichment') or []:
+            line = f"{record['ip']} {record.get('ptr') or '-'}"
+            if record['asn'] is not None:
+                line += (f" AS{record['asn']} {record['as_name']} "
+                         f"({record['country']})")
+            if record['blockpage']:
+                line += f" [red]{record['blockpage']}[/red]"
+            networks.append(line)
+        if networks:
+            table.add_row("Networks", "\n".join(networks))
         table.add_row("CNAME Records", "\n".join(dns_info['records']['CNAME']))
         table.add_row("MX Records", "\n".join(dns_info['records']['MX']))
         table.add_row("NS Records", "\n".join(dns_info['records']['NS']))
@@ -47,7 +89,13 @@ class WebsiteAnalyzer:
 
             match choice:
                 case "1":
-                    check_blocked_websites()
+                    from blocked import check_blocked_websites
+                    from report import results_table
+                    results = check_blocked_websites(show_table=False)
+                    show = input(
+                        "\nShow the full report table? (y/n): ").lower()
+                    if show == 'y':
+                        self.console.print(results_table(results))
                 case "2":
                     self.console.print(
                         "\n[cyan]Enter 'back' to return to main menu[/cyan]")
@@ -59,12 +107,11 @@ class WebsiteAnalyzer:
                             self.console.print(
                                 "[red]Please enter a valid domain name[/red]")
                             continue
-                        success, dns_info = dns_analyzer.get_dns_info(domain)
-                        if success:
-                            self.display_dns_info(domain, dns_info)
+                        if self.lookup(domain):
                             open_browser = input(
                                 "\nWould you like to open this website in browser? (y/n): ").lower()
                             if open_browser == 'y':
+                                import webbrowser
                                 webbrowser.open(f'http://{domain}')
                 case "3":
                     self.run_gui()
@@ -75,8 +122,191 @@ class WebsiteAnalyzer:
                     self.console.print(
                         "[red]Invalid choice. Please enter 1, 2, 3, or 4[/red]")
 
+    def lookup(self, domain):
+        """Show the DNS information for one domain; False if it failed"""
+        from dns_utils import dns_analyzer
+        success, dns_info = dns_analyzer.get_dns_info(domain)
+        if success:
+            self.display_dns_info(domain, dns_info)
+        return success
+
+    def check(self, domains, output_format='jsonl', concurrency=None,
+              enrichment=None):
+        """
+        Check the given domains and write one result per domain to stdout.
+        Returns True if every domain was accessible.
+        """
+        from report import ResultWriter, iter_domains
+        from scanner import run_coroutine, stream_scan
+
+        writer = ResultWriter(sys.stdout, output_format)
+        engine = _scan_engine(concurrency or DEFAULT_CONCURRENCY, enrichment)
+        statuses = []
+
+        def emit(result):
+            statuses.append(result['status'])
+            writer.write(result)
+
+        try:
+            stream_scan(iter_domains(domains), emit, engine)
+        finally:
+            run_coroutine(engine.aclose())
+        return bool(statuses) and all(
+            status == 'Accessible' for status in statuses)
+
+    def run_bulk(self, input_path, output_format='jsonl', output_path=None,
+                 concurrency=None, checkpoint_path=None,
+                 differential=False, processes=1, shard_mode='chunk',
+                 ordered=False, store_path=None, live=None, enrichment=None):
+        """
+        Stream domains from a file or stdin and emit one result per domain.
+        With `checkpoint_path`, domains finished by an earlier run are
+        skipped and only new results are written.  With `differential`,
+        each domain is compared across several resolvers instead.  With
+        more than one process the list is sharded across a process pool,
+        each worker getting an equal share of `concurrency`.  With
+        `store_path`, every result is also appended to a ResultStore.
+        Progress is shown live on stderr when results go elsewhere; `live`
+        forces it on or off.  `enrichment` holds IPEnricher arguments for
+        flagging block-page answers and adding ASN data; differential checks
+        then match answers by ASN.
+        """
+        from contextlib import nullcontext
+        from rich.console import Console
+        from checkpoint import ScanCheckpoint
+        from domains import DomainNormalizer
+        from report import LiveReport, ResultWriter, iter_domains
+        from scanner import run_coroutine, stream_scan
+
+        concurrency = concurrency or DEFAULT_CONCURRENCY
+        source = sys.stdin if input_path == '-' else open(
+            input_path, encoding='utf-8')
+        output = sys.stdout if output_path in (None, '-') else open(
+            output_path, 'w', encoding='utf-8', newline='')
+        if processes > 1:
+            from sharding import ShardedScan
+            engine = None
+            sharded = ShardedScan(processes, shard_mode, ordered,
+                                  concurrency=max(1, concurrency // processes),
+                                  differential=differential,
+                                  enrichment=enrichment)
+        elif differential:
+            from censorship import DifferentialDetector
+            engine = DifferentialDetector(concurrency=concurrency,
+                                          enricher=_enricher(enrichment))
+        else:
+            engine = _scan_engine(concurrency, enrichment)
+        errors = Console(stderr=True)
+        if live is None:
+            live = errors.is_terminal and not (
+                output is sys.stdout and sys.stdout.isatty())
+        report = LiveReport(errors) if live else None
+
+        checkpoint = ScanCheckpoint(checkpoint_path) if checkpoint_path else None
+        store = None
+        if store_path:
+            from result_store import ResultStore
+            store = ResultStore(store_path)
+
+        normalizer = DomainNormalizer()
+        try:
+            writer = ResultWriter(output, output_format)
+            domains = iter_domains(source, normalizer)
+            if checkpoint is not None:
+                domains = checkpoint.pending(domains)
+
+            def emit(result):
+                if checkpoint is not None:
+                    checkpoint.record(result)
+                if store is not None:
+                    store.append(result)
+                writer.write(result)
+                if report is not None:
+                    report.add(result)
+
+            with report or nullcontext():
+                if engine is None:
+                    count = sharded.run(domains, emit)
+                else:
+                    count = stream_scan(domains, emit, engine)
+        finally:
+            if engine is not None:
+                run_coroutine(engine.aclose())
+            if checkpoint is not None:
+                checkpoint.close()
+            if store is not None:
+                store.close()
+            if source is not sys.stdin:
+                source.close()
+            if output is not sys.stdout:
+                output.close()
+
+        errors.print(f"[cyan]Scanned {count} domains[/cyan]")
+        if normalizer.invalid or normalizer.duplicates:
+            errors.print(f"[yellow]Skipped {normalizer.invalid} invalid and "
+                         f"{normalizer.duplicates} duplicate entries[/yellow]")
+
+    def run_daemon(self, input_path, output_format='jsonl', output_path=None,
+                   concurrency=None, interval=None, store_path=None,
+                   enrichment=None):
+        """
+        Monitor the domains in a file headlessly until interrupted, writing
+        one record per status transition instead of full reports.  With
+        `store_path`, every result is kept in a ResultStore as well;
+        `enrichment` is as for run_bulk.
+        """
+        import os
+        import signal
+        from rich.console import Console
+        from monitor import Monitor
+        from report import TRANSITION_FIELDS, ResultWriter, iter_domains
+        from scanner import run_coroutine, submit_coroutine
+
+        concurrency = concurrency or DEFAULT_CONCURRENCY
+        interval = interval or DEFAULT_INTERVAL
+        source = sys.stdin if input_path == '-' else open(
+            input_path, encoding='utf-8')
+        with source:
+            domains = list(iter_domains(source))
+        to_stdout = output_path in (None, '-')
+        # Restarts append to the same log, which already has a CSV header
+        header = to_stdout or not os.path.exists(output_path) \
+            or os.path.getsize(output_path) == 0
+        output = sys.stdout if to_stdout else open(
+            output_path, 'a', encoding='utf-8', newline='')
+        errors = Console(stderr=True)
+
+        engine = _scan_engine(concurrency, enrichment)
+        writer = ResultWriter(output, output_format, TRANSITION_FIELDS, header)
+        store = None
+        if store_path:
+            from result_store import ResultStore
+            store = ResultStore(store_path)
+        monitor = Monitor(domains, writer.write, engine, interval=interval,
+                          on_result=store.append if store else None)
+        errors.print(f"[cyan]Monitoring {len(monitor.domains)} domains "
+                     f"every ~{interval}s ({monitor.rate:.1f} probes/s)[/cyan]")
+
+        # Stop cleanly on SIGTERM as well as Ctrl-C
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        future = submit_coroutine(monitor.run())
+        try:
+            future.result()
+        except (KeyboardInterrupt, SystemExit):
+            future.cancel()
+        finally:
+            run_coroutine(engine.aclose())
+            if store is not None:
+                store.close()
+            if output is not sys.stdout:
+                output.close()
+
+        errors.print(f"[cyan]Stopped after {writer.count} transitions; "
+                     f"last statuses: {monitor.summary()}[/cyan]")
+
     def run_gui(self):
         """Run the graphical user interface"""
+        import tkinter as tk
         from gui import WebsiteAnalysisTool
         root = tk.Tk()
         app = WebsiteAnalysisTool(root)
@@ -90,15 +320,99 @@ def main():
                         help='Launch in GUI mode')
     parser.add_argument('--cli', action='store_true',
                         help='Launch in CLI mode')
+    parser.add_argument('--lookup', metavar='DOMAIN',
+                        help='Show the DNS information for DOMAIN and exit')
+    parser.add_argument('--check', metavar='DOMAIN', nargs='+',
+                        help='Check DOMAIN(s), print one result each and exit '
+                             'non-zero unless all are accessible')
+    parser.add_argument('--input', metavar='FILE',
+                        help="Scan domains from FILE ('-' for stdin)")
+    parser.add_argument('--output', metavar='FILE',
+                        help='Write bulk results to FILE instead of stdout')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='jsonl',
+                        help='Bulk output format (default: jsonl)')
+    parser.add_argument('--concurrency', type=int,
+                        help='Maximum domains in flight in bulk mode '
+                             f'(default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='Journal finished domains to FILE and resume from it')
+    parser.add_argument('--differential', action='store_true',
+                        help='Compare answers across several resolvers in bulk mode')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Shard bulk scans across this many processes')
+    parser.add_argument('--shard', choices=SHARD_MODES, default='chunk',
+                        help="Hand out domains by 'chunk' or by 'hash' of the "
+                             "domain (default: chunk)")
+    parser.add_argument('--ordered', action='store_true',
+                        help='Write sharded results in input order')
+    parser.add_argument('--store', metavar='DIR',
+                        help='Append every result to the columnar history in DIR')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep re-checking the --input domains and report '
+                             'status changes only')
+    parser.add_argument('--interval', type=float,
+                        help='Base seconds between checks of a domain in '
+                             f'daemon mode (default: {DEFAULT_INTERVAL})')
+    parser.add_argument('--asn-db', metavar='FILE',
+                        help='Add ASN and country from an ip2asn TSV database')
+    parser.add_argument('--blockpages', metavar='FILE',
+                        help='Report answers in the CIDRs listed in FILE as '
+                             'block pages')
+    parser.add_argument('--bogons', action='store_true',
+                        help='Report private and reserved DNS answers as '
+                             'block pages')
+    parser.add_argument('--no-live', dest='live', action='store_false',
+                        default=None,
+                        help='Do not show live progress during bulk scans')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='Serve OpenMetrics on http://localhost:PORT/metrics')
+    parser.add_argument('--metrics-host', default='127.0.0.1', metavar='HOST',
+                        help="Address to serve metrics on; '0.0.0.0' allows "
+                             "remote scraping (default: 127.0.0.1)")
+    parser.add_argument('--metrics-file', metavar='FILE',
+                        help='Periodically write OpenMetrics text to FILE')
     args = parser.parse_args()
 
+    if args.metrics_port or args.metrics_file:
+        from metrics import metrics
+    if args.metrics_port:
+        metrics.serve(args.metrics_port, args.metrics_host)
+    if args.metrics_file:
+        metrics.export_textfile(args.metrics_file)
+
     analyzer = WebsiteAnalyzer()
+    enrichment = None
+    if args.asn_db or args.blockpages or args.bogons:
+        enrichment = {'asn_path': args.asn_db,
+                      'blockpage_path': args.blockpages,
+                      'bogons': args.bogons}
 
-    if args.gui:
+    status = 0
+    if args.lookup:
+        status = 0 if analyzer.lookup(args.lookup) else 1
+    elif args.check:
+        status = 0 if analyzer.check(args.check, args.format,
+                                     args.concurrency, enrichment) else 1
+    elif args.daemon:
+        if not args.input:
+            parser.error("--daemon needs --input")
+        analyzer.run_daemon(args.input, args.format, args.output,
+                            args.concurrency, args.interval, args.store,
+                            enrichment)
+    elif args.input:
+        analyzer.run_bulk(args.input, args.format, args.output,
+                          args.concurrency, args.checkpoint,
+                          args.differential, args.processes, args.shard,
+                          args.ordered, args.store, args.live, enrichment)
+    elif args.gui:
         analyzer.run_gui()
     else:
         analyzer.run_cli()
 
+    if args.metrics_file:
+        metrics.write_textfile(args.metrics_file)
+    return status
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
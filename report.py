@@ -0,0 +1,160 @@
+import csv
+import json
+import threading
+import time
+from collections import Counter, deque
+
+from domains import DomainNormalizer
+
+
+OUTPUT_FORMATS = ('jsonl', 'csv')
+CSV_FIELDS = ['domain', 'status', 'details']
+TRANSITION_FIELDS = ['time', 'domain', 'previous', 'status', 'details']
+STATUS_STYLES = {"Accessible": "green", "Blocked": "red", "Error": "red"}
+DEFAULT_WINDOW = 15
+REFRESH_PER_SECOND = 4
+
+
+def iter_domains(lines, normalizer=None):
+    """
+    Yield domain names from an iterable of text lines, one at a time.
+    Blank lines and '#' comments are skipped, and ranked lists such as
+    "1,example.com" yield only the domain column.  Names are normalized
+    and repeats among recent names dropped, in constant memory; pass a
+    DomainNormalizer to change the window or see how many were dropped.
+    """
+    def names():
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line.rsplit(',', 1)[-1]
+
+    return (normalizer or DomainNormalizer()).normalize_many(names())
+
+
+class ResultWriter:
+    """
+    Write scan results to a stream as JSON lines or CSV, one per domain.
+    CSV rows hold `fields`; pass header=False when appending to a file
+    that already has the header.
+    """
+
+    def __init__(self, stream, output_format='jsonl', fields=CSV_FIELDS,
+                 header=True):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.stream = stream
+        self.output_format = output_format
+        self.count = 0
+        self._csv = None
+        if output_format == 'csv':
+            self._csv = csv.DictWriter(
+                stream, fieldnames=fields, extrasaction='ignore')
+            if header:
+                self._csv.writeheader()
+
+    def write(self, result):
+        """Write one result and flush so downstream readers see it at once"""
+        if self._csv is not None:
+            self._csv.writerow(result)
+        else:
+            self.stream.write(json.dumps(result, default=str) + "\n")
+        self.stream.flush()
+        self.count += 1
+
+
+def results_table(results, title="Website Accessibility Report"):
+    """Build the full report table; only for lists small enough to print"""
+    from rich.table import Table
+
+    table = Table(title=title)
+    table.add_column("Domain", style="cyan", no_wrap=True)
+    table.add_column("Status", style="green", no_wrap=True)
+    table.add_column("Details", style="white")
+    for result in results:
+        style = STATUS_STYLES.get(result["status"], "white")
+        table.add_row(result["domain"],
+                      f"[{style}]{result['status']}[/{style}]",
+                      result["details"])
+    return table
+
+
+class LiveReport:
+    """
+    Live console view of a running scan: counts per status and reason plus
+    the last `window` results.  add() is O(1) and each refresh renders at
+    most `window` rows, so the cost per frame does not grow with the scan.
+    Use as a context manager around the scan.
+    """
+
+    def __init__(self, console, total=None, window=DEFAULT_WINDOW,
+                 title="Scanning"):
+        self.console = console
+        self.total = total
+        self.title = title
+        self.count = 0
+        self.statuses = Counter()
+        self.reasons = Counter()
+        self.recent = deque(maxlen=window)
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._live = None
+
+    def add(self, result):
+        """Count one result and push it into the rolling window"""
+        with self._lock:
+            self.count += 1
+            self.statuses[result["status"]] += 1
+            if result.get("reason"):
+                self.reasons[result["reason"]] += 1
+            self.recent.append(result)
+
+    def _summary(self):
+        from rich.text import Text
+
+        elapsed = time.monotonic() - self._started
+        done = f"{self.count}" if self.total is None \
+            else f"{self.count}/{self.total}"
+        text = Text(f"{self.title}: {done} in {elapsed:.1f}s "
+                    f"({self.count / elapsed if elapsed else 0:.1f}/s)  ")
+        for status, count in sorted(self.statuses.items()):
+            text.append(f"{status} {count}  ",
+                        style=STATUS_STYLES.get(status, "white"))
+        if self.reasons:
+            reasons = ", ".join(f"{reason} {count}" for reason, count
+                                in self.reasons.most_common(5))
+            text.append(f"\n{reasons}", style="dim")
+        return text
+
+    def __rich__(self):
+        from rich.console import Group
+        from rich.table import Table
+
+        with self._lock:
+            summary = self._summary()
+            recent = list(self.recent)
+        table = Table(box=None, show_header=False, pad_edge=False,
+                      expand=True)
+        table.add_column("Domain", style="cyan", no_wrap=True)
+        table.add_column("Status", no_wrap=True)
+        table.add_column("Details", no_wrap=True, overflow="ellipsis",
+                         ratio=1)
+        for result in recent:
+            style = STATUS_STYLES.get(result["status"], "white")
+            table.add_row(result["domain"],
+                          f"[{style}]{result['status']}[/{style}]",
+                          result["details"])
+        return Group(summary, table)
+
+    def __enter__(self):
+        from rich.live import Live
+
+        self._started = time.monotonic()
+        self._live = Live(self, console=self.console,
+                          refresh_per_second=REFRESH_PER_SECOND)
+        self._live.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._live.stop()
+        self._live = None
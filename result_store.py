@@ -0,0 +1,340 @@
+import argparse
+import ipaddress
+import os
+import socket
+import time
+from datetime import datetime, timezone
+from enum import IntEnum
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+
+class Status(IntEnum):
+    ACCESSIBLE = 0
+    BLOCKED = 1
+    ERROR = 2
+
+
+class Reason(IntEnum):
+    UNKNOWN = 0
+    OK = 1
+    NXDOMAIN = 2
+    NO_ANSWER = 3
+    DNS_TIMEOUT = 4
+    CONNECT_FAILED = 5
+    HTTP_STATUS = 6
+    DNS_TAMPERING = 7
+    ERROR = 8
+    BLOCKPAGE = 9
+
+
+TIMING_COLUMNS = ('dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms', 'total_ms')
+
+# One append-only file per column, one value per row; missing timings
+# are -1.  Every answer address goes into the separate ADDRESSES file as
+# 16 bytes (IPv4 in its IPv4-mapped IPv6 form), and a row's `ip_end` is
+# where its addresses end there, so they run from the previous row's end.
+COLUMNS = {
+    'time': np.dtype('<i8'),
+    'domain': np.dtype('<u4'),
+    'status': np.dtype('u1'),
+    'reason': np.dtype('u1'),
+    'http_status': np.dtype('<u2'),
+    'ip_end': np.dtype('<u8'),
+    **{name: np.dtype('<i4') for name in TIMING_COLUMNS},
+}
+ADDRESSES = 'ips'
+ADDRESS_DTYPE = np.dtype(('u1', 16))
+
+DEFAULT_FLUSH_ROWS = 4096
+QUERY_CHUNK_ROWS = 1 << 20
+
+
+_V4_MAPPED = b'\x00' * 10 + b'\xff\xff'
+
+_STATUS_CODES = {status.name.capitalize(): status.value for status in Status}
+_REASON_CODES = {reason.name.lower(): reason.value for reason in Reason}
+
+
+def pack_ip(address):
+    """16-byte form of an IPv4 or IPv6 address string"""
+    if ':' in address:
+        return socket.inet_pton(socket.AF_INET6, address)
+    return _V4_MAPPED + socket.inet_pton(socket.AF_INET, address)
+
+
+def unpack_ip(packed):
+    """Inverse of pack_ip"""
+    ip = ipaddress.IPv6Address(bytes(packed))
+    return str(ip.ipv4_mapped or ip)
+
+
+def _status_name(code):
+    return Status(code).name.capitalize()
+
+
+class ResultStore:
+    """
+    Columnar, append-only history of scan results.
+
+    Each column lives in its own file under `path`, and domains are
+    interned to integer ids in `domains.txt`, so a query such as "when did
+    X become blocked" memory-maps only the domain, time and status columns
+    and scans them in chunks instead of loading whole sweeps.  Rows are
+    buffered and appended every `flush_rows` results; after a crash,
+    columns are trimmed back to their shortest common length on open.
+    Every answer address is kept, not just the first.
+    """
+
+    def __init__(self, path, flush_rows=DEFAULT_FLUSH_ROWS):
+        self.path = path
+        self.flush_rows = flush_rows
+        os.makedirs(path, exist_ok=True)
+        self._domains_path = os.path.join(path, 'domains.txt')
+        self._domain_ids = {}
+        self._domain_names = []
+        if os.path.exists(self._domains_path):
+            with open(self._domains_path, encoding='utf-8') as f:
+                text = f.read()
+            # A partial last line means the name was never fully written
+            complete = text.rfind('\n') + 1
+            if complete < len(text):
+                os.truncate(self._domains_path,
+                            len(text[:complete].encode('utf-8')))
+            self._domain_names = text[:complete].split('\n')[:-1]
+            self._domain_ids = {name: i for i, name
+                                in enumerate(self._domain_names)}
+        self._domains_file = open(self._domains_path, 'a', encoding='utf-8')
+        self._buffer = {name: [] for name in COLUMNS}
+        self._addresses = []
+        self.rows, self.addresses = self._repair()
+        self._ip_end = self.addresses
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.col")
+
+    def _size(self, name):
+        column_path = self._column_path(name)
+        return os.path.getsize(column_path) \
+            if os.path.exists(column_path) else 0
+
+    def _repair(self):
+        """
+        Trim every column to the row count they all agree on, and the
+        addresses to those rows.  Returns (rows, addresses).
+        """
+        rows = min(self._size(name) // dtype.itemsize
+                   for name, dtype in COLUMNS.items())
+        available = self._size(ADDRESSES) // ADDRESS_DTYPE.itemsize
+        addresses = 0
+        if rows:
+            ends = np.memmap(self._column_path('ip_end'),
+                             dtype=COLUMNS['ip_end'], mode='r', shape=(rows,))
+            # Rows whose addresses never reached the disk go as well
+            rows = int(np.searchsorted(ends, available, side='right'))
+            addresses = int(ends[rows - 1]) if rows else 0
+            del ends
+        for name, dtype in COLUMNS.items():
+            if self._size(name) > rows * dtype.itemsize:
+                os.truncate(self._column_path(name), rows * dtype.itemsize)
+        if available > addresses:
+            os.truncate(self._column_path(ADDRESSES),
+                        addresses * ADDRESS_DTYPE.itemsize)
+        return rows, addresses
+
+    def _domain_id(self, domain):
+        domain_id = self._domain_ids.get(domain)
+        if domain_id is None:
+            domain_id = len(self._domain_names)
+            self._domain_names.append(domain)
+            self._domain_ids[domain] = domain_id
+            self._domains_file.write(domain + '\n')
+        return domain_id
+
+    def append(self, result, timestamp=None):
+        """Buffer one scan result; written out every `flush_rows` rows"""
+        buffer = self._buffer
+        ips = result.get('ips') or []
+        timings = result.get('timings') or {}
+        reason = result.get('reason')
+
+        buffer['time'].append(int(timestamp if timestamp is not None
+                                  else time.time()))
+        buffer['domain'].append(self._domain_id(result['domain']))
+        buffer['status'].append(_STATUS_CODES[result['status']])
+        buffer['reason'].append(_REASON_CODES.get(reason, Reason.UNKNOWN))
+        buffer['http_status'].append(result.get('http_status') or 0)
+        self._addresses.extend(pack_ip(address) for address in ips)
+        self._ip_end += len(ips)
+        buffer['ip_end'].append(self._ip_end)
+        for name in TIMING_COLUMNS:
+            value = timings.get(name)
+            buffer[name].append(-1 if value is None else int(round(value)))
+
+        if len(buffer['time']) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """Append buffered rows to the column files"""
+        pending = len(self._buffer['time'])
+        if not pending:
+            return
+        # Names and addresses first, so everything a row points at is
+        # there once the row is
+        self._domains_file.flush()
+        with open(self._column_path(ADDRESSES), 'ab') as f:
+            f.write(b''.join(self._addresses))
+        self._addresses = []
+        for name, dtype in COLUMNS.items():
+            data = np.asarray(self._buffer[name], dtype=dtype).tobytes()
+            with open(self._column_path(name), 'ab') as f:
+                f.write(data)
+            self._buffer[name] = []
+        self.rows += pending
+        self.addresses = self._ip_end
+
+    def close(self):
+        self.flush()
+        self._domains_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def column(self, name):
+        """Memory-map one column read-only (flushed rows only)"""
+        if not self.rows:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(self._column_path(name), dtype=COLUMNS[name],
+                         mode='r', shape=(self.rows,))
+
+    def address_column(self):
+        """Memory-map every flushed address as a (count, 16) uint8 array"""
+        if not self.addresses:
+            return np.empty((0, 16), dtype=np.uint8)
+        return np.memmap(self._column_path(ADDRESSES), dtype=np.uint8,
+                         mode='r', shape=(self.addresses, 16))
+
+    def ips(self, rows):
+        """The answer addresses of each of `rows`, as lists of strings"""
+        ends = self.column('ip_end')
+        addresses = self.address_column()
+        found = []
+        for row in rows:
+            start = int(ends[row - 1]) if row else 0
+            found.append([unpack_ip(packed)
+                          for packed in addresses[start:int(ends[row])]])
+        return found
+
+    def rows_for(self, domain):
+        """Row numbers holding results for `domain`, oldest first"""
+        domain_id = self._domain_ids.get(domain)
+        if domain_id is None or not self.rows:
+            return np.empty(0, dtype=np.int64)
+        ids = self.column('domain')
+        found = [start + np.flatnonzero(
+                    ids[start:start + QUERY_CHUNK_ROWS] == domain_id)
+                 for start in range(0, self.rows, QUERY_CHUNK_ROWS)]
+        return np.concatenate(found)
+
+    def history(self, domain):
+        """Every stored result for `domain` as a list of dicts, oldest first"""
+        self.flush()
+        rows = self.rows_for(domain)
+        columns = {name: self.column(name)[rows] for name in COLUMNS}
+        ips = self.ips(rows)
+        history = []
+        for i in range(len(rows)):
+            record = {
+                'time': int(columns['time'][i]),
+                'domain': domain,
+                'status': _status_name(columns['status'][i]),
+                'reason': Reason(columns['reason'][i]).name.lower(),
+                'http_status': int(columns['http_status'][i]) or None,
+                'ips': ips[i],
+            }
+            for name in TIMING_COLUMNS:
+                value = int(columns[name][i])
+                record[name] = None if value < 0 else value
+            history.append(record)
+        return history
+
+    def transitions(self, domain):
+        """Return [(time, previous_status, status)] for each status change"""
+        self.flush()
+        rows = self.rows_for(domain)
+        if len(rows) < 2:
+            return []
+        times = self.column('time')[rows]
+        statuses = self.column('status')[rows]
+        changed = np.flatnonzero(statuses[1:] != statuses[:-1]) + 1
+        return [(int(times[i]), _status_name(statuses[i - 1]),
+                 _status_name(statuses[i])) for i in changed]
+
+    def blocked_since(self, domain):
+        """Time the domain's current blocked streak began, or None"""
+        self.flush()
+        rows = self.rows_for(domain)
+        if not len(rows):
+            return None
+        statuses = self.column('status')[rows]
+        if statuses[-1] != Status.BLOCKED:
+            return None
+        unblocked = np.flatnonzero(statuses != Status.BLOCKED)
+        first = unblocked[-1] + 1 if len(unblocked) else 0
+        return int(self.column('time')[rows[first]])
+
+    def status_counts(self, since=None):
+        """{status: rows} over all results, or those at or after `since`"""
+        self.flush()
+        counts = np.zeros(len(Status), dtype=np.int64)
+        times = self.column('time')
+        statuses = self.column('status')
+        for start in range(0, self.rows, QUERY_CHUNK_ROWS):
+            chunk = statuses[start:start + QUERY_CHUNK_ROWS]
+            if since is not None:
+                chunk = chunk[times[start:start + QUERY_CHUNK_ROWS] >= since]
+            counts += np.bincount(chunk, minlength=len(Status))
+        return {_status_name(code): int(counts[code]) for code in Status}
+
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(
+        '%Y-%m-%d %H:%M:%S')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Query a stored scan history')
+    parser.add_argument('store', help='result store directory')
+    parser.add_argument('domain', nargs='?',
+                        help='show this domain\'s status changes')
+    args = parser.parse_args()
+
+    console = Console()
+    with ResultStore(args.store) as store:
+        if not args.domain:
+            console.print(f"{store.rows} results for "
+                          f"{len(store._domain_names)} domains: "
+                          f"{store.status_counts()}")
+            return
+
+        table = Table(title=f"Status changes for {args.domain}")
+        table.add_column("Time (UTC)", style="cyan")
+        table.add_column("From")
+        table.add_column("To", style="green")
+        for timestamp, previous, status in store.transitions(args.domain):
+            table.add_row(_format_time(timestamp), previous, status)
+        console.print(table)
+
+        since = store.blocked_since(args.domain)
+        if since is not None:
+            console.print(f"[red]Blocked since {_format_time(since)}[/red]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import asyncio
+import atexit
+import itertools
+import threading
+import time
+
+import dns.exception
+import dns.resolver
+
+from defaults import DEFAULT_CONCURRENCY
+from dns_cache import make_resolver
+from dns_query import UDPQueryPool
+from http_probe import HTTPProber, ProbeError, ProbeTimeout
+from metrics import (ADAPTIVE_TIMEOUT, IN_FLIGHT, RESOLVER_SECONDS, RESULTS,
+                     TIMEOUTS, metrics, record_timings)
+
+
+DEFAULT_PER_RESOLVER_CONCURRENCY = 250
+
+
+def _result(domain, status, details, reason=None):
+    result = {"domain": domain, "status": status, "details": details}
+    if reason is not None:
+        result["reason"] = reason
+    return result
+
+
+async def bounded_map(func, items, concurrency):
+    """
+    Run the coroutine function `func` over `items`, yielding results as they
+    complete, with at most `concurrency` calls in flight.  Items are pulled
+    from the iterable only when there is room for them.
+    """
+    items = iter(items)
+    pending = set()
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(func(item)))
+
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # Cancelled, closed or abandoned by the consumer (GeneratorExit at
+        # the yield): don't leave calls running unobserved
+        for task in pending:
+            task.cancel()
+
+
+class ScanEngine:
+    """
+    Asynchronous scan engine that can keep thousands of probes in flight.
+    A global semaphore bounds the total number of probes, and every
+    nameserver gets its own UDP query pool and semaphore so no single
+    resolver is flooded.
+    HTTP checks go through one pooled HTTPProber shared by all probes.
+    With an `enricher` (see enrichment.IPEnricher), answers in known
+    block-page networks are reported as blocked without an HTTP probe,
+    and results carry the ASN and country of the first address.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY,
+                 per_resolver_concurrency=DEFAULT_PER_RESOLVER_CONCURRENCY,
+                 nameservers=None, dns_timeout=2, http_timeout=3, dns_port=53,
+                 http_port=80, adaptive=True, enricher=None):
+        self.concurrency = concurrency
+        self.per_resolver_concurrency = per_resolver_concurrency
+        self.nameservers = nameservers
+        self.dns_port = dns_port
+        self.http_port = http_port
+        self.dns_timeout = dns_timeout
+        self.http_timeout = http_timeout
+        self.adaptive = adaptive
+        self.enricher = enricher
+
+        self._limit = None
+        self._resolvers = None
+        self._next_resolver = None
+        self._prober = None
+
+    def _setup(self):
+        """Create resolvers, semaphores and the HTTP prober on first use"""
+        if self._prober is not None:
+            return
+
+        nameservers = self.nameservers
+        if not nameservers:
+            nameservers = make_resolver(self.dns_timeout).nameservers
+
+        self._resolvers = []
+        for nameserver in nameservers:
+            resolver = UDPQueryPool([nameserver], port=self.dns_port,
+                                    timeout=self.dns_timeout,
+                                    adaptive=self.adaptive)
+            limit = asyncio.Semaphore(self.per_resolver_concurrency)
+            self._resolvers.append((resolver, limit))
+        self._next_resolver = itertools.cycle(self._resolvers)
+
+        self._limit = asyncio.Semaphore(self.concurrency)
+        self._prober = HTTPProber(timeout=self.http_timeout,
+                                  adaptive=self.adaptive)
+        metrics.add_collector(self._collect_metrics)
+
+    def timeout_state(self):
+        """Learned DNS timeouts per nameserver and HTTP timeouts per network"""
+        if self._prober is None:
+            return {}
+        return {
+            'dns': {resolver.nameservers[0]: resolver.timeouts.state()
+                    for resolver, _ in self._resolvers
+                    if resolver.timeouts is not None},
+            'http': self._prober.timeouts.state()
+            if self._prober.timeouts is not None else None,
+        }
+
+    def _collect_metrics(self):
+        if self._prober is None:
+            return
+        for resolver, _ in self._resolvers:
+            if resolver.timeouts is not None:
+                nameserver = resolver.nameservers[0]
+                ADAPTIVE_TIMEOUT.labels('dns', nameserver).set(
+                    round(resolver.timeouts.timeout(nameserver), 4))
+        if self._prober.timeouts is not None:
+            ADAPTIVE_TIMEOUT.labels('http', 'pooled').set(
+                round(self._prober.timeouts.pooled.rto, 4))
+
+    async def check(self, domain):
+        """
+        Check if a website is accessible and return its status and IP addresses.
+        Returns only 'Accessible', 'Blocked', or 'Error' as status.
+        Every result carries a `timings` dict of per-stage milliseconds.
+        """
+        self._setup()
+        async with self._limit:
+            with IN_FLIGHT.track():
+                start = time.perf_counter()
+                timings = {'dns_ms': None, 'connect_ms': None, 'tls_ms': None,
+                           'ttfb_ms': None, 'total_ms': None}
+                result = await self._check(domain, timings)
+                if self.enricher is not None:
+                    self.enricher.enrich_result(result)
+                timings['total_ms'] = round(
+                    (time.perf_counter() - start) * 1000, 2)
+                result["timings"] = timings
+            record_timings(timings)
+            RESULTS.labels(result["status"]).inc()
+            return result
+
+    async def _check(self, domain, timings):
+        resolver, resolver_limit = next(self._next_resolver)
+        try:
+            async with resolver_limit:
+                start = time.perf_counter()
+                try:
+                    answers = await resolver.resolve(domain, "A")
+                finally:
+                    elapsed = time.perf_counter() - start
+                    timings['dns_ms'] = round(elapsed * 1000, 2)
+                    RESOLVER_SECONDS.labels(
+                        resolver.nameservers[0]).observe(elapsed)
+        except dns.resolver.NXDOMAIN:
+            return _result(domain, "Blocked",
+                           "DNS resolution failed - Domain does not exist",
+                           "nxdomain")
+        except dns.resolver.NoAnswer:
+            return _result(domain, "Blocked",
+                           "DNS resolution failed - No A records", "no_answer")
+        except dns.exception.Timeout:
+            TIMEOUTS.labels('dns').inc()
+            return _result(domain, "Blocked", "DNS resolution timeout",
+                           "dns_timeout")
+        except Exception as e:
+            return _result(domain, "Error", str(e), "error")
+
+        ip_addresses = [str(rdata) for rdata in answers]
+
+        if self.enricher is not None:
+            for ip in ip_addresses:
+                label = self.enricher.blockpage(ip)
+                if label is not None:
+                    result = _result(domain, "Blocked",
+                                     f"DNS answer {ip} is a {label} address",
+                                     "blockpage")
+                    result["ips"] = ip_addresses
+                    return result
+
+        url = f"http://{domain}"
+        if self.http_port != 80:
+            url += f":{self.http_port}"
+        try:
+            probe = await self._prober.probe(url, ip=ip_addresses[0])
+        except ProbeError as e:
+            if isinstance(e, ProbeTimeout):
+                TIMEOUTS.labels('http').inc()
+            result = _result(
+                domain, "Blocked",
+                f"Connection failed, IPs: {', '.join(ip_addresses)}",
+                "connect_failed")
+            result["ips"] = ip_addresses
+            return result
+        except Exception as e:
+            return _result(domain, "Error", str(e), "error")
+
+        timings['connect_ms'] = probe['connect_ms']
+        timings['tls_ms'] = probe['tls_ms']
+        timings['ttfb_ms'] = probe['ttfb_ms']
+        status_code = probe['status_code']
+        status = "Accessible" if status_code == 200 else "Blocked"
+        result = _result(domain, status,
+                         f"HTTP {status_code}, IPs: {', '.join(ip_addresses)}",
+                         "ok" if status_code == 200 else "http_status")
+        result["ips"] = ip_addresses
+        result["http_status"] = status_code
+        return result
+
+    async def scan(self, domains):
+        """
+        Yield results as they complete.  Domains are pulled lazily from the
+        iterable so at most `concurrency` of them are held at any time.
+        """
+        async for result in bounded_map(self.check, domains, self.concurrency):
+            yield result
+
+    async def aclose(self):
+        """Close the pooled HTTP connections and DNS sockets"""
+        if self._prober is not None:
+            self._prober.close()
+            self._prober = None
+            for resolver, _ in self._resolvers:
+                resolver.close()
+
+
+_loop = None
+_loop_lock = threading.Lock()
+_default_engine = None
+
+
+def _get_loop():
+    """Return the event loop shared by all synchronous callers"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever,
+                             name="scan-engine", daemon=True).start()
+    return _loop
+
+
+def submit_coroutine(coro):
+    """Schedule a coroutine on the shared scan loop and return its future"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+
+def run_coroutine(coro):
+    """Run a coroutine on the shared scan loop and wait for its result"""
+    return submit_coroutine(coro).result()
+
+
+def _shutdown():
+    """Close the default engine's connections before the interpreter exits"""
+    if _default_engine is not None and _loop is not None:
+        run_coroutine(_default_engine.aclose())
+
+
+atexit.register(_shutdown)
+
+
+def get_default_engine():
+    """Return the process-wide engine used by the synchronous helpers"""
+    global _default_engine
+    with _loop_lock:
+        if _default_engine is None:
+            _default_engine = ScanEngine()
+    return _default_engine
+
+
+def scan_domains(domains, callback=None, engine=None):
+    """
+    Scan every domain on the shared loop and return the list of results.
+    If `callback` is given it is called with each result as soon as it
+    finishes, from the scan loop's thread.
+    """
+    engine = engine or get_default_engine()
+
+    async def collect():
+        results = []
+        async for result in engine.scan(domains):
+            if callback is not None:
+                callback(result)
+            results.append(result)
+        return results
+
+    return run_coroutine(collect())
+
+
+def stream_scan(domains, callback, engine=None):
+    """
+    Like scan_domains, but hand each result to `callback` without keeping
+    it, so memory stays flat however long `domains` is.  Returns the number
+    of domains scanned.
+    """
+    engine = engine or get_default_engine()
+
+    async def run():
+        count = 0
+        async for result in engine.scan(domains):
+            callback(result)
+            count += 1
+        return count
+
+    return run_coroutine(run())
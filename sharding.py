@@ -0,0 +1,271 @@
+import asyncio
+import marshal
+import multiprocessing
+import os
+import time
+import zlib
+from collections import deque
+from multiprocessing.connection import wait
+
+from checkpoint import STATUS_CODES
+from defaults import SHARD_MODES
+
+
+DEFAULT_CHUNK_SIZE = 500
+# In hash mode, chunks' worth of other shards' domains read ahead per
+# worker before a request has to wait for the slow shards to catch up
+MAX_PARKED_CHUNKS = 4
+RESULT_BATCH = 256
+FLUSH_INTERVAL = 0.2
+
+_STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+_CORE_KEYS = ('domain', 'status', 'details', 'timings')
+
+
+def shard_of(domain, shards):
+    """Consistent shard for a domain, the same in every process and run"""
+    return zlib.crc32(domain.encode()) % shards
+
+
+def _pack(seq, result):
+    # Results cross the pipe as marshal'd tuples: much smaller and faster
+    # than pickling dicts, and the status shrinks to one letter
+    extra = {k: v for k, v in result.items() if k not in _CORE_KEYS}
+    return (seq, result['domain'], STATUS_CODES.get(result['status'], 'E'),
+            result['details'], result.get('timings'), extra or None)
+
+
+def _unpack(packed):
+    seq, domain, code, details, timings, extra = packed
+    result = {"domain": domain, "status": _STATUS_NAMES[code],
+              "details": details}
+    if timings is not None:
+        result["timings"] = timings
+    if extra:
+        result.update(extra)
+    return seq, result
+
+
+def _make_engine(options):
+    options = dict(options)
+    enrichment = options.pop('enrichment', None)
+    enricher = None
+    if enrichment:
+        # Each worker loads its own copy rather than unpickling the index
+        from enrichment import IPEnricher
+        enricher = IPEnricher(**enrichment)
+    if options.pop('differential', False):
+        from censorship import DifferentialDetector
+        return DifferentialDetector(concurrency=options.get('concurrency', 200),
+                                    enricher=enricher)
+    from scanner import ScanEngine
+    return ScanEngine(enricher=enricher, **options)
+
+
+async def _worker_loop(conn, options):
+    engine = _make_engine(options)
+    concurrency = engine.concurrency
+    loop = asyncio.get_running_loop()
+    buffer = deque()
+    pending = set()
+    request = None
+    finished = False
+    batch = []
+    flushed = time.monotonic()
+
+    async def check(seq, domain):
+        return _pack(seq, await engine.check(domain))
+
+    try:
+        while True:
+            while buffer and len(pending) < concurrency:
+                seq, domain = buffer.popleft()
+                pending.add(asyncio.ensure_future(check(seq, domain)))
+
+            # Ask for the next chunk while there is still work in hand
+            if not finished and request is None and len(buffer) < concurrency:
+                conn.send_bytes(marshal.dumps(('more', None)))
+                request = loop.run_in_executor(None, conn.recv_bytes)
+
+            waiting = set(pending)
+            if request is not None:
+                waiting.add(request)
+            if not waiting:
+                break
+            done, _ = await asyncio.wait(
+                waiting, timeout=FLUSH_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                if task is request:
+                    request = None
+                    chunk = marshal.loads(task.result())
+                    if chunk is None:
+                        finished = True
+                    else:
+                        buffer.extend(chunk)
+                else:
+                    pending.discard(task)
+                    batch.append(task.result())
+
+            now = time.monotonic()
+            if batch and (len(batch) >= RESULT_BATCH
+                          or now - flushed >= FLUSH_INTERVAL):
+                conn.send_bytes(marshal.dumps(('results', batch)))
+                batch = []
+                flushed = now
+
+        if batch:
+            conn.send_bytes(marshal.dumps(('results', batch)))
+        conn.send_bytes(marshal.dumps(('done', None)))
+    finally:
+        await engine.aclose()
+
+
+def _worker(conn, options):
+    """Process entry point: scan whatever the parent hands over"""
+    try:
+        asyncio.run(_worker_loop(conn, options))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+
+class ShardedScan:
+    """
+    Scan a domain list across a pool of processes, each running its own
+    ScanEngine loop.
+
+    With mode="chunk" the next `chunk_size` domains go to whichever worker
+    asks first; with mode="hash" a domain always goes to the same worker
+    (see shard_of), which keeps per-worker DNS and WHOIS caches useful
+    across runs.  Workers pull chunks only when they are running low, so
+    the input is read lazily.  Results come back in marshal'd batches and
+    are passed to the callback as they arrive, or in input order with
+    `ordered`.  An `enrichment` option holds IPEnricher arguments, so each
+    worker loads its own prefix index.
+    """
+
+    def __init__(self, processes=None, mode='chunk', ordered=False,
+                 chunk_size=DEFAULT_CHUNK_SIZE, **engine_options):
+        if mode not in SHARD_MODES:
+            raise ValueError(f"Unknown shard mode: {mode}")
+        self.processes = processes or os.cpu_count() or 1
+        self.mode = mode
+        self.ordered = ordered
+        self.chunk_size = chunk_size
+        self.engine_options = engine_options
+
+    def _next_chunk(self, worker, items, buffers):
+        """
+        The next chunk for `worker`: [] once the input is used up, or None
+        if its share has to wait until other workers drain theirs
+        """
+        if self.mode == 'chunk':
+            chunk = []
+            for item in items:
+                chunk.append(item)
+                if len(chunk) >= self.chunk_size:
+                    break
+            return chunk
+
+        # Hash mode: read ahead until this worker's share fills a chunk,
+        # parking other workers' domains until they ask, but never more
+        # than MAX_PARKED_CHUNKS per worker in total
+        own = buffers[worker]
+        limit = self.processes * self.chunk_size * MAX_PARKED_CHUNKS
+        parked = sum(map(len, buffers))
+        capped = False
+        while len(own) < self.chunk_size:
+            if parked >= limit:
+                capped = True
+                break
+            item = next(items, None)
+            if item is None:
+                break
+            buffers[shard_of(item[1], self.processes)].append(item)
+            parked += 1
+        if capped and not own:
+            return None
+        chunk = own[:self.chunk_size]
+        del own[:self.chunk_size]
+        return chunk
+
+    def run(self, domains, callback):
+        """Scan every domain, call `callback` with each result, return the count"""
+        context = multiprocessing.get_context('spawn')
+        items = enumerate(domains)
+        buffers = [[] for _ in range(self.processes)]
+        workers = []
+        connections = {}
+        for index in range(self.processes):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker, args=(child_conn, self.engine_options),
+                name=f"scan-shard-{index}", daemon=True)
+            process.start()
+            child_conn.close()
+            workers.append(process)
+            connections[parent_conn] = index
+
+        reorder = {}
+        next_seq = 0
+        count = 0
+        # Workers whose request is on hold while the read-ahead is full
+        held = []
+        try:
+            while connections:
+                for conn in wait(list(connections)):
+                    index = connections[conn]
+                    try:
+                        kind, payload = marshal.loads(conn.recv_bytes())
+                    except EOFError:
+                        raise RuntimeError(
+                            f"scan shard {index} exited unexpectedly")
+
+                    if kind == 'more':
+                        chunk = self._next_chunk(index, items, buffers)
+                        if chunk is None:
+                            held.append(conn)
+                            continue
+                        conn.send_bytes(marshal.dumps(chunk or None))
+                        # Handing out parked domains may make room for
+                        # the held requests
+                        for waiting in list(held):
+                            chunk = self._next_chunk(
+                                connections[waiting], items, buffers)
+                            if chunk is not None:
+                                held.remove(waiting)
+                                waiting.send_bytes(
+                                    marshal.dumps(chunk or None))
+                    elif kind == 'results':
+                        for packed in payload:
+                            seq, result = _unpack(packed)
+                            count += 1
+                            if not self.ordered:
+                                callback(result)
+                                continue
+                            reorder[seq] = result
+                            while next_seq in reorder:
+                                callback(reorder.pop(next_seq))
+                                next_seq += 1
+                    elif kind == 'done':
+                        del connections[conn]
+                        conn.close()
+        finally:
+            for conn in connections:
+                conn.close()
+            for process in workers:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+
+        return count
+
+
+def sharded_scan(domains, callback, processes=None, mode='chunk',
+                 ordered=False, **engine_options):
+    """Helper mirroring scanner.stream_scan, spread over several processes"""
+    return ShardedScan(processes, mode, ordered,
+                       **engine_options).run(domains, callback)
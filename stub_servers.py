@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import random
+import struct
+import zlib
+
+
+DNS_PORT = 5353
+HTTP_PORT = 8080
+STUB_ADDRESS = '127.0.0.1'
+
+# Response flags: QR, AA and RD set, RA clear
+_FLAGS = 0x8500
+_A = 1
+_RCODE_NXDOMAIN = 3
+
+
+def selected(domain, rate, salt=''):
+    """Pick a stable `rate` fraction of domains, the same on every run"""
+    if rate <= 0:
+        return False
+    return zlib.crc32((salt + domain).encode()) / 0xFFFFFFFF < rate
+
+
+def _read_name(data, offset):
+    labels = []
+    while True:
+        length = data[offset]
+        offset += 1
+        if length == 0:
+            return '.'.join(labels), offset
+        labels.append(data[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+
+
+class DNSStub(asyncio.DatagramProtocol):
+    """
+    Authoritative stub answering every A query with `address`.
+
+    `latency` (plus up to `jitter`) seconds are added to every answer,
+    `loss` is the fraction of queries silently dropped, and stable subsets
+    of domains get NXDOMAIN (`nxdomain_rate`) or are never answered at all
+    (`blackhole_rate`).  Other query types get an empty NOERROR answer.
+    """
+
+    def __init__(self, address=STUB_ADDRESS, latency=0.0, jitter=0.0,
+                 loss=0.0, nxdomain_rate=0.0, blackhole_rate=0.0, ttl=300):
+        self.rdata = bytes(int(part) for part in address.split('.'))
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.nxdomain_rate = nxdomain_rate
+        self.blackhole_rate = blackhole_rate
+        self.ttl = ttl
+        self.transport = None
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def answer(self, data):
+        """Build the response for one query, or None to stay silent"""
+        try:
+            name, end = _read_name(data, 12)
+            qtype, = struct.unpack_from('>H', data, end)
+        except (IndexError, struct.error):
+            return None
+        question = data[12:end + 4]
+        name = name.lower()
+
+        if selected(name, self.blackhole_rate, 'blackhole'):
+            return None
+        if selected(name, self.nxdomain_rate, 'nxdomain'):
+            header = struct.pack('>HHHHHH', int.from_bytes(data[:2], 'big'),
+                                 _FLAGS | _RCODE_NXDOMAIN, 1, 0, 0, 0)
+            return header + question
+        if qtype != _A:
+            header = struct.pack('>HHHHHH', int.from_bytes(data[:2], 'big'),
+                                 _FLAGS, 1, 0, 0, 0)
+            return header + question
+
+        header = struct.pack('>HHHHHH', int.from_bytes(data[:2], 'big'),
+                             _FLAGS, 1, 1, 0, 0)
+        record = struct.pack('>HHHIH', 0xC00C, _A, 1, self.ttl, 4) + self.rdata
+        return header + question + record
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        if len(data) < 17 or (self.loss and random.random() < self.loss):
+            return
+        response = self.answer(data)
+        if response is None:
+            return
+        delay = self.latency + random.random() * self.jitter
+        if delay > 0:
+            asyncio.get_running_loop().call_later(
+                delay, self.transport.sendto, response, addr)
+        else:
+            self.transport.sendto(response, addr)
+
+
+class HTTPStub:
+    """
+    Keep-alive HTTP server answering every request with an empty 200.
+    Requests for a stable `blackhole_rate` fraction of hosts are read but
+    never answered, like a firewall that drops traffic after the handshake.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, blackhole_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.blackhole_rate = blackhole_rate
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                self.requests += 1
+                host = ''
+                for line in head.split(b"\r\n")[1:]:
+                    if line[:5].lower() == b"host:":
+                        host = line[5:].strip().decode('latin-1')
+                        host = host.rsplit(':', 1)[0].lower()
+                        break
+                if selected(host, self.blackhole_rate, 'http-blackhole'):
+                    await reader.read()
+                    return
+                delay = self.latency + random.random() * self.jitter
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                writer.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Content-Length: 0\r\n"
+                             b"Connection: keep-alive\r\n\r\n")
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+
+async def start_stubs(host=STUB_ADDRESS, dns_port=DNS_PORT,
+                      http_port=HTTP_PORT, **options):
+    """Start both stubs on the running loop and return (dns, http, server)"""
+    loop = asyncio.get_running_loop()
+    dns_stub = DNSStub(
+        address=host,
+        latency=options.get('dns_latency', 0.0),
+        jitter=options.get('dns_jitter', 0.0),
+        loss=options.get('loss', 0.0),
+        nxdomain_rate=options.get('nxdomain_rate', 0.0),
+        blackhole_rate=options.get('dns_blackhole_rate', 0.0))
+    await loop.create_datagram_endpoint(
+        lambda: dns_stub, local_addr=(host, dns_port))
+    http_stub = HTTPStub(
+        latency=options.get('http_latency', 0.0),
+        jitter=options.get('http_jitter', 0.0),
+        blackhole_rate=options.get('http_blackhole_rate', 0.0))
+    server = await asyncio.start_server(
+        http_stub.handle, host, http_port, backlog=4096)
+    return dns_stub, http_stub, server
+
+
+def add_stub_arguments(parser):
+    """Register the stub behaviour options on an argparse parser"""
+    parser.add_argument('--dns-port', type=int, default=DNS_PORT)
+    parser.add_argument('--http-port', type=int, default=HTTP_PORT)
+    parser.add_argument('--dns-latency', type=float, default=0.0,
+                        help='seconds added to every DNS answer')
+    parser.add_argument('--dns-jitter', type=float, default=0.0)
+    parser.add_argument('--http-latency', type=float, default=0.0,
+                        help='seconds added to every HTTP response')
+    parser.add_argument('--http-jitter', type=float, default=0.0)
+    parser.add_argument('--loss', type=float, default=0.0,
+                        help='fraction of DNS queries dropped at random')
+    parser.add_argument('--nxdomain-rate', type=float, default=0.0)
+    parser.add_argument('--dns-blackhole-rate', type=float, default=0.0)
+    parser.add_argument('--http-blackhole-rate', type=float, default=0.0)
+
+
+def stub_options(args):
+    """Pick the stub behaviour options out of parsed arguments"""
+    return {name: getattr(args, name) for name in (
+        'dns_latency', 'dns_jitter', 'http_latency', 'http_jitter', 'loss',
+        'nxdomain_rate', 'dns_blackhole_rate', 'http_blackhole_rate')}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Local DNS and HTTP stubs for benchmarking scans')
+    parser.add_argument('--host', default=STUB_ADDRESS)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    async def serve():
+        _, _, server = await start_stubs(
+            args.host, args.dns_port, args.http_port, **stub_options(args))
+        print(f"DNS stub on {args.host}:{args.dns_port}/udp, "
+              f"HTTP stub on {args.host}:{args.http_port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import asyncio
+import shutil
+import ssl
+import struct
+import subprocess
+
+import dns.query
+import pytest
+
+import censorship
+from censorship import DifferentialDetector
+from enrichment import IPEnricher
+from stub_servers import STUB_ADDRESS, DNSStub
+
+
+REAL = '1.2.3.4'
+SAME_ASN = '5.6.7.8'
+OTHER_ASN = '9.10.11.12'
+SINKHOLE = '10.0.0.1'
+
+
+async def _udp_stub(address):
+    """DNSStub answering `address` on a free UDP port: (transport, port)"""
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: DNSStub(address=address), local_addr=(STUB_ADDRESS, 0))
+    return transport, transport.get_extra_info('sockname')[1]
+
+
+async def _dot_stub(address, ssl_context):
+    """DNSStub behind DNS-over-TLS framing: (server, port)"""
+    stub = DNSStub(address=address)
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                length, = struct.unpack('>H', await reader.readexactly(2))
+                response = stub.answer(await reader.readexactly(length))
+                writer.write(struct.pack('>H', len(response)) + response)
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, STUB_ADDRESS, 0,
+                                        ssl=ssl_context)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def _doh_stub(address):
+    """DNSStub behind plain-HTTP DoH POSTs: (server, port)"""
+    stub = DNSStub(address=address)
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                response = stub.answer(await reader.readexactly(length))
+                writer.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Content-Type: application/dns-message\r\n"
+                             b"Content-Length: %d\r\n\r\n" % len(response)
+                             + response)
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, STUB_ADDRESS, 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def _check(resolvers, enricher=None, domain='example.com'):
+    detector = DifferentialDetector(resolvers, timeout=1, enricher=enricher)
+    try:
+        return await detector.check(domain)
+    finally:
+        await detector.aclose()
+
+
+@pytest.fixture
+def asn_enricher(tmp_path):
+    path = tmp_path / 'ip2asn.tsv'
+    path.write_text(f"1.2.3.0\t1.2.3.255\t64500\tUS\tExample CDN\n"
+                    f"5.6.7.0\t5.6.7.255\t64500\tUS\tExample CDN\n"
+                    f"9.10.11.0\t9.10.11.255\t64501\tXX\tSomeone else\n")
+    return IPEnricher(asn_path=str(path))
+
+
+@pytest.fixture(scope='module')
+def tls_cert(tmp_path_factory):
+    if shutil.which('openssl') is None:
+        pytest.skip('needs openssl to make a test certificate')
+    directory = tmp_path_factory.mktemp('tls')
+    cert, key = directory / 'cert.pem', directory / 'key.pem'
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+         '-keyout', str(key), '-out', str(cert), '-days', '1',
+         '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost'],
+        check=True, capture_output=True)
+    return str(cert), str(key)
+
+
+def _udp_pair(trusted_answer, isp_answer, kind='udp', **options):
+    """Outcome of a trusted `kind` resolver against an untrusted UDP one"""
+    async def scenario():
+        trusted, trusted_port = await _udp_stub(trusted_answer)
+        isp, isp_port = await _udp_stub(isp_answer)
+        try:
+            return await _check([
+                {'name': 'reference', 'kind': kind, 'trusted': True,
+                 'address': STUB_ADDRESS, 'port': trusted_port},
+                {'name': 'isp', 'kind': 'udp', 'address': STUB_ADDRESS,
+                 'port': isp_port},
+            ], **options)
+        finally:
+            trusted.close()
+            isp.close()
+
+    return asyncio.run(scenario())
+
+
+def test_udp_consistent():
+    result = _udp_pair(REAL, REAL)
+    assert result['status'] == 'Accessible'
+    assert result['ips'] == [REAL]
+
+
+def test_udp_sinkhole_flagged():
+    result = _udp_pair(REAL, SINKHOLE)
+    assert result['status'] == 'Blocked'
+    assert result['findings'] == [f"isp: bogon answer {SINKHOLE}"]
+
+
+def test_trusted_bogon_not_flagged():
+    result = _udp_pair(SINKHOLE, REAL)
+    assert result['findings'] == []
+    assert result['ips'] == []
+
+
+def test_trace_other_network_flagged():
+    result = _udp_pair(REAL, SAME_ASN, kind='trace')
+    assert result['status'] == 'Blocked'
+    assert 'outside trusted answers' in result['findings'][0]
+
+
+def test_same_asn_matches_with_enrichment(asn_enricher):
+    result = _udp_pair(REAL, SAME_ASN, kind='trace', enricher=asn_enricher)
+    assert result['status'] == 'Accessible'
+    result = _udp_pair(REAL, OTHER_ASN, kind='trace', enricher=asn_enricher)
+    assert result['status'] == 'Blocked'
+
+
+def test_dot_reference(tls_cert):
+    cert, key = tls_cert
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+
+    async def scenario():
+        server, port = await _dot_stub(REAL, context)
+        isp, isp_port = await _udp_stub(OTHER_ASN)
+        try:
+            return await _check([
+                {'name': 'dot', 'kind': 'dot', 'address': STUB_ADDRESS,
+                 'port': port, 'server_hostname': 'localhost',
+                 'verify': cert},
+                {'name': 'isp', 'kind': 'udp', 'address': STUB_ADDRESS,
+                 'port': isp_port},
+            ])
+        finally:
+            server.close()
+            isp.close()
+
+    result = asyncio.run(scenario())
+    dot = result['resolvers'][0]
+    assert dot['trusted'] and dot['error'] is None
+    assert dot['addresses'] == [REAL]
+    assert result['status'] == 'Blocked'
+
+
+@pytest.mark.skipif(not dns.query.have_doh,
+                    reason="dnspython's DoH support is not installed")
+def test_doh_reference():
+    async def scenario():
+        server, port = await _doh_stub(REAL)
+        isp, isp_port = await _udp_stub(REAL)
+        try:
+            return await _check([
+                {'name': 'doh', 'kind': 'doh',
+                 'address': f'http://{STUB_ADDRESS}:{port}/dns-query'},
+                {'name': 'isp', 'kind': 'udp', 'address': STUB_ADDRESS,
+                 'port': isp_port},
+            ])
+        finally:
+            server.close()
+            isp.close()
+
+    result = asyncio.run(scenario())
+    assert result['resolvers'][0]['addresses'] == [REAL]
+    assert result['status'] == 'Accessible'
+
+
+def test_detect_censorship_closes_client_on_error(monkeypatch):
+    closed = []
+
+    async def check(self, domain, rdtype='A'):
+        raise RuntimeError('resolver blew up')
+
+    async def aclose(self):
+        closed.append(True)
+
+    monkeypatch.setattr(DifferentialDetector, 'check', check)
+    monkeypatch.setattr(DifferentialDetector, 'aclose', aclose)
+    with pytest.raises(RuntimeError):
+        censorship.detect_censorship('example.com', [
+            {'name': 'isp', 'kind': 'udp', 'address': STUB_ADDRESS}])
+    assert closed == [True]
@@ -0,0 +1,37 @@
+from checkpoint import ScanCheckpoint
+
+
+def test_resume_drops_torn_last_line(tmp_path):
+    path = str(tmp_path / 'scan.journal')
+    with ScanCheckpoint(path) as checkpoint:
+        checkpoint.record({'domain': 'a.com', 'status': 'Accessible',
+                           'details': 'ok'})
+    # A crash mid-write leaves half a record in both files
+    with open(path, 'ab') as f:
+        f.write(b'B\tb.co')
+    with open(path + '.idx', 'ab') as f:
+        f.write(b'b.co')
+
+    checkpoint = ScanCheckpoint(path)
+    assert checkpoint.done == {'a.com'}
+    with checkpoint:
+        checkpoint.record({'domain': 'c.com', 'status': 'Blocked',
+                           'details': 'reset'})
+
+    with open(path, 'rb') as f:
+        assert f.read() == b'A\ta.com\tok\nB\tc.com\treset\n'
+    with open(path + '.idx', 'rb') as f:
+        assert f.read() == b'a.com\nc.com\n'
+    assert [r['domain'] for r in ScanCheckpoint(path).results()] == [
+        'a.com', 'c.com']
+
+
+def test_resume_drops_torn_only_line(tmp_path):
+    path = str(tmp_path / 'scan.journal')
+    with open(path, 'wb') as f:
+        f.write(b'A\tlong' * 2000)
+    with ScanCheckpoint(path) as checkpoint:
+        checkpoint.record({'domain': 'a.com', 'status': 'Error',
+                           'details': 'timeout'})
+    with open(path, 'rb') as f:
+        assert f.read() == b'E\ta.com\ttimeout\n'
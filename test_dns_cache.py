@@ -0,0 +1,60 @@
+import time
+
+import dns.name
+import dns.rdataclass
+import dns.rdatatype
+
+from dns_cache import DNSCache, dns_cache
+from metrics import DNS_CACHE_EVICTIONS, DNS_CACHE_LOOKUPS, metrics
+
+
+class _Answer:
+    """Just enough of an answer for the cache: an rrset, rcode and wire"""
+
+    def __init__(self, ttl=60, rrset=True, size=100):
+        self.rrset = ['192.0.2.1'] if rrset else None
+        self.rcode = 0
+        self.wire = bytes(size)
+        self.expiration = time.time() + ttl
+
+
+def _key(name):
+    return (dns.name.from_text(name), dns.rdatatype.A, dns.rdataclass.IN)
+
+
+def test_lookups_counted_in_metrics():
+    hits = DNS_CACHE_LOOKUPS.labels('hit').value
+    misses = DNS_CACHE_LOOKUPS.labels('miss').value
+    cache = DNSCache()
+    cache.put(_key('fresh.example'), _Answer())
+    cache.put(_key('stale.example'), _Answer(ttl=-1))
+
+    assert cache.get(_key('fresh.example')) is not None
+    assert cache.get(_key('stale.example')) is None
+    assert cache.get(_key('absent.example')) is None
+    assert DNS_CACHE_LOOKUPS.labels('hit').value == hits + 1
+    assert DNS_CACHE_LOOKUPS.labels('miss').value == misses + 2
+    assert cache.stats()['hit_rate'] == 1 / 3
+
+
+def test_evictions_counted_in_metrics():
+    evictions = DNS_CACHE_EVICTIONS.labels().value
+    cache = DNSCache(max_bytes=1000)
+    for i in range(10):
+        cache.put(_key(f'host{i}.example'), _Answer())
+    assert cache.evictions > 0
+    assert DNS_CACHE_EVICTIONS.labels().value == evictions + cache.evictions
+
+
+def test_shared_cache_occupancy_rendered():
+    dns_cache.flush()
+    dns_cache.put(_key('negative.example'), _Answer(rrset=False))
+    try:
+        text = metrics.render()
+    finally:
+        dns_cache.flush()
+    assert 'dns_cache_entries{kind="negative"} 1\n' in text
+    assert 'dns_cache_entries{kind="positive"} 0\n' in text
+    assert 'dns_cache_lookups_total{result="hit"}' in text
+    # 256 bytes of overhead plus twice the 100-byte wire
+    assert 'dns_cache_bytes 456\n' in text
@@ -0,0 +1,123 @@
+import asyncio
+import socket
+
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+import pytest
+
+from dns_query import UDPQueryPool, _parse_addresses, _question
+from stub_servers import STUB_ADDRESS, DNSStub
+
+
+QNAME = dns.name.from_text('www.example.com')
+SOA = 'ns1.example.com. hostmaster.example.com. 1 7200 900 1209600 {}'
+
+
+def _response(rdtype, answer=(), authority=(), rcode=dns.rcode.NOERROR):
+    """Wire response to an `rdtype` query for QNAME, compressed by dnspython"""
+    query = dns.message.make_query(QNAME, rdtype)
+    response = dns.message.make_response(query)
+    response.set_rcode(rcode)
+    for name, ttl, kind, *rdatas in answer:
+        response.answer.append(dns.rrset.from_text(name, ttl, 'IN', kind,
+                                                   *rdatas))
+    for name, ttl, kind, *rdatas in authority:
+        response.authority.append(dns.rrset.from_text(name, ttl, 'IN', kind,
+                                                      *rdatas))
+    return response.to_wire()
+
+
+def _expected(wire):
+    """(rcode, addresses, ttl) the way dnspython's resolver sees them"""
+    response = dns.message.from_wire(wire)
+    chain = response.resolve_chaining()
+    addresses = [rdata.address for rdata in chain.answer or ()]
+    return response.rcode(), addresses, chain.minimum_ttl
+
+
+def _parse(wire, rdtype):
+    rdtype = dns.rdatatype.RdataType.make(rdtype)
+    return _parse_addresses(wire, len(_question(QNAME, rdtype)), rdtype)
+
+
+RESPONSES = {
+    'a': ('A', [('www.example.com.', 300, 'A', '192.0.2.1', '192.0.2.2')]),
+    'aaaa': ('AAAA', [('www.example.com.', 60, 'AAAA', '2001:db8::1')]),
+    'cname chain': ('A', [
+        ('www.example.com.', 600, 'CNAME', 'edge.example.net.'),
+        ('edge.example.net.', 120, 'CNAME', 'a1.cdn.example.org.'),
+        ('a1.cdn.example.org.', 30, 'A', '198.51.100.7')]),
+    'nodata': ('A', [], [('example.com.', 900, 'SOA', SOA.format(300))]),
+    'nxdomain': ('A', [], [('example.com.', 60, 'SOA', SOA.format(3600))],
+                 dns.rcode.NXDOMAIN),
+    'cname to nodata': ('AAAA', [
+        ('www.example.com.', 50, 'CNAME', 'v4only.example.com.')],
+        [('example.com.', 900, 'SOA', SOA.format(300))]),
+}
+
+
+@pytest.mark.parametrize('case', sorted(RESPONSES))
+def test_matches_dnspython(case):
+    rdtype, *sections = RESPONSES[case]
+    wire = _response(rdtype, *sections)
+    assert _parse(wire, rdtype) == _expected(wire)
+
+
+def test_nodata_without_soa_not_cached():
+    # dnspython would keep this for 2**32 - 1 seconds; a TTL of 0 means
+    # the shared cache does not keep it at all
+    assert _parse(_response('A'), 'A') == (dns.rcode.NOERROR, [], 0)
+
+
+def test_compression_pointers_used():
+    wire = _response(*RESPONSES['cname chain'])
+    # Owner names after the question are pointers, not repeated labels
+    assert wire.count(b'\x03www\x07example\x03com') == 1
+    assert _parse(wire, 'A')[1] == ['198.51.100.7']
+
+
+@pytest.mark.parametrize('case', sorted(RESPONSES))
+def test_truncated_packets(case):
+    rdtype, *sections = RESPONSES[case]
+    wire = _response(rdtype, *sections)
+    full = _parse(wire, rdtype)
+    for length in range(12, len(wire)):
+        parsed = _parse(wire[:length], rdtype)
+        # Either give up (and fall back to dnspython) or have everything
+        # needed already in hand
+        assert parsed is None or parsed == full, length
+
+
+def test_sockets_rotate():
+    async def run():
+        loop = asyncio.get_running_loop()
+        stub = DNSStub(latency=0.01)
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: stub, local_addr=(STUB_ADDRESS, 0))
+        pool = UDPQueryPool([STUB_ADDRESS],
+                            port=transport.get_extra_info('sockname')[1],
+                            sockets=2, cache=None, rotate_after=3)
+        ports = set()
+        try:
+            for batch in range(4):
+                answers = await asyncio.gather(*(
+                    pool.resolve(f'host{batch}-{i}.example')
+                    for i in range(5)))
+                assert all(list(answer) == [STUB_ADDRESS]
+                           for answer in answers)
+                for protocol in pool._protocols[socket.AF_INET]:
+                    sock = protocol.transport.get_extra_info('socket')
+                    ports.add(sock.getsockname()[1])
+            # Replaced sockets close once their last answer is in
+            assert all(protocol.transport.is_closing()
+                       for protocol in pool._retired)
+        finally:
+            pool.close()
+            transport.close()
+        return ports
+
+    assert len(asyncio.run(run())) > 2
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+import dns_utils
+from dns_utils import DNSAnalyzer
+from latency import LatencyProber
+
+
+class _FakeWhoisCache:
+    def get_dates(self, domain):
+        return 'created', 'expires'
+
+
+def test_stream_dns_info_cancels_slow_lookups(monkeypatch):
+    cancelled = []
+
+    async def stuck(name):
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    async def lookup_records(self, domain, record_type, timeout):
+        if record_type == 'A':
+            return ['192.0.2.1']
+        return await stuck(record_type)
+
+    async def resolve_address(self, domain, timeout):
+        return await stuck('ip_address')
+
+    async def measure(self, host):
+        return await stuck('latency')
+
+    monkeypatch.setattr(DNSAnalyzer, '_lookup_records', lookup_records)
+    monkeypatch.setattr(DNSAnalyzer, '_resolve_address', resolve_address)
+    monkeypatch.setattr(LatencyProber, 'measure', measure)
+    monkeypatch.setattr(dns_utils, 'get_whois_cache', _FakeWhoisCache)
+
+    start = time.monotonic()
+    results = dict(DNSAnalyzer().stream_dns_info('example.com', deadline=0.3))
+    assert time.monotonic() - start < 2
+    assert results == {'A': ['192.0.2.1'],
+                       'whois': ('created', 'expires')}
+
+    # The stuck lookups are cancelled on the loop rather than left running
+    expected = {'ip_address', 'latency', 'MX', 'NS', 'TXT', 'CNAME'}
+    for _ in range(50):
+        if set(cancelled) == expected:
+            break
+        time.sleep(0.02)
+    assert set(cancelled) == expected
@@ -0,0 +1,56 @@
+import csv
+
+from genome_parser import iter_entries, output_columns, process_genome_file
+from kmers import kmer_columns
+
+
+EXPORT = """\
+1, 1, Virus alpha, 12 linear
+ACGTAC
+GTNNAC
+1, 2, Virus beta, 453 linear
+acgtRacgt
+2, 1, Virus empty, 40 linear
+"""
+
+
+def _read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def test_empty_final_record(tmp_path):
+    source = tmp_path / 'genomes.txt'
+    source.write_text(EXPORT)
+    output = tmp_path / 'genomes.csv'
+
+    assert process_genome_file(source, output, processes=1) == 3
+    rows = _read_rows(output)
+    assert list(rows[0]) == output_columns()
+    empty = rows[-1]
+    assert empty['Genome Name'] == 'Virus empty'
+    assert empty['Counted Character Count'] == '0'
+    assert empty['Difference'] == '40'
+    assert float(empty['N Percentage']) == 0.0
+    assert all(empty[kmer] == '0' for kmer in kmer_columns())
+
+
+def test_matches_notebook(tmp_path, notebook):
+    source = tmp_path / 'genomes.txt'
+    source.write_text(EXPORT)
+    output = tmp_path / 'genomes.csv'
+    process_genome_file(source, output, processes=1)
+
+    expected = notebook['parse_text_file'](str(source))
+    assert [entry['Genome Name'] for entry in iter_entries(source)] == \
+        [entry['Genome Name'] for entry in expected]
+    for row, entry in zip(_read_rows(output), expected):
+        sequence = entry['Sequence'].upper()
+        counts, n_count, counted = notebook['process_sequence'](sequence)
+        n_percentage = (round(n_count / len(sequence) * 100, 2)
+                        if sequence else 0.0)
+        assert int(row['N Count']) == n_count
+        assert int(row['Counted Character Count']) == counted
+        assert float(row['N Percentage']) == n_percentage
+        assert [int(row[kmer]) for kmer in kmer_columns()] == \
+            [counts.get(kmer, 0) for kmer in kmer_columns()]
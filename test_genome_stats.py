@@ -0,0 +1,55 @@
+import sys
+
+import pytest
+
+import genome_stats
+from genome_parser import process_genome_file
+
+
+EXPORT = """\
+1, 1, Virus alpha, 12 linear
+ACGTACGTNNAC
+1, 2, Virus beta, 9 linear
+ACGTTACGT
+"""
+
+
+def _main(monkeypatch, capsys, *argv):
+    monkeypatch.setattr(sys, 'argv', ['genome_stats.py', *argv])
+    code = genome_stats.main()
+    return code, capsys.readouterr().err
+
+
+@pytest.fixture
+def table(tmp_path):
+    source = tmp_path / 'genomes.txt'
+    source.write_text(EXPORT)
+    path = tmp_path / 'genomes.csv'
+    process_genome_file(source, path, processes=1)
+    return path
+
+
+def test_summary(monkeypatch, capsys, table):
+    code, _ = _main(monkeypatch, capsys, str(table), '--complete-length', '1')
+    assert code == 0
+
+
+def test_missing_file(monkeypatch, capsys, tmp_path):
+    missing = tmp_path / 'nope.csv'
+    code, err = _main(monkeypatch, capsys, str(missing))
+    assert code == 1
+    assert err.strip() == f"Error: No such file: '{missing}'"
+
+
+def test_bad_cell(monkeypatch, capsys, table):
+    lines = table.read_text().splitlines()
+    header = lines[0].split(',')
+    row = lines[2].split(',')
+    row[header.index('ACG')] = 'x'
+    lines[2] = ','.join(row)
+    table.write_text('\n'.join(lines) + '\n')
+
+    code, err = _main(monkeypatch, capsys, str(table))
+    assert code == 1
+    assert len(err.strip().splitlines()) == 1
+    assert "line 3, column 'ACG': not a number: 'x'" in err
@@ -0,0 +1,50 @@
+import numpy as np
+
+from kmers import count_kmers, count_kmers_many, kmer_columns, triplet_rows
+
+
+SEQUENCES = ['ACGTACGTTTGCA', '', 'NNACGNTTAGCRYACG', 'ac', 'acgtNacgt', '']
+
+
+def _reference(notebook, sequence):
+    counts, n_count, counted = notebook['process_sequence'](sequence.upper())
+    return [counts.get(kmer, 0) for kmer in kmer_columns()], n_count, counted
+
+
+def test_columns_match_notebook(notebook):
+    assert kmer_columns(3) == notebook['generate_triplet_columns']()
+
+
+def test_count_kmers_many_matches_notebook(notebook):
+    counts, n_counts, counted, lengths = count_kmers_many(SEQUENCES)
+    for i, sequence in enumerate(SEQUENCES):
+        expected, n_count, counted_chars = _reference(notebook, sequence)
+        assert counts[i].tolist() == expected
+        assert n_counts[i] == n_count
+        assert counted[i] == counted_chars
+        assert lengths[i] == len(sequence)
+
+
+def test_empty_sequences_get_zero_counts():
+    for batch in ([''], ['ACGT', ''], ['', '', '']):
+        counts, n_counts, counted, _ = count_kmers_many(batch)
+        assert counts.shape == (len(batch), 64)
+        assert not counts[[i for i, s in enumerate(batch) if not s]].any()
+    assert count_kmers_many([])[0].shape == (0, 64)
+
+
+def test_count_kmers_matches_batch():
+    for sequence in SEQUENCES:
+        counts, n_count, counted = count_kmers(sequence)
+        batch = count_kmers_many([sequence])
+        assert np.array_equal(counts, batch[0][0])
+        assert (n_count, counted) == (batch[1][0], batch[2][0])
+
+
+def test_triplet_rows_empty_record():
+    rows = triplet_rows([{'Page Number': '1', 'Item Number': '2',
+                          'Genome Name': 'x', 'Expected Character Count': 10,
+                          'Sequence': ''}])
+    assert rows[0]['N Percentage'] == 0.0
+    assert rows[0]['Difference'] == 10
+    assert sum(rows[0][kmer] for kmer in kmer_columns()) == 0
@@ -0,0 +1,58 @@
+import asyncio
+import socket
+
+import pytest
+
+from latency import LatencyProber
+
+
+LOOPBACKS = ['127.0.0.1', '127.0.0.2', '127.0.0.3']
+# Echo requests to this host are dropped before they leave, so any reply
+# its probe accepts belongs to another probe
+SILENT = '127.0.0.4'
+
+
+def _prober(monkeypatch, kind):
+    """An ICMP prober restricted to raw or ping sockets"""
+    try:
+        socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP).close()
+    except OSError:
+        pytest.skip('this kind of ICMP socket is not available here')
+
+    def icmp_socket(self):
+        sock = socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+        sock.setblocking(False)
+        return sock
+
+    send = asyncio.SelectorEventLoop.sock_sendto
+
+    async def sock_sendto(self, sock, data, address):
+        if address[0] == SILENT:
+            return len(data)
+        return await send(self, sock, data, address)
+
+    monkeypatch.setattr(LatencyProber, '_icmp_socket', icmp_socket)
+    monkeypatch.setattr(asyncio.SelectorEventLoop, 'sock_sendto', sock_sendto)
+    return LatencyProber(method='icmp', samples=4, timeout=0.5)
+
+
+@pytest.mark.parametrize('kind', [socket.SOCK_RAW, socket.SOCK_DGRAM],
+                         ids=['raw', 'ping'])
+def test_icmp_replies_matched_to_their_probe(monkeypatch, kind):
+    prober = _prober(monkeypatch, kind)
+
+    async def measure():
+        # Let the silent probe's sockets open before any reply comes in
+        silent = asyncio.ensure_future(prober.measure(SILENT))
+        await asyncio.sleep(0.1)
+        answered = await asyncio.gather(
+            *(prober.measure(host) for host in LOOPBACKS))
+        return answered, await silent
+
+    answered, silent = asyncio.run(measure())
+    for stats in answered:
+        assert stats['method'] == 'icmp'
+        assert stats['received'] == stats['sent'] == 4
+    # Every probe uses sequences 1-4, so only the source address and the
+    # identifier keep the other hosts' replies from counting here
+    assert silent['received'] == 0
@@ -0,0 +1,41 @@
+from monitor import Monitor
+
+
+class _Engine:
+    concurrency = 1
+
+
+def _intervals(monitor, statuses):
+    intervals = []
+    for status in statuses:
+        monitor.update({'domain': 'a.com', 'status': status,
+                        'details': ''})
+        intervals.append(monitor.state['a.com'].interval)
+    return intervals
+
+
+def test_stable_failure_backs_off():
+    monitor = Monitor(['a.com'], lambda transition: None, engine=_Engine(),
+                      interval=300, min_interval=30)
+    intervals = _intervals(
+        monitor, ['Accessible'] + ['Blocked'] * 12 + ['Accessible'])
+
+    # The transition drops to min_interval and stays there while the
+    # failure is being confirmed
+    assert intervals[1:3] == [30, 30]
+    # Once settled it backs off to the base interval instead of
+    # re-checking every min_interval forever
+    assert intervals[3] > 30
+    assert intervals[3:12] == sorted(intervals[3:12])
+    assert intervals[12] == 300
+    # A recovery is a fresh transition again
+    assert intervals[13] == 30
+
+
+def test_initial_failure_is_confirmed_then_settles():
+    monitor = Monitor(['a.com'], lambda transition: None, engine=_Engine(),
+                      interval=300, min_interval=30)
+    intervals = _intervals(monitor, ['Error'] * 8)
+    assert intervals[:2] == [150, 75]
+    assert intervals[-1] == 300
+    assert abs(monitor._demand - 1 / 300) < 1e-12
@@ -0,0 +1,70 @@
+import os
+
+from result_store import ADDRESS_DTYPE, COLUMNS, ResultStore
+
+
+RESULTS = [
+    {'domain': 'a.example', 'status': 'Accessible', 'reason': 'ok',
+     'ips': ['192.0.2.1', '192.0.2.2', '2001:db8::1'],
+     'timings': {'dns_ms': 12.4, 'total_ms': 80}},
+    {'domain': 'b.example', 'status': 'Blocked', 'reason': 'nxdomain',
+     'ips': []},
+    {'domain': 'a.example', 'status': 'Blocked', 'reason': 'dns_tampering',
+     'ips': ['10.0.0.1', '::']},
+]
+
+
+def _fill(path, flush_rows=2):
+    with ResultStore(path, flush_rows) as store:
+        for timestamp, result in enumerate(RESULTS):
+            store.append(result, timestamp)
+
+
+def test_every_address_kept(tmp_path):
+    _fill(tmp_path)
+    with ResultStore(tmp_path) as store:
+        assert store.addresses == 5
+        history = store.history('a.example')
+        assert [record['ips'] for record in history] == \
+            [RESULTS[0]['ips'], RESULTS[2]['ips']]
+        assert history[0]['dns_ms'] == 12
+        assert history[0]['connect_ms'] is None
+        assert store.history('b.example')[0]['ips'] == []
+        assert store.transitions('a.example') == \
+            [(2, 'Accessible', 'Blocked')]
+
+
+def test_buffered_rows_included(tmp_path):
+    with ResultStore(tmp_path, flush_rows=100) as store:
+        for result in RESULTS:
+            store.append(result)
+        assert [record['ips'] for record in store.history('a.example')] == \
+            [RESULTS[0]['ips'], RESULTS[2]['ips']]
+
+
+def test_torn_write_repaired(tmp_path):
+    _fill(tmp_path)
+    # A crash after the last row's addresses went out, but only part of
+    # its row did, and before another batch's addresses were complete
+    os.truncate(tmp_path / 'status.col', 2 * COLUMNS['status'].itemsize)
+    with open(tmp_path / 'ips.col', 'ab') as f:
+        f.write(b'\x01' * (ADDRESS_DTYPE.itemsize + 3))
+
+    with ResultStore(tmp_path) as store:
+        assert (store.rows, store.addresses) == (2, 3)
+        assert os.path.getsize(tmp_path / 'ips.col') == \
+            3 * ADDRESS_DTYPE.itemsize
+        store.append(RESULTS[2], 9)
+    with ResultStore(tmp_path) as store:
+        assert [record['ips'] for record in store.history('a.example')] == \
+            [RESULTS[0]['ips'], RESULTS[2]['ips']]
+
+
+def test_rows_without_addresses_dropped(tmp_path):
+    _fill(tmp_path)
+    # The addresses file lost the last row's addresses
+    os.truncate(tmp_path / 'ips.col', 4 * ADDRESS_DTYPE.itemsize)
+    with ResultStore(tmp_path) as store:
+        assert (store.rows, store.addresses) == (2, 3)
+        assert all(os.path.getsize(tmp_path / f'{name}.col')
+                   == 2 * dtype.itemsize for name, dtype in COLUMNS.items())
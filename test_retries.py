@@ -0,0 +1,78 @@
+import asyncio
+
+import dns.exception
+
+from adaptive import target_network
+from dns_query import UDPQueryPool
+from http_probe import HTTPProber
+from stub_servers import STUB_ADDRESS, start_stubs
+
+
+# Learned round trips are far below the stubs' latency, so every retry
+# fires before the first answer arrives, which still comes in time
+FAST_RTT = 0.001
+LATENCY = 0.8
+
+
+async def _stubs(**options):
+    dns_stub, _, server = await start_stubs(STUB_ADDRESS, 0, 0, **options)
+    dns_port = dns_stub.transport.get_extra_info('sockname')[1]
+    http_port = server.sockets[0].getsockname()[1]
+    return dns_stub, server, dns_port, http_port
+
+
+def test_dns_answer_after_last_retry_counts():
+    async def run():
+        dns_stub, server, dns_port, _ = await _stubs(dns_latency=LATENCY)
+        pool = UDPQueryPool([STUB_ADDRESS], port=dns_port, timeout=1,
+                            retries=2, cache=None)
+        for _ in range(5):
+            pool.timeouts.observe(STUB_ADDRESS, FAST_RTT)
+        try:
+            answer = await pool.resolve('slow.example')
+        finally:
+            pool.close()
+            server.close()
+            dns_stub.transport.close()
+        return answer, dns_stub.queries
+
+    answer, queries = asyncio.run(run())
+    assert list(answer) == [STUB_ADDRESS]
+    assert queries == 3
+
+
+def test_dns_times_out_at_deadline():
+    async def run():
+        dns_stub, server, dns_port, _ = await _stubs(dns_latency=LATENCY)
+        pool = UDPQueryPool([STUB_ADDRESS], port=dns_port, timeout=0.2,
+                            retries=2, cache=None)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            await pool.resolve('slow.example')
+        except dns.exception.Timeout:
+            return loop.time() - start
+        finally:
+            pool.close()
+            server.close()
+            dns_stub.transport.close()
+
+    assert 0.19 <= asyncio.run(run()) < LATENCY
+
+
+def test_http_answer_after_last_retry_counts():
+    async def run():
+        dns_stub, server, _, http_port = await _stubs(http_latency=LATENCY)
+        prober = HTTPProber(timeout=1, retries=2)
+        key = target_network(STUB_ADDRESS)
+        for _ in range(5):
+            prober.timeouts.observe(key, FAST_RTT)
+        try:
+            return await prober.probe(
+                f'http://slow.example:{http_port}/', STUB_ADDRESS)
+        finally:
+            prober.close()
+            server.close()
+            dns_stub.transport.close()
+
+    assert asyncio.run(run())['status_code'] == 200
@@ -0,0 +1,74 @@
+import asyncio
+
+from scanner import bounded_map
+
+
+def _tracked(started, cancelled, fast=()):
+    async def call(item):
+        started.append(item)
+        try:
+            await asyncio.sleep(0 if item in fast else 10)
+        except asyncio.CancelledError:
+            cancelled.append(item)
+            raise
+        return item
+    return call
+
+
+def test_yields_every_result():
+    async def collect():
+        return [item async for item in bounded_map(
+            lambda item: asyncio.sleep(0, item), range(20), 3)]
+
+    assert sorted(asyncio.run(collect())) == list(range(20))
+
+
+def test_concurrency_bound():
+    running = []
+    peak = []
+
+    async def call(item):
+        running.append(item)
+        peak.append(len(running))
+        await asyncio.sleep(0.001)
+        running.remove(item)
+        return item
+
+    async def collect():
+        return [item async for item in bounded_map(call, range(50), 4)]
+
+    assert len(asyncio.run(collect())) == 50
+    assert max(peak) == 4
+
+
+def test_break_cancels_pending():
+    started, cancelled = [], []
+
+    async def run():
+        async for _ in bounded_map(_tracked(started, cancelled, fast={0}),
+                                   range(100), 5):
+            break
+        # The abandoned generator is closed by the loop's finalizer hook
+        await asyncio.sleep(0.01)
+        return list(cancelled)
+
+    # Checked before asyncio.run() cancels whatever is left at shutdown
+    cancelled_in_time = asyncio.run(run())
+    assert len(started) <= 6
+    assert sorted(cancelled_in_time) == sorted(set(started) - {0})
+
+
+def test_aclose_cancels_pending():
+    started, cancelled = [], []
+
+    async def run():
+        results = bounded_map(_tracked(started, cancelled, fast={0}),
+                              range(10), 3)
+        assert await results.__anext__() == 0
+        await results.aclose()
+        await asyncio.sleep(0.01)
+        return list(cancelled)
+
+    cancelled_in_time = asyncio.run(run())
+    assert cancelled_in_time
+    assert sorted(cancelled_in_time) == sorted(set(started) - {0})
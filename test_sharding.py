@@ -0,0 +1,72 @@
+import itertools
+
+import pytest
+
+from sharding import MAX_PARKED_CHUNKS, ShardedScan, shard_of
+
+
+PROCESSES = 2
+CHUNK_SIZE = 3
+LIMIT = PROCESSES * CHUNK_SIZE * MAX_PARKED_CHUNKS
+
+
+def _domains(shard, count):
+    """`count` distinct domains that all hash to `shard`"""
+    names = (f"site{i}.example" for i in itertools.count())
+    return list(itertools.islice(
+        (name for name in names if shard_of(name, PROCESSES) == shard),
+        count))
+
+
+def _scan():
+    return ShardedScan(PROCESSES, 'hash', chunk_size=CHUNK_SIZE)
+
+
+def test_read_ahead_is_bounded():
+    scan = _scan()
+    items = enumerate(_domains(0, 1000))
+    buffers = [[] for _ in range(PROCESSES)]
+
+    # Worker 1's share never shows up: it is held rather than reading on
+    assert scan._next_chunk(1, items, buffers) is None
+    assert sum(map(len, buffers)) == LIMIT
+    assert next(items) == (LIMIT, _domains(0, LIMIT + 1)[-1])
+
+    chunk = scan._next_chunk(0, items, buffers)
+    assert [seq for seq, _ in chunk] == list(range(CHUNK_SIZE))
+
+
+def test_every_domain_handed_out_once():
+    # Mostly shard 0, with a few shard 1 domains far apart
+    domains = _domains(0, 200)
+    sparse = _domains(1, 10)
+    domains[100:100] = sparse[:5]
+    domains += sparse[5:]
+    scan = _scan()
+    items = enumerate(domains)
+    buffers = [[] for _ in range(PROCESSES)]
+    handed = {worker: [] for worker in range(PROCESSES)}
+    finished = set()
+
+    for _ in range(len(domains)):
+        for worker in set(handed) - finished:
+            chunk = scan._next_chunk(worker, items, buffers)
+            assert sum(map(len, buffers)) <= LIMIT
+            if chunk is None:
+                continue
+            if not chunk:
+                finished.add(worker)
+                continue
+            assert len(chunk) <= CHUNK_SIZE
+            assert {shard_of(domain, PROCESSES)
+                    for _, domain in chunk} == {worker}
+            handed[worker].extend(chunk)
+        if len(finished) == PROCESSES:
+            break
+    else:
+        pytest.fail("workers never finished")
+
+    for worker, chunk in handed.items():
+        # Each worker sees its share in input order
+        assert chunk == sorted(chunk)
+    assert sorted(handed[0] + handed[1]) == list(enumerate(domains))
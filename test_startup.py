@@ -0,0 +1,9 @@
+import pytest
+
+from benchmark import STARTUP_BUDGETS_MS, measure_startup
+
+
+@pytest.mark.parametrize('module, budget', sorted(STARTUP_BUDGETS_MS.items()))
+def test_import_time_within_budget(module, budget):
+    """Entry modules stay cheap to import (see benchmark.py --startup)"""
+    assert measure_startup(module) <= budget
@@ -0,0 +1,56 @@
+import threading
+from datetime import datetime
+
+from whois_cache import WhoisCache
+
+
+def _cache(tmp_path, fetch, **options):
+    return WhoisCache(str(tmp_path / 'whois.sqlite3'), fetch=fetch, **options)
+
+
+def test_memory_is_bounded(tmp_path):
+    fetched = []
+
+    def fetch(zone):
+        fetched.append(zone)
+        return datetime(2001, 1, 1), None
+
+    cache = _cache(tmp_path, fetch, memory_entries=3)
+    for i in range(10):
+        cache.get_dates(f'www.site{i}.com')
+    assert list(cache._memory) == ['site7.com', 'site8.com', 'site9.com']
+
+    # Evicted zones come back from SQLite, not WHOIS, and are kept again
+    assert cache.get_dates('site0.com') == (datetime(2001, 1, 1), None)
+    assert len(fetched) == 10
+    assert list(cache._memory) == ['site8.com', 'site9.com', 'site0.com']
+
+
+def test_recently_used_zone_kept(tmp_path):
+    cache = _cache(tmp_path, lambda zone: (None, None), memory_entries=2)
+    cache.get_dates('a.com')
+    cache.get_dates('b.com')
+    cache.get_dates('mail.a.com')
+    cache.get_dates('c.com')
+    assert list(cache._memory) == ['a.com', 'c.com']
+
+
+def test_concurrent_misses_share_one_fetch(tmp_path):
+    release = threading.Event()
+    fetched = []
+
+    def fetch(zone):
+        fetched.append(zone)
+        release.wait(5)
+        return None, None
+
+    cache = _cache(tmp_path, fetch)
+    threads = [threading.Thread(target=cache.get_dates,
+                                args=(f'host{i}.example.com',))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert fetched == ['example.com']
@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from domains import normalize_domain, registrable_domain
+
+DEFAULT_PATH = os.path.join(
+    os.path.expanduser('~'), '.cache', 'website-analysis', 'whois.sqlite3')
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+DEFAULT_ERROR_MAX_AGE = 3600
+# Zones kept in memory in front of SQLite; older ones are read back
+DEFAULT_MEMORY_ENTRIES = 100000
+
+
+def fetch_whois_dates(domain):
+    """Query WHOIS and return (creation_date, expiration_date)"""
+    # Imported on the first cache miss, not every time the module loads
+    import whois
+    w = whois.whois(domain)
+    creation_date = w.creation_date[0] if isinstance(
+        w.creation_date, list) else w.creation_date
+    expiration_date = w.expiration_date[0] if isinstance(
+        w.expiration_date, list) else w.expiration_date
+    return creation_date, expiration_date
+
+
+def _encode(value):
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _decode(value):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+
+class WhoisCache:
+    """
+    Persistent WHOIS cache keyed by registrable domain, so every name
+    under one zone shares a single lookup.
+
+    Entries live in a SQLite database in WAL mode, so many readers can
+    share it with one writer, and in an in-memory LRU of the last
+    `memory_entries` zones in front of it, so a repeat lookup costs
+    microseconds.  Entries older than `max_age` are
+    still returned, but trigger a refresh in the background.  Failed
+    lookups are remembered for `error_max_age` so rate-limited servers are
+    not hammered; a failed refresh keeps the last known dates.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_age=DEFAULT_MAX_AGE,
+                 error_max_age=DEFAULT_ERROR_MAX_AGE, fetch=fetch_whois_dates,
+                 memory_entries=DEFAULT_MEMORY_ENTRIES):
+        self.path = path
+        self.max_age = max_age
+        self.error_max_age = error_max_age
+        self.fetch = fetch
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._local = threading.local()
+        self._refreshing = set()
+        self._fetching = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="whois-refresh")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS whois ("
+                " domain TEXT PRIMARY KEY,"
+                " creation_date TEXT,"
+                " expiration_date TEXT,"
+                " fetched REAL NOT NULL,"
+                " failed INTEGER NOT NULL DEFAULT 0)")
+
+    def _connection(self):
+        """One connection per thread; SQLite connections are not shareable"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        row = self._connection().execute(
+            "SELECT creation_date, expiration_date, fetched, failed"
+            " FROM whois WHERE domain = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        entry = (_decode(row[0]), _decode(row[1]), row[2], bool(row[3]))
+        self._remember(key, entry)
+        return entry
+
+    def _store(self, key, creation_date, expiration_date, failed):
+        fetched = time.time()
+        with self._connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO whois VALUES (?, ?, ?, ?, ?)",
+                (key, _encode(creation_date), _encode(expiration_date),
+                 fetched, int(failed)))
+        entry = (creation_date, expiration_date, fetched, failed)
+        self._remember(key, entry)
+        return entry
+
+    def _refresh(self, key):
+        try:
+            creation_date, expiration_date = self.fetch(key)
+            failed = False
+        except Exception:
+            creation_date = expiration_date = None
+            failed = True
+        previous = self._load(key)
+        if failed and previous is not None:
+            # Keep serving the last good dates rather than an error, but
+            # stay marked failed so the next retry is error_max_age away
+            creation_date, expiration_date = previous[0], previous[1]
+        return self._store(key, creation_date, expiration_date, failed)
+
+    def _fetch_once(self, key):
+        """
+        _refresh() for a cache miss, shared by concurrent lookups of names
+        in the same zone so each zone is queried once
+        """
+        with self._lock:
+            done = self._fetching.get(key)
+            owner = done is None
+            if owner:
+                done = self._fetching[key] = threading.Event()
+        if not owner:
+            done.wait()
+            entry = self._load(key)
+            if entry is not None:
+                return entry
+            return self._refresh(key)
+        try:
+            return self._refresh(key)
+        finally:
+            with self._lock:
+                self._fetching.pop(key, None)
+            done.set()
+
+    def _refresh_in_background(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._refresh(key)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(run)
+
+    def _key(self, domain):
+        domain = normalize_domain(domain) or domain.lower()
+        return registrable_domain(domain) or domain
+
+    def get_dates(self, domain):
+        """Return (creation_date, expiration_date) for the domain"""
+        key = self._key(domain)
+        entry = self._load(key)
+        if entry is None:
+            entry = self._fetch_once(key)
+        else:
+            max_age = self.error_max_age if entry[3] else self.max_age
+            if time.time() - entry[2] > max_age:
+                self._refresh_in_background(key)
+        return entry[0], entry[1]
+
+    def invalidate(self, domain):
+        """Drop the cached entry so the next lookup queries WHOIS again"""
+        key = self._key(domain)
+        with self._lock:
+            self._memory.pop(key, None)
+        with self._connection() as db:
+            db.execute("DELETE FROM whois WHERE domain = ?", (key,))
+
+
+_whois_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_whois_cache():
+    """Return the process-wide cache at DEFAULT_PATH"""
+    global _whois_cache
+    with _cache_lock:
+        if _whois_cache is None:
+            _whois_cache = WhoisCache()
+    return _whois_cache